@@ -0,0 +1,151 @@
+"""
+Benchmark de generación de PDFs sobre el corpus de benchmarks/corpus.py.
+
+Cada caso corre en un proceso aparte y registra el tiempo de la función
+pública (generar_pdf escribe el archivo temporal; generar_pdf_estado_cuenta
+devuelve los bytes), páginas, tamaño y el RSS máximo que agrega el dibujo
+sobre el de las importaciones (streamlit, supabase, fpdf).
+
+El tiempo se compara como múltiplo del caso de referencia (CASO_REFERENCIA),
+generado en el mismo proceso alternado con cada caso: el ruido de la máquina
+se cancela y baseline.json sirve en otras máquinas. Los segundos absolutos se
+guardan solo como dato. rss_kb sí es absoluto y depende de la plataforma: en
+otro sistema operativo o versión de Python conviene regenerar la línea base
+localmente. El script termina con código 1 si alguna métrica empeora más que
+el umbral.
+
+    python benchmarks/bench_pdf.py                      # comparar con la línea base
+    python benchmarks/bench_pdf.py --guardar-baseline   # registrar la línea base
+    python benchmarks/bench_pdf.py --umbral 0.1 --repeticiones 30
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.corpus import CASOS, ESTADOS_CUENTA  # noqa: E402
+
+BASELINE = os.path.join(RAIZ, "benchmarks", "baseline.json")
+CASO_REFERENCIA = "presupuesto_20cat_500items"
+METRICAS = ("relativo", "paginas", "bytes", "rss_kb")
+# Diferencias absolutas que no cuentan como regresión (ruido de medición)
+TOLERANCIA_ABSOLUTA = {"relativo": 0.02, "rss_kb": 1024}
+
+
+def _rss_maximo_kb() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS informa bytes
+
+
+def _generar(pdf, nombre: str, datos: dict) -> float:
+    """Genera el caso una vez con la función pública y devuelve los segundos."""
+    inicio = time.perf_counter()
+    if nombre in ESTADOS_CUENTA:
+        pdf.generar_pdf_estado_cuenta(**datos)
+        return time.perf_counter() - inicio
+    ruta = pdf.generar_pdf(**datos, fecha="2024-12-31")
+    segundos = time.perf_counter() - inicio
+    os.unlink(ruta)
+    return segundos
+
+
+def medir_caso(nombre: str, repeticiones: int) -> dict:
+    """
+    Genera el caso 'repeticiones' veces, alternando con el caso de referencia,
+    y devuelve el mejor tiempo, el múltiplo sobre la referencia y el informe.
+    """
+    from utils import pdf
+
+    datos = CASOS[nombre]()
+    referencia = CASOS[CASO_REFERENCIA]()
+    rss_inicial = _rss_maximo_kb()  # después de importar y de armar los datos
+    tiempos = [_generar(pdf, nombre, datos)]
+    informe = pdf.INFORMES_PDF[-1]
+    # Antes de generar la referencia, que suele usar más memoria que el caso
+    rss_kb = _rss_maximo_kb() - rss_inicial
+
+    tiempos_referencia = []
+    for _ in range(repeticiones - 1):
+        tiempos.append(_generar(pdf, nombre, datos))
+        if nombre != CASO_REFERENCIA:
+            tiempos_referencia.append(_generar(pdf, CASO_REFERENCIA, referencia))
+
+    return {
+        "segundos": round(min(tiempos), 4),
+        "relativo": round(min(tiempos) / min(tiempos_referencia), 3) if tiempos_referencia else 1.0,
+        "paginas": informe["paginas"],
+        "bytes": informe["bytes"],
+        "rss_kb": rss_kb,
+    }
+
+
+def medir_en_proceso(nombre: str, repeticiones: int) -> dict:
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--caso", nombre, "--repeticiones", str(repeticiones)],
+        capture_output=True, text=True, check=True, cwd=RAIZ,
+    )
+    # La última línea es el JSON; antes puede haber avisos de las librerías
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def comparar(resultados: dict, baseline: dict, umbral: float) -> list:
+    """Lista de (caso, métrica, base, actual) que empeoraron más que el umbral."""
+    regresiones = []
+    for caso, actual in resultados.items():
+        base = baseline.get(caso)
+        if not base:
+            continue
+        for metrica in METRICAS:
+            limite = max(base[metrica] * (1 + umbral), base[metrica] + TOLERANCIA_ABSOLUTA.get(metrica, 0)) \
+                if metrica in base else None
+            if limite is not None and actual[metrica] > limite:
+                regresiones.append((caso, metrica, base[metrica], actual[metrica]))
+    return regresiones
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de generación de PDFs")
+    parser.add_argument("--caso", help=argparse.SUPPRESS)
+    parser.add_argument("--repeticiones", type=int, default=15)
+    parser.add_argument("--umbral", type=float, default=0.2, help="empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.caso:
+        print(json.dumps(medir_caso(args.caso, args.repeticiones)))
+        return 0
+
+    resultados = {}
+    for nombre in CASOS:
+        resultados[nombre] = medir_en_proceso(nombre, args.repeticiones)
+        r = resultados[nombre]
+        print(f"{nombre:<30} {r['segundos']:>8.3f}s x{r['relativo']:<7} {r['paginas']:>4} pág "
+              f"{r['bytes']:>9} B {r['rss_kb']:>8} KB")
+
+    if args.guardar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, sort_keys=True)
+        print(f"Línea base guardada en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No hay línea base; ejecute con --guardar-baseline para crearla.")
+        return 1
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regresiones = comparar(resultados, baseline, args.umbral)
+    for caso, metrica, base, actual in regresiones:
+        print(f"REGRESIÓN {caso}: {metrica} {base} -> {actual}")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
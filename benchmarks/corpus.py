@@ -0,0 +1,106 @@
+from typing import Any, Callable, Dict, List
+
+# ==================== CORPUS DE PDFs ====================
+# Documentos representativos para medir generar_pdf y
+# generar_pdf_estado_cuenta. Los datos son fijos (sin azar) para que
+# cada ejecución dibuje exactamente lo mismo.
+
+UNIDADES = ["Unidad", "m2", "m3", "Saco", "Kg", "Metro", "Litro", "Global"]
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto",
+         "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+
+def _item(nombre: str, indice: int) -> Dict[str, Any]:
+    cantidad = 1 + indice % 7
+    precio = 1500 + (indice * 733) % 48000
+    return {
+        'nombre': nombre,
+        'unidad': UNIDADES[indice % len(UNIDADES)],
+        'cantidad': cantidad,
+        'precio_unitario': precio,
+        'total': cantidad * precio,
+    }
+
+
+def presupuesto_pequeno() -> Dict[str, Any]:
+    """1 categoría con 3 ítems."""
+    return {
+        'cliente_nombre': "cliente de prueba",
+        'lugar_cliente': "parcela los aromos",
+        'descripcion': "mantención de jardín",
+        'categorias': {
+            "Jardinería": {
+                'items': [_item(n, i) for i, n in enumerate(["Tierra de hoja", "Pasto en rollo", "Riego por goteo"])],
+                'mano_obra': 45000,
+            }
+        },
+    }
+
+
+def presupuesto_grande() -> Dict[str, Any]:
+    """20 categorías con 25 ítems cada una (500 ítems) y mano de obra."""
+    return {
+        'cliente_nombre': "constructora los andes",
+        'lugar_cliente': "condominio altos del valle etapa 3",
+        'descripcion': "paisajismo áreas comunes",
+        'categorias': {
+            f"Sector {c + 1}": {
+                'items': [_item(f"Insumo {c + 1}-{i + 1}", c * 25 + i) for i in range(25)],
+                'mano_obra': 120000 + c * 5000,
+            }
+            for c in range(20)
+        },
+    }
+
+
+def presupuesto_nombres_largos() -> Dict[str, Any]:
+    """Ítems con nombres de varias líneas en la columna 'Insumo'."""
+    base = ("Suministro e instalación de malla antimaleza de polipropileno tejido de alta densidad "
+            "con estacas de fijación galvanizadas cada un metro y traslape mínimo de diez centímetros")
+    return {
+        'cliente_nombre': "municipalidad",
+        'lugar_cliente': "plaza central y bandejones de avenida principal",
+        'descripcion': "recuperación de áreas verdes",
+        'categorias': {
+            f"Etapa {c + 1}": {
+                'items': [_item(f"{base} (tramo {i + 1})", c * 40 + i) for i in range(40)],
+                'mano_obra': 250000,
+            }
+            for c in range(3)
+        },
+    }
+
+
+def estado_cuenta_36_meses() -> Dict[str, Any]:
+    """Estado de cuenta con 36 meses de mantención y servicios extra."""
+    items: List[Dict[str, Any]] = []
+    for n in range(36):
+        items.append({
+            'descripcion': f"Mantención Mensual Base - {MESES[n % 12]} {2022 + n // 12}",
+            'monto': 85000,
+        })
+        if n % 6 == 0:
+            items.append({'descripcion': f"Poda de árboles y retiro de ramas ({n // 6 + 1})", 'monto': 60000})
+    total = sum(item['monto'] for item in items)
+    return {
+        'id_documento': 1,
+        'cliente_nombre': "comunidad edificio norte",
+        'lugar_nombre': "edificio norte",
+        'items': items,
+        'abono': 500000,
+        'total': total - 500000,
+        'datos_emisor': None,
+        'fecha': "2024-12-31",
+    }
+
+
+# Nombre del caso -> argumentos del documento
+PRESUPUESTOS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    'presupuesto_1cat_3items': presupuesto_pequeno,
+    'presupuesto_20cat_500items': presupuesto_grande,
+    'presupuesto_nombres_largos': presupuesto_nombres_largos,
+}
+ESTADOS_CUENTA: Dict[str, Callable[[], Dict[str, Any]]] = {
+    'estado_cuenta_36_meses': estado_cuenta_36_meses,
+}
+CASOS = {**PRESUPUESTOS, **ESTADOS_CUENTA}
@@ -1,9 +1,12 @@
 from typing import Any, Dict
 import streamlit as st
-import os
 import time
 import uuid
-from utils.pdf import generar_pdf
+from utils.pdf import (
+    encolar_pdf_presupuesto,
+    get_cola_render,
+    PENDIENTE, LISTO, ERROR, DESCONOCIDO
+)
 from utils.auth import check_login, sign_out
 from utils.components import (
     show_cliente_lugar_selector,
@@ -11,9 +14,11 @@ from utils.components import (
     show_trabajos_simples,
     show_edited_presupuesto,
     show_resumen,
-    safe_numeric_value
+    show_plantillas
 )
 from utils.db import save_presupuesto_completo
+from utils.catalogo import actualizar_catalogo_precios
+from utils.items import normalizar_categorias, total_categorias
 from utils.autosave import AutoSaveManager, capture_current_state, restore_draft_state
 
 st.set_page_config(page_title="GRINO", page_icon="🌱", layout="wide")
@@ -35,19 +40,10 @@ h2, h3, h4 {
 """, unsafe_allow_html=True)
 
 def calcular_total(items_data: Dict[str, Any]) -> float:
-    """Calcula el total general del presupuesto, usando la utilidad de valores seguros."""
-    total = 0
+    """Calcula el total general del presupuesto (ítems + mano de obra)."""
     if not items_data or not isinstance(items_data, dict):
         return 0
-        
-    for categoria, data in items_data.items():
-        if not isinstance(data, dict):
-            continue
-        items = data.get('items', [])
-        if isinstance(items, list):
-            total += sum(safe_numeric_value(item.get('total', 0)) for item in items)
-        total += safe_numeric_value(data.get('mano_obra', 0))
-    return total
+    return total_categorias(items_data)
 
 
 
@@ -123,13 +119,7 @@ with st.sidebar:
 # Si se restauró un borrador, asegurar estructura de datos
 if st.session_state.get('draft_restored', False):
     if 'items_data' in st.session_state:
-        items_data = st.session_state['items_data']
-        for cat_name, cat_data in items_data.items():
-            if isinstance(cat_data, dict):
-                if 'items' not in cat_data:
-                    cat_data['items'] = []
-                if 'mano_obra' not in cat_data:
-                    cat_data['mano_obra'] = 0
+        normalizar_categorias(st.session_state['items_data'])
     # Limpiar flag después de procesar
     # st.session_state['draft_restored'] = False  # Comentado para mantener el flag
 
@@ -181,6 +171,8 @@ with col2:
     else:
         st.caption("💾 No hay borradores guardados")
 
+show_plantillas(user_id)
+
 # ========== SECCIÓN CLIENTE, LUGAR y TRABAJO ==========
 # Siempre mostrar el selector completo (como funcionaba antes)
 cliente_id, cliente_nombre, lugar_trabajo_id, lugar_nombre, descripcion = show_cliente_lugar_selector(user_id)
@@ -269,50 +261,77 @@ if items_data and any(len(data.get('items', [])) > 0 for data in items_data.valu
 
                 if presupuesto_id:
                     st.toast(f"✅ Presupuesto #{presupuesto_id} guardado!", icon="✅")
+                    actualizar_catalogo_precios(user_id, presupuesto_id)
                     
-                    pdf_path = generar_pdf(
-                        cliente_nombre=cliente_nombre,    
-                        lugar_cliente=lugar_nombre,       
-                        categorias=items_data,
-                        descripcion=descripcion
-                    )
-
-                    if not pdf_path or not os.path.exists(pdf_path):
-                        st.error("❌ Error generando PDF: archivo no creado.")
-                        st.stop()
-
-                    with open(pdf_path, "rb") as f:
-                        pdf_bytes = f.read()
-                    
-                    try:
-                        os.unlink(pdf_path)
-                    except Exception:
-                        pass
+                    # El PDF se dibuja en segundo plano; el panel de abajo consulta su estado
+                    trabajo_anterior = st.session_state.get('pdf_trabajo')
+                    if trabajo_anterior:
+                        get_cola_render().descartar(trabajo_anterior['id'])
+                    st.session_state['pdf_trabajo'] = {
+                        'id': encolar_pdf_presupuesto(
+                            cliente_nombre=cliente_nombre,
+                            categorias=items_data,
+                            lugar_cliente=lugar_nombre,
+                            descripcion=descripcion,
+                            file_name=f"presupuesto_{presupuesto_id}.pdf"
+                        ),
+                        'presupuesto_id': presupuesto_id
+                    }
 
                     autosave_manager.clear_draft()
 
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.download_button(
-                            "📄 Descargar PDF",
-                            pdf_bytes,
-                            file_name=f"presupuesto_{presupuesto_id}.pdf",
-                            mime="application/pdf",
-                            use_container_width=True
-                        )
-                    with col2:
-                        if st.button("🔄 Crear otro presupuesto", use_container_width=True):
-                            for key in ['categorias', 'descripcion', 'items_data']:
-                                if key in st.session_state:
-                                    del st.session_state[key]
-                            autosave_manager.clear_draft()
-                            st.rerun()
-                    with col3:
-                        st.page_link("pages/2_🕒_historial.py", label="📋 Ver Historial", use_container_width=True)
-
                 else:
                     st.error("❌ Error al crear el presupuesto en la base de datos")
 
             except Exception as e:
                 st.error(f"❌ Error al guardar: {str(e)}")
-                st.exception(e)
\ No newline at end of file
+                st.exception(e)
+
+# ========== PDF DEL PRESUPUESTO GUARDADO ==========
+@st.fragment(run_every=1.0)
+def esperar_pdf(trabajo_id: str):
+    """Consulta la cola cada segundo; al terminar recarga la página con el resultado."""
+    estado, _ = get_cola_render().estado(trabajo_id)
+    if estado != PENDIENTE:
+        st.rerun(scope="app")
+    st.info("⏳ Generando PDF...")
+
+
+def panel_pdf(trabajo: Dict[str, Any]):
+    estado, resultado = get_cola_render().estado(trabajo['id'])
+
+    if estado == PENDIENTE:
+        esperar_pdf(trabajo['id'])
+        return
+    if estado == ERROR:
+        st.error(f"❌ Error generando PDF: {resultado}")
+    elif estado == DESCONOCIDO:
+        st.warning("El PDF ya no está disponible; descárgalo desde el Historial.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if estado == LISTO:
+            st.download_button(
+                "📄 Descargar PDF",
+                resultado,
+                file_name=f"presupuesto_{trabajo['presupuesto_id']}.pdf",
+                mime="application/pdf",
+                use_container_width=True,
+                # El resultado se conserva para reintentar la descarga; se
+                # libera al generar otro PDF o al crear otro presupuesto
+                on_click="ignore"
+            )
+    with col2:
+        if st.button("🔄 Crear otro presupuesto", use_container_width=True):
+            get_cola_render().descartar(trabajo['id'])
+            for key in ['categorias', 'descripcion', 'items_data', 'pdf_trabajo']:
+                if key in st.session_state:
+                    del st.session_state[key]
+            autosave_manager.clear_draft()
+            st.rerun()
+    with col3:
+        st.page_link("pages/2_🕒_historial.py", label="📋 Ver Historial", use_container_width=True)
+
+
+if st.session_state.get('pdf_trabajo'):
+    panel_pdf(st.session_state['pdf_trabajo'])
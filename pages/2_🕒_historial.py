@@ -1,21 +1,19 @@
 import time
+import pandas as pd
 import streamlit as st
 from utils.auth import check_login, sign_out
 from datetime import datetime, timedelta
 from utils.db import (
-    get_supabase_client, get_clientes, get_lugares_trabajo, 
-    get_presupuestos_usuario, delete_presupuesto,
+    get_supabase_client, get_directorio_clientes, get_directorio_lugares, 
+    get_presupuestos_usuario, delete_presupuesto, clonar_presupuesto,
     _show_presupuesto_detail,
+    _show_versiones_presupuesto,
     get_estados_cuenta_usuario,  
     delete_estado_cuenta
 )
 from utils.components import safe_numeric_value
-from utils.pdf import mostrar_boton_descarga_pdf
-
-try:
-    from utils.pdf import mostrar_boton_descarga_estado_cuenta
-except ImportError:
-    def mostrar_boton_descarga_estado_cuenta(id): return None, "", False
+from utils.pdf import mostrar_boton_descarga_pdf, pdf_estado_cuenta
+from utils.exportar import mostrar_exportacion
 
 # -----------------------------------------------------------
 # CONFIGURACIÓN DE PÁGINA (Debe ser lo primero)
@@ -156,11 +154,8 @@ supabase = get_supabase_client()
 # 2. FILTROS REPRESENTADOS COMO RECUADROS DE COLORES SUPERIORES
 # -----------------------------------------------------------
 try:
-    clientes = get_clientes(user_id) 
-    lugares = get_lugares_trabajo(user_id)
-    
-    clientes_map = {id: nombre for id, nombre in clientes}
-    lugares_map = {id: nombre for id, nombre in lugares}
+    clientes = get_directorio_clientes(user_id) 
+    lugares = get_directorio_lugares(user_id)
     
     # Renderizamos los selectores embebidos dentro de cajas HTML con colores pastel personalizados
     col_f1, col_f2, col_f3 = st.columns(3)
@@ -168,16 +163,16 @@ try:
     with col_f1:
         cliente_filtro_nombre = st.selectbox(
             "👤 Filtrar por cliente:",
-            options=["Todos los clientes"] + list(clientes_map.values()),
+            options=["Todos los clientes"] + clientes.nombres,
         )
-        cliente_filtro_id = next((id for id, nombre in clientes_map.items() if nombre == cliente_filtro_nombre), None)
+        cliente_filtro_id = clientes.id_de(cliente_filtro_nombre)
 
     with col_f2:
         lugar_filtro_nombre = st.selectbox(
             "📍 Filtrar por lugar:",
-            options=["Todos los lugares"] + list(lugares_map.values()),
+            options=["Todos los lugares"] + lugares.nombres,
         )
-        lugar_filtro_id = next((id for id, nombre in lugares_map.items() if nombre == lugar_filtro_nombre), None)
+        lugar_filtro_id = lugares.id_de(lugar_filtro_nombre)
   
     with col_f3:
         fecha_filtro = st.selectbox(
@@ -201,7 +196,7 @@ fecha_inicio = None
 if fecha_filtro == "Últimos 7 días":
     fecha_inicio = datetime.now() - timedelta(days=7)
 elif fecha_filtro == "Últimos 30 días":
-    datetime.now() - timedelta(days=30)
+    fecha_inicio = datetime.now() - timedelta(days=30)
 elif fecha_filtro == "Últimos 90 días":
     fecha_inicio = datetime.now() - timedelta(days=90)
     
@@ -210,6 +205,50 @@ if fecha_inicio:
 
 st.write("##") # Margen de separación limpio
 
+def acciones_presupuesto(p: dict, columnas) -> None:
+    """Botones de acción de un presupuesto (editar, PDF, detalle, clonar, eliminar)."""
+    b1, b2, b3, b5, b4 = columnas
+    notas = p.get('notas', '')
+    with b1:
+        if st.button("✏️", key=f"edit_{p['id']}", help="Editar", use_container_width=True):
+            st.session_state['presupuesto_a_editar_id'] = p['id'] 
+            st.session_state['presupuesto_cargado_automaticamente'] = False
+            st.switch_page("pages/_✏️ Editar.py")
+    with b2:
+        mostrar_boton_descarga_pdf(p['id'], key=f"btn_pdf_{p['id']}")
+    with b3:
+        with st.popover("👁️", use_container_width=True):
+            # El contenido del popover se ejecuta en cada rerun aunque esté cerrado:
+            # los ítems solo se consultan cuando el usuario los pide
+            if st.toggle("Ver ítems", key=f"ver_items_{p['id']}"):
+                _show_presupuesto_detail(presupuesto_id=p['id'])
+                # Presupuestos editados en el lugar: comparar versiones
+                if notas.startswith('V') and notas != 'V1':
+                    st.markdown("**🕓 Versiones**")
+                    _show_versiones_presupuesto(p['id'])
+    with b5:
+        if st.button("📑", key=f"clone_{p['id']}", help="Duplicar", use_container_width=True):
+            nuevo_id = clonar_presupuesto(p['id'], user_id)
+            if nuevo_id:
+                st.toast(f"Presupuesto duplicado (ID: {nuevo_id})", icon="📑")
+                st.rerun()
+    with b4:
+        if st.button("🗑️", key=f"del_{p['id']}", help="Eliminar", use_container_width=True):
+            if delete_presupuesto(p['id'], user_id):
+                st.rerun()
+
+def tabla_presupuestos(presupuestos: list) -> pd.DataFrame:
+    """Una fila plana por presupuesto para la vista compacta."""
+    return pd.DataFrame({
+        'Cliente': [p.get('cliente', {}).get('nombre', 'N/A').title() for p in presupuestos],
+        'Versión': [p.get('notas') or 'V1' for p in presupuestos],
+        'Lugar': [p.get('lugar', {}).get('nombre', 'N/A').title() for p in presupuestos],
+        'Descripción': [p.get('descripcion') or 'Sin descripción' for p in presupuestos],
+        'Fecha': [(p.get('fecha_creacion') or '').split('T')[0] for p in presupuestos],
+        'Total': [safe_numeric_value(p.get('total', 0)) for p in presupuestos],
+        'Ítems': [p.get('num_items', 0) for p in presupuestos],
+    })
+
 # -----------------------------------------------------------
 # 3. SECCIONES EN PESTAÑAS (Páginas de separación: Presupuestos vs Estados de Cuenta)
 # -----------------------------------------------------------
@@ -232,62 +271,77 @@ with tab_presupuestos:
         total_p = len(presupuestos)
         avg_p = suma_total_p / total_p if total_p else 0
 
-        c1, c2, c3 = st.columns(3)
+        c1, c2, c3, c4 = st.columns(4)
         with c1: st.metric("Total Presupuestos", f"{total_p}")
         with c2: st.metric("Suma Total", f"${suma_total_p:,.0f}")
         with c3: st.metric("Promedio", f"${avg_p:,.0f}")
+        with c4: mostrar_exportacion(user_id, filtros)
 
         st.markdown("---")
-        # Encabezados limpios de tabla
-        with st.container():
-            col1, col2, col3, col5, col6, col7, col8 = st.columns([2.5, 2.3, 2.5, 1.8, 1.8, 1, 3.2])
-            col1.markdown('<div class="table-header">Cliente</div>', unsafe_allow_html=True)
-            col2.markdown('<div class="table-header">Lugar</div>', unsafe_allow_html=True)
-            col3.markdown('<div class="table-header">Descripción</div>', unsafe_allow_html=True)
-            col5.markdown('<div class="table-header">Fecha</div>', unsafe_allow_html=True)
-            col6.markdown('<div class="table-header">Total</div>', unsafe_allow_html=True)
-            col7.markdown('<div class="table-header">Ítems</div>', unsafe_allow_html=True)
-            col8.markdown('<div class="table-header" style="text-align: center;">Acciones</div>', unsafe_allow_html=True)
-
-        for p in presupuestos:
-            with st.container(border=True):
+        # Vista compacta: una sola tabla en lugar de ~20 widgets por fila
+        vista_compacta = st.toggle("⚡ Vista compacta", value=total_p > 50, key="historial_vista_compacta")
+
+        if vista_compacta:
+            seleccion = st.dataframe(
+                tabla_presupuestos(presupuestos),
+                column_config={"Total": st.column_config.NumberColumn("Total", format="$%.0f")},
+                hide_index=True,
+                width='stretch',
+                on_select="rerun",
+                selection_mode="single-row",
+                key="tabla_presupuestos",
+            )
+            filas = seleccion.selection.rows
+            if filas:
+                p = presupuestos[filas[0]]
+                with st.container(border=True):
+                    col_info, col_acc = st.columns([6.8, 3.2])
+                    col_info.markdown(
+                        f'<div class="client-title">{p.get("cliente", {}).get("nombre", "N/A").title()}</div>'
+                        f'{p.get("descripcion") or "Sin descripción"}',
+                        unsafe_allow_html=True
+                    )
+                    with col_acc:
+                        acciones_presupuesto(p, st.columns(5))
+            else:
+                st.caption("Selecciona una fila para ver sus acciones.")
+        else:
+            # Encabezados limpios de tabla
+            with st.container():
                 col1, col2, col3, col5, col6, col7, col8 = st.columns([2.5, 2.3, 2.5, 1.8, 1.8, 1, 3.2])
+                col1.markdown('<div class="table-header">Cliente</div>', unsafe_allow_html=True)
+                col2.markdown('<div class="table-header">Lugar</div>', unsafe_allow_html=True)
+                col3.markdown('<div class="table-header">Descripción</div>', unsafe_allow_html=True)
+                col5.markdown('<div class="table-header">Fecha</div>', unsafe_allow_html=True)
+                col6.markdown('<div class="table-header">Total</div>', unsafe_allow_html=True)
+                col7.markdown('<div class="table-header">Ítems</div>', unsafe_allow_html=True)
+                col8.markdown('<div class="table-header" style="text-align: center;">Acciones</div>', unsafe_allow_html=True)
+
+            for p in presupuestos:
+                with st.container(border=True):
+                    col1, col2, col3, col5, col6, col7, col8 = st.columns([2.5, 2.3, 2.5, 1.8, 1.8, 1, 3.2])
             
-                total_display = safe_numeric_value(p.get('total', 0))
-                notas = p.get('notas', '')
+                    total_display = safe_numeric_value(p.get('total', 0))
+                    notas = p.get('notas', '')
 
-                # Mostrar Cliente y su versión abajo sin foto
-                nombre_cliente = p.get('cliente', {}).get('nombre', 'N/A').title()
-                badge_version = f'<span class="version-tag">{notas}</span>' if notas else '<span class="version-tag-empty">V1</span>'
-                col1.markdown(f'<div class="client-title">{nombre_cliente}</div>{badge_version}', unsafe_allow_html=True)
+                    # Mostrar Cliente y su versión abajo sin foto
+                    nombre_cliente = p.get('cliente', {}).get('nombre', 'N/A').title()
+                    badge_version = f'<span class="version-tag">{notas}</span>' if notas else '<span class="version-tag-empty">V1</span>'
+                    col1.markdown(f'<div class="client-title">{nombre_cliente}</div>{badge_version}', unsafe_allow_html=True)
                 
-                col2.write(p.get('lugar', {}).get('nombre', 'N/A').title())
+                    col2.write(p.get('lugar', {}).get('nombre', 'N/A').title())
                 
-                descripcion = p.get('descripcion', 'Sin descripción')
-                col3.write(descripcion[:30] + "..." if len(descripcion) > 30 else descripcion)
+                    descripcion = p.get('descripcion', 'Sin descripción')
+                    col3.write(descripcion[:30] + "..." if len(descripcion) > 30 else descripcion)
 
-                fecha_str = p.get('fecha_creacion', datetime.now().isoformat())
-                col5.write(fecha_str.split('T')[0] if 'T' in fecha_str else fecha_str)
+                    fecha_str = p.get('fecha_creacion', datetime.now().isoformat())
+                    col5.write(fecha_str.split('T')[0] if 'T' in fecha_str else fecha_str)
                     
-                col6.write(f"**${total_display:,.0f}**")
-                col7.write(str(p.get('num_items', 0)))
-
-                with col8:
-                    b1, b2, b3, b4 = st.columns([1, 1, 1, 1])
-                    with b1:
-                        if st.button("✏️", key=f"edit_{p['id']}", help="Editar", use_container_width=True):
-                            st.session_state['presupuesto_a_editar_id'] = p['id'] 
-                            st.session_state['presupuesto_cargado_automaticamente'] = False
-                            st.switch_page("pages/_✏️ Editar.py")
-                    with b2:
-                        mostrar_boton_descarga_pdf(p['id'], key=f"btn_pdf_{p['id']}")
-                    with b3:
-                        with st.popover("👁️", use_container_width=True):
-                            _show_presupuesto_detail(presupuesto_id=p['id'])
-                    with b4:
-                        if st.button("🗑️", key=f"del_{p['id']}", help="Eliminar", use_container_width=True):
-                            if delete_presupuesto(p['id'], user_id):
-                                st.rerun()
+                    col6.write(f"**${total_display:,.0f}**")
+                    col7.write(str(p.get('num_items', 0)))
+
+                    with col8:
+                        acciones_presupuesto(p, st.columns(5))
 
 # =========================================================================
 # PESTAÑA B: ESTADOS DE CUENTA
@@ -343,11 +397,17 @@ with tab_estados_cuenta:
                     ba1, ba2, ba3, ba4 = st.columns([1, 1, 1, 1])
                     
                     with ba1:
-                        pdf_b, f_name, ok = mostrar_boton_descarga_estado_cuenta(ec['id'])
-                        if ok and pdf_b:
-                            st.download_button(label="⬇️", data=pdf_b, file_name=f_name, mime="application/pdf", key=f"down_ec_{ec['id']}", use_container_width=True)
-                        else:
-                            st.button("🚫", key=f"down_dis_ec_{ec['id']}", disabled=True, use_container_width=True)
+                        # El PDF se regenera solo cuando se pide
+                        clave_pdf = f"pdf_ec_solicitado_{ec['id']}"
+                        if st.session_state.get(clave_pdf):
+                            pdf_b, f_name, ok = pdf_estado_cuenta(ec['id'])
+                            if ok and pdf_b:
+                                st.download_button(label="⬇️", data=pdf_b, file_name=f_name, mime="application/pdf", key=f"down_ec_{ec['id']}", use_container_width=True)
+                            else:
+                                st.button("🚫", key=f"down_dis_ec_{ec['id']}", disabled=True, use_container_width=True)
+                        elif st.button("📄", key=f"gen_ec_{ec['id']}", help="Generar PDF", use_container_width=True):
+                            st.session_state[clave_pdf] = True
+                            st.rerun()
                     
                     with ba2:
                         with st.popover("👁️", use_container_width=True):
@@ -8,8 +8,12 @@ from utils.db import (
     delete_cliente, delete_lugar_trabajo,
     update_cliente, update_lugar_trabajo,
     get_presupuestos_por_cliente,
-    get_presupuestos_por_lugar
+    get_presupuestos_por_lugar,
+    get_indice_clientes,
+    get_indice_lugares,
+    limpiar_caches
 )
+from utils.pdf import mostrar_boton_dossier
 from datetime import datetime
 
 st.set_page_config(page_title="Clientes", page_icon="🌱", layout="wide")
@@ -87,10 +91,8 @@ with tab1:
         if not clientes:
             st.info("📭 No hay clientes registrados. Crea tu primer cliente.")
         else:
-            clientes_filtrados = [
-                (id, nombre) for id, nombre in clientes
-                if not busqueda_cliente or busqueda_cliente.lower() in nombre.lower()
-            ]
+            # Índice en memoria: sin acentos, por prefijo/trigramas y ordenado por relevancia
+            clientes_filtrados = get_indice_clientes(user_id).buscar(busqueda_cliente)
 
             if not clientes_filtrados:
                 st.warning("🔍 No se encontraron clientes con ese criterio de búsqueda.")
@@ -129,6 +131,9 @@ with tab1:
                                         st.session_state.eliminando_cliente_id = cliente_id
                                         st.session_state.eliminando_cliente_nombre = cliente_nombre
 
+                                mostrar_boton_dossier('cliente_id', cliente_id, cliente_nombre, user_id,
+                                                      key=f"dossier_cliente_{cliente_id}")
+
                                 # =============== POPOVER EDITAR CLIENTE ===============
                                 if st.session_state.get("editando_cliente_id") == cliente_id:
                                     with st.popover(f"✏️ Editar Cliente: {cliente_nombre}", use_container_width=True):
@@ -143,7 +148,7 @@ with tab1:
                                             if st.button("💾 Guardar", key=f"guardar_edicion_cliente_{cliente_id}"):
                                                 if update_cliente(cliente_id, nuevo_nombre, user_id):
                                                     st.success("✅ Cliente actualizado correctamente!")
-                                                    st.cache_data.clear()
+                                                    limpiar_caches()
                                                 del st.session_state.editando_cliente_id
                                                 del st.session_state.editando_cliente_nombre
                                                 st.rerun()
@@ -192,7 +197,7 @@ with tab1:
                                                     if k in st.session_state:
                                                         del st.session_state[k]
 
-                                                st.cache_data.clear()
+                                                limpiar_caches()
                                                 st.rerun()
 
                                         # Cancelar eliminación
@@ -219,7 +224,7 @@ with tab1:
                             create_cliente(nombre_cliente.strip(), user_id)
                             st.success(f"✅ Cliente '{nombre_cliente}' creado correctamente!")
                             st.session_state.creando_cliente = False
-                            st.cache_data.clear()
+                            limpiar_caches()
                             st.rerun()
                         except Exception as e:
                             st.error(f"❌ Error al crear cliente: {e}")
@@ -253,10 +258,7 @@ with tab2:
         if not lugares:
             st.info("📭 No hay lugares de trabajo registrados.")
         else:
-            lugares_filtrados = [
-                (id, nombre) for id, nombre in lugares
-                if not busqueda_lugar or busqueda_lugar.lower() in nombre.lower()
-            ]
+            lugares_filtrados = get_indice_lugares(user_id).buscar(busqueda_lugar)
 
             cols = st.columns(2)
 
@@ -279,6 +281,9 @@ with tab2:
                                 st.session_state.eliminando_lugar_id = lugar_id
                                 st.session_state.eliminando_lugar_nombre = lugar_nombre
 
+                        mostrar_boton_dossier('lugar_trabajo_id', lugar_id, lugar_nombre, user_id,
+                                              key=f"dossier_lugar_{lugar_id}")
+
                         # -------- POPOVER EDITAR LUGAR --------
                         if st.session_state.get("editando_lugar_id") == lugar_id:
                             with st.popover(f"✏️ Editar Lugar: {lugar_nombre}", use_container_width=True):
@@ -294,7 +299,7 @@ with tab2:
                                     if st.button("💾 Guardar", key=f"guardar_edicion_lugar_{lugar_id}"):
                                         update_lugar_trabajo(lugar_id, nuevo_nombre, user_id)
                                         st.success("Lugar actualizado correctamente!")
-                                        st.cache_data.clear()
+                                        limpiar_caches()
                                         del st.session_state.editando_lugar_id
                                         del st.session_state.editando_lugar_nombre
                                         st.rerun()
@@ -332,7 +337,7 @@ with tab2:
                                             if k in st.session_state:
                                                 del st.session_state[k]
 
-                                        st.cache_data.clear()
+                                        limpiar_caches()
                                         st.rerun()
 
                                 with col2:
@@ -358,7 +363,7 @@ with tab2:
                             create_lugar_trabajo(nombre_lugar.strip(), user_id)
                             st.success(f"Lugar '{nombre_lugar}' creado correctamente!")
                             st.session_state.creando_lugar = False
-                            st.cache_data.clear()
+                            limpiar_caches()
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error al crear lugar: {e}")
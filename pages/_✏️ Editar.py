@@ -19,7 +19,10 @@ from utils.db import (
     get_presupuesto_detallado,
     get_presupuesto_para_editar,
     get_presupuestos_para_edicion,
-    save_edited_presupuesto
+    save_edited_presupuesto,
+    update_presupuesto_editado,
+    descartar_items,
+    items_pendientes
 )
 # PDF
 from utils.pdf import generar_pdf
@@ -35,6 +38,8 @@ from utils.components import (
     show_cliente_lugar_selector_edicion,
     add_item_to_category
 )
+from utils.items import total_categorias
+from utils.catalogo import actualizar_catalogo_precios
 
 # Funciones de utilidad para autoguardado
 from utils.autosave import AutoSaveManager
@@ -104,6 +109,7 @@ with st.sidebar:
 # ----- constantes y session -----
 EDICION_KEY = 'categorias_edicion'
 HISTORIAL_PAGE = "pages/2_🕒_historial.py"
+MODO_ACTUALIZAR = "Actualizar este presupuesto"
 
 user_id = st.session_state.get('user_id')
 supabase = get_supabase_client()
@@ -156,9 +162,10 @@ def get_presupuestos_para_selector(user_id: int) -> List[tuple]:
 def cargar_presupuesto_en_sesion(presupuesto_id: int) -> bool:
     """Cargar un presupuesto en la sesión para edición"""
     try:
-        # Limpiar estado anterior
+        # Descartar los cambios sin guardar del presupuesto anterior y limpiar su estado
+        descartar_items()
         for key in [EDICION_KEY, 'categorias', 'presupuesto_cliente_id', 'presupuesto_lugar_trabajo_id', 
-                   'presupuesto_descripcion', 'presupuesto_a_editar_id']:
+                   'presupuesto_descripcion', 'presupuesto_a_editar_id', 'presupuesto_items_originales']:
             st.session_state.pop(key, None)
 
         # Usar la nueva función específica para edición
@@ -178,6 +185,8 @@ def cargar_presupuesto_en_sesion(presupuesto_id: int) -> bool:
 
         # items: agrupar por categoria
         items_detalle = detalle.get('items', [])
+        # Copia de lo guardado: al actualizar en el lugar se envían solo las diferencias
+        st.session_state['presupuesto_items_originales'] = items_detalle
 
         for item in items_detalle:
             cat_nombre = item.get('categoria') or 'Sin Categoría'
@@ -201,6 +210,8 @@ def cargar_presupuesto_en_sesion(presupuesto_id: int) -> bool:
 
             st.session_state[EDICION_KEY][cat_nombre]['items'].append({
                 'id': str(uuid.uuid4()),
+                'db_id': item.get('db_id'),
+                'categoria_id': item.get('categoria_id'),
                 'nombre': nombre_item,
                 'nombre_personalizado': nombre_item,
                 'unidad': item.get('unidad', 'Unidad'),
@@ -227,11 +238,7 @@ def cargar_presupuesto_en_sesion(presupuesto_id: int) -> bool:
         return False
 
 def calcular_total_edicion(items_data: Dict[str, Any]) -> float:
-    total = 0.0
-    for categoria, data in items_data.items():
-        total += sum(safe_numeric_value(item.get('total', 0)) for item in data.get('items', []))
-        total += safe_numeric_value(data.get('mano_obra', 0.0))
-    return total
+    return float(total_categorias(items_data))
 
 def clean_price_input(text: str) -> float:
     """Limpiar input de precio: quitar puntos/moneda y devolver float seguro."""
@@ -372,6 +379,12 @@ if not presupuesto_id:
     st.info("👆 Selecciona un presupuesto y haz clic en 'Cargar Presupuesto' para comenzar a editar.")
     st.stop()
 
+# Al actualizar en su lugar se anotan los ítems cambiados; nada se escribe hasta guardar.
+# Como nuevo presupuesto el original no cambia: se descartan los cambios anotados.
+anotar_cambios = st.session_state.get("modo_guardado_edicion", MODO_ACTUALIZAR) == MODO_ACTUALIZAR
+if not anotar_cambios:
+    descartar_items()
+
 # ----- VERIFICAR DATOS CARGADOS -----
 if 'categorias' not in st.session_state or not st.session_state['categorias']:
     st.error("❌ No hay datos de presupuesto cargados. Por favor, carga un presupuesto nuevamente.")
@@ -491,23 +504,18 @@ with col_izq:
             precio_val = clean_price_input(precio_input)
 
             nuevo_item = {
-                "id": str(uuid.uuid4()),
-                "nombre": nombre_item,
                 "nombre_personalizado": nombre_item,
                 "unidad": unidad,
                 "cantidad": cantidad,
                 "precio_unitario": precio_val,
-                "total": precio_val * cantidad,
                 "categoria": categoria_sel,
-                "posicion": len(st.session_state["categorias"][categoria_sel]["items"])
             }
 
-            st.session_state["categorias"][categoria_sel]["items"].append(nuevo_item)
-            ensure_ids_and_positions(st.session_state["categorias"])
+            add_item_to_category(st.session_state["categorias"], categoria_sel, nuevo_item, persist_db=anotar_cambios)
             st.success("Ítem agregado.")
             st.rerun()
 
-    show_trabajos_simples(st.session_state["categorias"], persist_db=False)
+    show_trabajos_simples(st.session_state["categorias"], persist_db=anotar_cambios)
 
 # --------------------------------
 #  COLUMNA DERECHA — DATAFRAME
@@ -525,7 +533,7 @@ st.markdown("---")
 st.subheader("🛠️ Edición Avanzada")
 
 st.subheader("📋 Ítems del Presupuesto (Editable)")
-items_data = show_edited_presupuesto(user_id, is_editing=True, persist_db=False)
+items_data = show_edited_presupuesto(user_id, is_editing=True, persist_db=anotar_cambios)
 
 # Autoguardado después de edición avanzada
 if st.session_state.get('_items_modified', False):
@@ -558,7 +566,24 @@ with st.sidebar:
         st.caption("No hay borradores guardados")
 
 # BOTÓN FINAL DE GUARDADO
-if st.button("💾 Guardar como Nuevo Presupuesto y Generar PDF", type="primary", key="guardar_edicion_final"):
+col_modo, col_version = st.columns([2, 1])
+with col_modo:
+    modo_guardado = st.radio(
+        "Modo de guardado",
+        [MODO_ACTUALIZAR, "Guardar como nuevo presupuesto"],
+        horizontal=True,
+        key="modo_guardado_edicion",
+        help="El presupuesto guardado solo cambia al presionar el botón de guardado.",
+        label_visibility="collapsed"
+    )
+en_sitio = modo_guardado == MODO_ACTUALIZAR
+with col_version:
+    registrar_version = st.checkbox("Marcar como versión editada", value=True, disabled=not en_sitio, key="registrar_version_edicion")
+if en_sitio and items_pendientes():
+    st.caption(f"✏️ {items_pendientes()} ítem(s) con cambios sin guardar")
+
+etiqueta_guardar = "💾 Guardar Cambios y Generar PDF" if en_sitio else "💾 Guardar como Nuevo Presupuesto y Generar PDF"
+if st.button(etiqueta_guardar, type="primary", key="guardar_edicion_final"):
     try:
         st.toast("Guardando cambios...", icon="💾")
 
@@ -574,21 +599,37 @@ if st.button("💾 Guardar como Nuevo Presupuesto y Generar PDF", type="primary"
         items_data = categorias  
         total_general = calcular_total_edicion(categorias)
         presupuesto_original_id = st.session_state.get('presupuesto_a_editar_id')
-        # LLAMADA CORREGIDA
-# LLAMADA CORREGIDA - elimina el parámetro presupuesto_original_id
-        nuevo_id = save_edited_presupuesto(
-            user_id=user_id,
-            cliente_id=cliente_id_actualizado,
-            lugar_trabajo_id=lugar_trabajo_id_actualizado,
-            descripcion=descripcion_actualizada,
-            items_data=items_data,
-            total_general=total_general
-            # Elimina esta línea: presupuesto_original_id=st.session_state.get('presupuesto_a_editar_id')
-        )
+        if en_sitio:
+            # Solo viajan los ítems nuevos, modificados o eliminados
+            nuevo_id = update_presupuesto_editado(
+                presupuesto_id=presupuesto_original_id,
+                user_id=user_id,
+                cliente_id=cliente_id_actualizado,
+                lugar_trabajo_id=lugar_trabajo_id_actualizado,
+                descripcion=descripcion_actualizada,
+                items_data=items_data,
+                total_general=total_general,
+                items_originales=st.session_state.get('presupuesto_items_originales', []),
+                registrar_version=registrar_version
+            )
+            if nuevo_id:
+                # La próxima edición se compara contra lo recién guardado
+                st.session_state['presupuesto_items_originales'] = \
+                    get_presupuesto_para_editar(nuevo_id).get('items', [])
+        else:
+            nuevo_id = save_edited_presupuesto(
+                user_id=user_id,
+                cliente_id=cliente_id_actualizado,
+                lugar_trabajo_id=lugar_trabajo_id_actualizado,
+                descripcion=descripcion_actualizada,
+                items_data=items_data,
+                total_general=total_general
+            )
 
         if not nuevo_id:
             st.error("❌ Error al guardar en la base de datos.")
             st.stop()
+        actualizar_catalogo_precios(user_id, nuevo_id)
 
         # === GENERAR PDF ===
         pdf_path = generar_pdf(
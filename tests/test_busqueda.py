@@ -0,0 +1,51 @@
+from utils.busqueda import IndiceBusqueda, normalizar_texto
+
+LUGARES = [
+    (1, "Peñalolén"),
+    (2, "Parque Peñalolén Alto"),
+    (3, "Condominio Los Aromos"),
+    (4, "Edificio Norte"),
+    (5, "Parcela El Arrayán"),
+    (6, "Colegio San Pedro de la Costa Norte Grande"),
+]
+
+
+def _ids(resultados):
+    return [id_entidad for id_entidad, _ in resultados]
+
+
+def test_normalizar_texto():
+    assert normalizar_texto("  Peñalolén   ALTO ") == "penalolen alto"
+    assert normalizar_texto(None) == ""
+
+
+def test_exacto_antes_que_prefijo_y_palabra():
+    indice = IndiceBusqueda(LUGARES)
+    assert _ids(indice.buscar("penalolen")) == [1, 2]
+    assert _ids(indice.buscar("PARQ pen")) == [2]
+
+
+def test_prefijos_de_varias_palabras_sin_orden():
+    indice = IndiceBusqueda(LUGARES)
+    assert _ids(indice.buscar("norte edif")) == [4]
+    assert _ids(indice.buscar("de la costa norte grande")) == [6]
+
+    # Palabras más largas que el prefijo indexado se verifican completas
+    largas = IndiceBusqueda([(1, "Transportadores Norte"), (2, "Transportadora Sur")])
+    assert _ids(largas.buscar("transportadora"))[0] == 2
+
+
+def test_texto_contenido_y_errores_pequenos():
+    indice = IndiceBusqueda(LUGARES)
+    assert _ids(indice.buscar("aromo")) == [3]
+    assert 3 in _ids(indice.buscar("ominio"))
+    assert _ids(indice.buscar("arrayan"))[0] == 5
+    assert 5 in _ids(indice.buscar("arayan"))
+
+
+def test_sin_consulta_y_limite():
+    indice = IndiceBusqueda(LUGARES)
+    assert indice.buscar("") == LUGARES
+    assert indice.buscar("  ", limite=2) == LUGARES[:2]
+    assert len(indice.buscar("norte", limite=1)) == 1
+    assert indice.buscar("zzzz") == []
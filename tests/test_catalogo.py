@@ -0,0 +1,117 @@
+import pytest
+
+pytest.importorskip("streamlit")
+
+from utils import catalogo  # noqa: E402
+
+
+def _fila(item_id, presupuesto_id, nombre, precio, unidad='m2'):
+    return {
+        'id': item_id,
+        'presupuesto_id': presupuesto_id,
+        'nombre_personalizado': nombre,
+        'unidad': unidad,
+        'precio_unitario': precio,
+    }
+
+
+class _Consulta:
+    """Imita la cadena select/eq/order/range/execute de supabase sobre una lista."""
+
+    def __init__(self, filas, llamadas):
+        self.filas = filas
+        self.llamadas = llamadas
+        self.desde, self.hasta = 0, None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def range(self, desde, hasta):
+        self.desde, self.hasta = desde, hasta
+        return self
+
+    def execute(self):
+        self.llamadas.append((self.desde, self.hasta))
+        fin = None if self.hasta is None else self.hasta + 1
+        return type('Respuesta', (), {'data': self.filas[self.desde:fin]})()
+
+
+class _Cliente:
+    def __init__(self, filas):
+        self.filas = filas
+        self.llamadas = []
+
+    def from_(self, tabla):
+        return _Consulta(self.filas, self.llamadas)
+
+
+def test_ultimo_precio_y_mediana():
+    cat = catalogo.CatalogoPrecios()
+    cat.agregar([_fila(1, 10, 'Cerámica', 100), _fila(2, 11, 'cerámica', 300), _fila(3, 12, 'Cerámica', 200)])
+
+    (entrada,) = cat.buscar('ceram')
+    assert entrada.usos == 3
+    assert entrada.ultimo_precio == 200
+    assert entrada.mediana == 200
+
+
+def test_volver_a_guardar_no_duplica():
+    cat = catalogo.CatalogoPrecios()
+    cat.agregar([_fila(1, 10, 'Pintura', 100), _fila(2, 11, 'Pintura', 100)])
+
+    for _ in range(5):
+        cat.reemplazar_presupuesto(11, [_fila(2, 11, 'Pintura', 500)])
+
+    (entrada,) = cat.buscar('pint')
+    assert entrada.usos == 2
+    assert entrada.ultimo_precio == 500
+    assert entrada.mediana == 300
+
+
+def test_reemplazar_quita_items_borrados():
+    cat = catalogo.CatalogoPrecios()
+    cat.agregar([_fila(1, 10, 'Yeso', 50), _fila(2, 10, 'Yeso', 70)])
+
+    cat.reemplazar_presupuesto(10, [_fila(3, 10, 'Yeso', 90)])
+
+    (entrada,) = cat.buscar('yeso')
+    assert list(entrada.precios) == [3]
+
+
+def test_ignora_mano_de_obra_y_precios_vacios():
+    cat = catalogo.CatalogoPrecios()
+    cat.agregar([_fila(1, 10, catalogo.NOMBRE_MANO_OBRA, 1000), _fila(2, 10, 'Arena', 0)])
+    assert len(cat) == 0
+
+
+def test_carga_paginada(monkeypatch):
+    filas = [_fila(i, i // 10, f'Ítem {i % 7}', 10 + i) for i in range(2500)]
+    cliente = _Cliente(filas)
+    monkeypatch.setattr(catalogo, 'get_supabase_client', lambda: cliente)
+
+    cat = catalogo.get_catalogo_precios.__wrapped__('usuario')
+
+    assert cliente.llamadas == [(0, 999), (1000, 1999), (2000, 2999)]
+    assert len(cat) == 7
+    assert sum(e.usos for e in cat.buscar('item', limite=10)) == 7 * catalogo._MAX_PRECIOS
+
+
+def test_error_de_pagina_no_deja_catalogo_parcial(monkeypatch):
+    class _Falla(_Cliente):
+        def from_(self, tabla):
+            consulta = super().from_(tabla)
+            if len(self.llamadas) == 1:
+                consulta.execute = lambda: (_ for _ in ()).throw(ConnectionError("timeout"))
+            return consulta
+
+    cliente = _Falla([_fila(i, 1, 'Yeso', 10) for i in range(1500)])
+    monkeypatch.setattr(catalogo, 'get_supabase_client', lambda: cliente)
+
+    with pytest.raises(ConnectionError):
+        catalogo.get_catalogo_precios.__wrapped__('usuario')
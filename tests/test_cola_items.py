@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("supabase")
+
+from utils import db  # noqa: E402
+from utils.items import Categoria, Item, reconstruir_version  # noqa: E402
+
+
+class _Tabla:
+    """Registra las operaciones encadenadas sobre una tabla de supabase."""
+
+    def __init__(self, nombre, llamadas):
+        self.nombre = nombre
+        self.llamadas = llamadas
+        self.filas = []
+
+    def _registrar(self, *args):
+        self.llamadas.append((self.nombre,) + args)
+        return self
+
+    def select(self, *args):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def delete(self):
+        return self._registrar('delete')
+
+    def upsert(self, filas, **kwargs):
+        self.filas = filas
+        return self._registrar('upsert', filas)
+
+    def insert(self, filas):
+        self.filas = filas
+        return self._registrar('insert', filas)
+
+    def update(self, cambios):
+        return self._registrar('update', cambios)
+
+    def eq(self, campo, valor):
+        return self._registrar('eq', campo, valor)
+
+    def in_(self, campo, valores):
+        return self._registrar('in', campo, valores)
+
+    def execute(self):
+        datos = [{'id': fila.get('id', 1000 + i)} for i, fila in enumerate(self.filas)]
+        return SimpleNamespace(data=datos)
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    llamadas = []
+    cliente = SimpleNamespace(table=lambda nombre: _Tabla(nombre, llamadas))
+    sesion = {'user_id': 'usuario', 'presupuesto_a_editar_id': 7}
+    monkeypatch.setattr(db, 'st', SimpleNamespace(session_state=sesion, error=pytest.fail, warning=pytest.fail))
+    monkeypatch.setattr(db, 'get_supabase_client', lambda: cliente)
+    monkeypatch.setattr(db, 'get_directorio_categorias', lambda user_id: SimpleNamespace(
+        por_nombre_minusculas={'muros': 1, 'pisos': 2}))
+    monkeypatch.setattr(db, 'invalidar_detalle_presupuesto', lambda presupuesto_id: None)
+
+    guardado = Item(nombre='Ladrillo', cantidad=10, precio_unitario=500, categoria='Muros',
+                    categoria_id=1, db_id=55)
+    sesion['categorias'] = {'Muros': Categoria(nombre='Muros', categoria_id=1, items=[guardado])}
+    originales = [{'db_id': 55, 'categoria_id': 1, 'nombre': 'Ladrillo', 'unidad': 'Unidad',
+                   'cantidad': 10, 'precio_unitario': 500.0, 'notas': ''},
+                  {'db_id': 56, 'categoria_id': 1, 'nombre': 'Yeso', 'unidad': 'Unidad',
+                   'cantidad': 1, 'precio_unitario': 900.0, 'notas': ''}]
+    return SimpleNamespace(llamadas=llamadas, sesion=sesion, item=guardado, originales=originales)
+
+
+def _guardar(entorno, registrar_version=False):
+    return db.update_presupuesto_editado(
+        presupuesto_id=7, user_id='usuario', cliente_id=1, lugar_trabajo_id=2, descripcion='',
+        items_data=entorno.sesion['categorias'], total_general=5200,
+        items_originales=entorno.originales, registrar_version=registrar_version)
+
+
+def test_reindex_solo_posicion_no_anota(entorno):
+    entorno.item.posicion = 3
+    db.reindex_items(None, [entorno.item])
+    assert db.items_pendientes() == 0
+
+
+def test_cambios_no_se_escriben_hasta_guardar(entorno):
+    entorno.item['categoria'] = 'Pisos'
+    db.reindex_items(None, [entorno.item])
+    nuevo = Item(nombre='Cemento', cantidad=2, precio_unitario=100, categoria='Muros')
+    db.upsert_item(nuevo)
+    db.delete_item({'id': 'x', 'db_id': 56})
+
+    assert db.items_pendientes() == 3
+    assert entorno.llamadas == []
+
+    # Guardar como nuevo / cargar otro presupuesto: el original no cambia
+    db.descartar_items()
+    assert db.items_pendientes() == 0
+    assert entorno.llamadas == []
+
+
+def test_guardar_envia_diferencias_y_vacia_la_cola(entorno):
+    muros = entorno.sesion['categorias']['Muros']
+    nuevo = Item(nombre='Cemento', cantidad=2, precio_unitario=100, categoria='Muros')
+    muros.items.append(nuevo)
+    db.upsert_item(nuevo)
+    db.delete_item({'id': 'x', 'db_id': 56})
+
+    assert _guardar(entorno) == 7
+
+    upserts = [c for c in entorno.llamadas if c[1] == 'upsert']
+    assert [[fila['nombre_personalizado'] for fila in c[2]] for c in upserts] == [['Cemento']]
+    assert ('items_en_presupuesto', 'in', 'id', [56]) in entorno.llamadas
+    assert nuevo.db_id == 1000
+    assert db.items_pendientes() == 0
+
+
+def test_version_coincide_con_lo_guardado(entorno):
+    entorno.item['cantidad'] = 12
+    db.upsert_item(entorno.item)
+    _guardar(entorno, registrar_version=True)
+
+    (insert,) = [c for c in entorno.llamadas if c[:2] == ('presupuesto_versiones', 'insert')]
+    versiones = insert[2]
+    assert [v['numero'] for v in versiones] == [1, 2]
+    ultima = reconstruir_version(versiones, 2)
+    assert [(fila['id'], fila['cantidad']) for fila in ultima] == [(55, 12)]
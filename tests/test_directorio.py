@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("supabase")
+
+from utils import db  # noqa: E402
+
+
+def test_directorio_compartido_hasta_limpiar(monkeypatch):
+    clientes = [(1, 'Ana'), (2, 'Beto')]
+    monkeypatch.setattr(db, 'get_clientes', lambda user_id: list(clientes))
+    db.limpiar_caches()
+
+    directorio = db.get_directorio_clientes('usuario')
+    assert db.get_directorio_clientes('usuario') is directorio
+    assert directorio.id_de('Beto') == 2 and directorio.nombre(1) == 'Ana'
+
+    clientes.append((3, 'Carla'))
+    db.limpiar_caches()
+    assert db.get_directorio_clientes('usuario').id_de('Carla') == 3
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("fpdf")
+pytest.importorskip("streamlit")
+
+from benchmarks.corpus import estado_cuenta_36_meses, presupuesto_pequeno  # noqa: E402
+from utils import pdf  # noqa: E402
+
+
+def _presupuestos(n):
+    base = presupuesto_pequeno()
+    items = [
+        dict(item, categoria=cat, notas='')
+        for cat, data in base['categorias'].items()
+        for item in data['items']
+    ]
+    return [
+        {'id': i + 1, 'descripcion': base['descripcion'], 'fecha_creacion': '2024-03-01T10:00:00',
+         'cliente': {'nombre': base['cliente_nombre']}, 'lugar': {'nombre': base['lugar_cliente']},
+         'items': items}
+        for i in range(n)
+    ]
+
+
+def _estados(n):
+    base = estado_cuenta_36_meses()
+    return [
+        {'id': i + 1, 'fecha_emision': '2024-12-31', 'abono_monto': base['abono'], 'total_neto': base['total'],
+         'cliente': {'nombre': base['cliente_nombre']}, 'lugar_trabajo': {'nombre': base['lugar_nombre']},
+         'detalles_estado_cuenta': base['items']}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("n_presupuestos, n_estados", [(1, 0), (3, 2), (40, 5)])
+def test_dossier_con_indice(monkeypatch, n_presupuestos, n_estados):
+    monkeypatch.setattr(pdf, "contar_documentos_dossier", lambda *a: (n_presupuestos, n_estados))
+    monkeypatch.setattr(pdf, "iter_presupuestos_detallados", lambda *a: iter(_presupuestos(n_presupuestos)))
+    monkeypatch.setattr(pdf, "iter_estados_cuenta_detallados", lambda *a: iter(_estados(n_estados)))
+
+    datos, file_name = pdf.generar_dossier_pdf('cliente_id', 1, "cliente de prueba", "usuario")
+
+    assert datos.startswith(b"%PDF-")
+    assert file_name == "Dossier_cliente_de_prueba.pdf"
+    # Índice + al menos una página por documento
+    assert pdf.INFORMES_PDF[-1]["paginas"] >= 1 + n_presupuestos + n_estados
+
+
+def test_dossier_campo_invalido():
+    with pytest.raises(ValueError):
+        pdf.generar_dossier_pdf('creado_por', 1, "x", "usuario")
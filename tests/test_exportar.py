@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+
+from utils import exportar  # noqa: E402
+
+
+def _fila(presupuesto_id, categoria, nombre, cantidad, precio, total):
+    return {
+        'nombre_personalizado': nombre,
+        'unidad': 'Unidad',
+        'cantidad': cantidad,
+        'precio_unitario': precio,
+        'total': total,
+        'categoria': {'nombre': categoria} if categoria else None,
+        'presupuesto': {
+            'id': presupuesto_id,
+            'fecha_creacion': '2024-03-01T10:00:00+00:00',
+            'descripcion': f"Presupuesto {presupuesto_id}",
+            'creado_por': 'usuario',
+            'cliente': {'nombre': 'Cliente'},
+            'lugar': {'nombre': 'Lugar'},
+        },
+    }
+
+
+FILAS = [
+    _fila(1, 'Jardinería', 'Tierra', 2, 1000, 2000),
+    _fila(1, 'Jardinería', 'Pasto', 3, 500, 0),  # sin total guardado
+    _fila(1, None, 'Mano de Obra', 1, 7000, 7000),
+    _fila(2, 'Riego', 'Aspersor', 4, 2500, 10000),
+]
+
+
+@pytest.fixture
+def df(monkeypatch):
+    monkeypatch.setattr(exportar, '_filas_exportacion', lambda user_id, filtros: FILAS)
+    return exportar.dataframe_exportacion('usuario', {})
+
+
+def test_dataframe_exportacion(df):
+    assert list(df.columns) == list(exportar.COLUMNAS.values())
+    assert len(df) == 4
+    assert df.loc[1, 'Total'] == 1500  # cantidad * precio
+    assert df.loc[2, 'Categoría'] == 'Sin Categoría'
+
+
+def test_totales_exportacion(df):
+    por_categoria, por_presupuesto = exportar.totales_exportacion(df)
+    assert dict(zip(por_presupuesto['Presupuesto'], por_presupuesto['Total'])) == {1: 10500, 2: 10000}
+    jardineria = por_categoria[por_categoria['Categoría'] == 'Jardinería'].iloc[0]
+    assert (jardineria['Ítems'], jardineria['Total']) == (2, 3500)
+
+
+def test_exportar_csv(df):
+    texto = exportar.exportar_csv(df).decode('utf-8-sig')
+    assert texto.splitlines()[0].startswith('Presupuesto,Fecha,Cliente')
+    assert len(texto.splitlines()) == 5
+
+
+def test_exportar_xlsx_conserva_todas_las_celdas(df):
+    if exportar.motor_excel() is None:
+        pytest.skip("sin motor de Excel")
+    pytest.importorskip("openpyxl")
+    hojas = pd.read_excel(io.BytesIO(exportar.exportar_xlsx(df)), sheet_name=None)
+    assert set(hojas) == {'Ítems', 'Por categoría', 'Por presupuesto'}
+    items = hojas['Ítems']
+    assert items.shape == df.shape
+    assert not items.isna().any().any()
+    assert items['Total'].tolist() == df['Total'].tolist()
+
+
+class _Consulta:
+    """Imita select/eq/gte/order/range/execute de supabase sobre una lista."""
+
+    def __init__(self, filas, paginas):
+        self.filas, self.paginas = filas, paginas
+
+    def __getattr__(self, nombre):
+        return lambda *args, **kwargs: self
+
+    def range(self, desde, hasta):
+        self.desde, self.hasta = desde, hasta
+        return self
+
+    def execute(self):
+        self.paginas.append((self.desde, self.hasta))
+        return type('Respuesta', (), {'data': self.filas[self.desde:self.hasta + 1]})()
+
+
+def test_filas_exportacion_lee_todas_las_paginas(monkeypatch):
+    filas = [_fila(i, 'Riego', f'Ítem {i}', 1, 100, 100) for i in range(2000)]
+    paginas = []
+    cliente = type('Cliente', (), {'from_': lambda self, tabla: _Consulta(filas, paginas)})()
+    monkeypatch.setattr(exportar, 'get_supabase_client', lambda: cliente)
+
+    assert len(exportar._filas_exportacion('usuario', {'cliente_id': 3})) == 2000
+    assert paginas == [(0, 999), (1000, 1999), (2000, 2999)]
@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+
+from utils import components  # noqa: E402
+from utils.components import _df_grilla, aplicar_cambios_grilla  # noqa: E402
+from utils.items import normalizar_categorias  # noqa: E402
+
+
+def _categorias():
+    return normalizar_categorias({
+        'Muros': {'items': [
+            {'nombre': 'Ladrillo', 'cantidad': 100, 'precio_unitario': 250},
+            {'nombre': 'Cemento', 'unidad': 'Saco', 'cantidad': 5, 'precio_unitario': 6000},
+            {'nombre': 'Retiro de escombros', 'total': 30000, 'es_trabajo_simple': True},
+        ]},
+        'Pisos': {'items': [{'nombre': 'Cerámica', 'cantidad': 20, 'precio_unitario': 9000}]},
+    })
+
+
+def _grilla(categorias, nombre='Muros'):
+    original = _df_grilla(nombre, categorias[nombre])
+    return original, original.copy()
+
+
+def test_edicion_de_campos_no_es_estructural():
+    categorias = _categorias()
+    original, editado = _grilla(categorias)
+    ids = list(original.index)
+    editado.loc[ids[0], 'cantidad'] = 120
+    editado.loc[ids[2], 'total'] = 45000
+
+    assert aplicar_cambios_grilla(categorias, 'Muros', original, editado) is False
+    muros = categorias['Muros']
+    assert muros.items[0].total == 120 * 250
+    assert (muros.items[2].cantidad, muros.items[2].precio_unitario, muros.items[2].total) == (1, 45000, 45000)
+    assert muros.total_items == 30000 + 30000 + 45000
+
+
+def test_sin_cambios():
+    categorias = _categorias()
+    original, editado = _grilla(categorias)
+    assert aplicar_cambios_grilla(categorias, 'Muros', original, editado) is False
+    assert categorias['Muros'].total_items == 25000 + 30000 + 30000
+
+
+def test_borrar_mover_y_reordenar_en_un_pase():
+    categorias = _categorias()
+    original, editado = _grilla(categorias)
+    ladrillo, cemento, retiro = original.index
+    editado.loc[ladrillo, 'borrar'] = True
+    editado.loc[cemento, 'mover'] = 'Pisos'
+    editado.loc[retiro, 'orden'] = 0
+
+    assert aplicar_cambios_grilla(categorias, 'Muros', original, editado) is True
+    assert [(it.nombre, it.posicion) for it in categorias['Muros'].items] == [('Retiro de escombros', 0)]
+    assert [(it.nombre, it.posicion) for it in categorias['Pisos'].items] == [('Cerámica', 0), ('Cemento', 1)]
+    assert categorias['Pisos'].items[1].categoria == 'Pisos'
+    assert categorias['Muros'].total_items == 30000
+    assert categorias['Pisos'].total_items == 180000 + 30000
+
+
+def test_filas_agregadas_en_la_grilla_se_ignoran():
+    categorias = _categorias()
+    original, editado = _grilla(categorias)
+    editado.loc['nueva'] = editado.iloc[0]
+    assert aplicar_cambios_grilla(categorias, 'Muros', original, editado) is False
+    assert len(categorias['Muros'].items) == 3
+
+
+def test_total_editado_en_item_normal_se_rechaza(monkeypatch):
+    avisos = []
+    monkeypatch.setattr(components.st, 'warning', avisos.append)
+    categorias = _categorias()
+    original, editado = _grilla(categorias)
+    ladrillo = original.index[0]
+    editado.loc[ladrillo, 'total'] = 1
+
+    assert aplicar_cambios_grilla(categorias, 'Muros', original, editado) is False
+    assert categorias['Muros'].items[0].total == 100 * 250
+    assert len(avisos) == 1
@@ -0,0 +1,196 @@
+import pickle
+
+from utils.items import (
+    TIPO_MANO_OBRA, TIPO_TRABAJO_SIMPLE, Categoria, Item, delta_filas, diff_filas, diff_versiones,
+    eliminar_item, filas_db_por_item, mover_a_categoria, mover_item, normalizar_categorias,
+    reconstruir_version, renumerar_posiciones, total_categorias,
+)
+
+
+# ==================== MODELO Y TOTALES ====================
+def test_item_normaliza_claves_heredadas():
+    item = Item.from_dict({'nombre_personalizado': 'Tierra', 'cantidad': '3', 'precio_unitario': '1500.0'})
+    assert item['nombre'] == item['nombre_personalizado'] == 'Tierra'
+    assert item.cantidad == 3 and item.precio_unitario == 1500
+    assert item.total == 4500
+
+    simple = Item.from_dict({'nombre': 'Poda', 'total': 80000, 'es_trabajo_simple': True})
+    assert simple.tipo == TIPO_TRABAJO_SIMPLE
+    assert (simple.cantidad, simple.precio_unitario, simple.total) == (1, 80000, 80000)
+
+
+def test_total_de_categoria_se_ajusta_por_delta():
+    categoria = Categoria(nombre='Jardín', mano_obra=10000)
+    a = Item(nombre='Pasto', cantidad=2, precio_unitario=500)
+    b = Item(nombre='Abono', cantidad=1, precio_unitario=300)
+    categoria.items.append(a)
+    categoria.items.append(b)
+    assert categoria.total == 1300 + 10000
+
+    a['cantidad'] = 4
+    assert categoria.total_items == 2300
+    categoria.items.remove(b)
+    assert categoria.total_items == 2000
+    categoria.items[0] = Item(nombre='Pasto', cantidad=1, precio_unitario=700)
+    assert categoria.total_items == 700
+    assert categoria.total_items == Categoria(items=list(categoria.items)).recalcular()
+
+
+def test_total_categorias_acepta_dicts_y_modelo():
+    categorias = {
+        'general': {'items': [{'nombre': 'Flete', 'total': 20000, 'es_trabajo_simple': True}], 'mano_obra': 5000},
+        'Riego': Categoria(items=[Item(nombre='Gotero', cantidad=10, precio_unitario=150)]),
+    }
+    assert total_categorias(categorias) == 20000 + 5000 + 1500
+    assert total_categorias({}) == 0
+
+
+def test_filas_agrega_mano_de_obra_sin_mutar_items():
+    categoria = Categoria(items=[Item(nombre='Pasto', cantidad=1, precio_unitario=100)], mano_obra=900)
+    filas = categoria.filas()
+    assert [f.tipo for f in filas][-1] == TIPO_MANO_OBRA
+    assert len(categoria.items) == 1
+
+
+def test_pickle_conserva_totales():
+    categorias = normalizar_categorias({'Muros': {'items': [{'nombre': 'Ladrillo', 'cantidad': 5, 'precio_unitario': 200}]}})
+    copia = pickle.loads(pickle.dumps(categorias))
+    assert copia['Muros'].total == 1000
+    assert copia['Muros'].items[0].posicion == 0
+
+
+# ==================== REORDENAMIENTO ====================
+def _categoria(*nombres):
+    return normalizar_categorias({'A': {'items': [{'nombre': n, 'cantidad': 1, 'precio_unitario': 100} for n in nombres]}})['A']
+
+
+def _orden(categoria):
+    return [(it.nombre, it.posicion) for it in categoria.items]
+
+
+def test_mover_item_solo_toca_los_dos_vecinos():
+    categoria = _categoria('a', 'b', 'c')
+    cambiados = mover_item(categoria, 2, -1)
+    assert [it.nombre for it in cambiados] == ['c', 'b']
+    assert _orden(categoria) == [('a', 0), ('c', 1), ('b', 2)]
+    assert mover_item(categoria, 0, -1) == []
+    assert categoria.total_items == 300
+
+
+def test_mover_a_categoria_renumera_el_origen():
+    categorias = {'A': _categoria('a', 'b', 'c')}
+    cambiados = mover_a_categoria(categorias, 'A', 0, 'B')
+    assert [it.nombre for it in cambiados] == ['a', 'b', 'c']
+    assert _orden(categorias['A']) == [('b', 0), ('c', 1)]
+    assert _orden(categorias['B']) == [('a', 0)]
+    assert categorias['B'].items[0].categoria == 'B'
+    assert (categorias['A'].total_items, categorias['B'].total_items) == (200, 100)
+
+
+def test_eliminar_item_devuelve_solo_los_siguientes():
+    categoria = _categoria('a', 'b', 'c', 'd')
+    eliminado, cambiados = eliminar_item(categoria, 1)
+    assert eliminado.nombre == 'b'
+    assert [it.nombre for it in cambiados] == ['c', 'd']
+    assert _orden(categoria) == [('a', 0), ('c', 1), ('d', 2)]
+    assert eliminar_item(categoria, 2)[1] == []
+
+
+def test_normalizar_respeta_posiciones_guardadas():
+    categorias = normalizar_categorias({'A': {'items': [
+        {'nombre': 'c', 'posicion': 7}, {'nombre': 'a', 'posicion': 1}, {'nombre': 'b', 'posicion': 4},
+    ]}})
+    assert _orden(categorias['A']) == [('a', 0), ('b', 1), ('c', 2)]
+    assert renumerar_posiciones(categorias['A'].items) == []
+
+
+# ==================== DIFERENCIAS AL GUARDAR EN SU LUGAR ====================
+CATEGORIAS_MAP = {'muros': 1, 'pisos': 2}
+
+
+def _guardadas():
+    """Filas como las devuelve la BD y las categorías cargadas a partir de ellas."""
+    originales = [
+        {'id': 10, 'categoria_id': 1, 'nombre_personalizado': 'Ladrillo', 'unidad': 'Unidad',
+         'cantidad': 100, 'precio_unitario': 250.0, 'notas': ''},
+        {'id': 11, 'categoria_id': 1, 'nombre_personalizado': 'Cemento', 'unidad': 'Saco',
+         'cantidad': 5, 'precio_unitario': 6000.0, 'notas': ''},
+        {'id': 12, 'categoria_id': 1, 'nombre_personalizado': 'Mano de Obra', 'unidad': 'Unidad',
+         'cantidad': 1, 'precio_unitario': 40000.0, 'notas': 'Mano de Obra'},
+    ]
+    categorias = normalizar_categorias({'Muros': {
+        'items': [
+            {'nombre': 'Ladrillo', 'unidad': 'Unidad', 'cantidad': 100, 'precio_unitario': 250, 'db_id': 10},
+            {'nombre': 'Cemento', 'unidad': 'Saco', 'cantidad': 5, 'precio_unitario': 6000, 'db_id': 11},
+        ],
+        'mano_obra': 40000,
+    }})
+    return originales, categorias
+
+
+def test_diff_sin_cambios_no_envia_nada():
+    originales, categorias = _guardadas()
+    enviar, borrar = diff_filas(originales, filas_db_por_item(categorias, 7, CATEGORIAS_MAP))
+    assert (enviar, borrar) == ([], [])
+
+
+def test_diff_envia_solo_altas_y_modificaciones():
+    originales, categorias = _guardadas()
+    muros = categorias['Muros']
+    muros.items[0]['cantidad'] = 120
+    muros.items.pop(1)
+    muros.items.append(Item(nombre='Arena', unidad='m3', cantidad=2, precio_unitario=15000))
+    muros.mano_obra = 45000
+
+    enviar, borrar = diff_filas(originales, filas_db_por_item(categorias, 7, CATEGORIAS_MAP))
+
+    assert [(fila.get('id'), fila['nombre_personalizado']) for _, fila in enviar] == [
+        (10, 'Ladrillo'), (None, 'Arena'), (12, 'Mano de Obra')]
+    assert borrar == [11]
+
+
+def test_diff_detecta_cambio_de_categoria():
+    originales, categorias = _guardadas()
+    mover_a_categoria(categorias, 'Muros', 0, 'Pisos')
+    enviar, borrar = diff_filas(originales, filas_db_por_item(categorias, 7, CATEGORIAS_MAP))
+    assert [(fila['id'], fila['categoria_id']) for _, fila in enviar] == [(10, 2)]
+    assert borrar == []
+
+
+# ==================== VERSIONES ====================
+def _fila(fila_id, nombre, cantidad, precio=1000.0):
+    return {'id': fila_id, 'categoria_id': 1, 'nombre_personalizado': nombre, 'unidad': 'Unidad',
+            'cantidad': cantidad, 'precio_unitario': precio, 'notas': ''}
+
+
+V1 = [_fila(1, 'Pasto', 10), _fila(2, 'Tierra', 3)]
+V2 = [_fila(1, 'Pasto', 12), _fila(3, 'Abono', 1)]
+V3 = [_fila(1, 'Pasto', 12, 900.0), _fila(3, 'Abono', 1), _fila(4, 'Riego', 2)]
+
+
+def _versiones():
+    anteriores, versiones = [], []
+    for numero, filas in enumerate((V1, V2, V3), start=1):
+        versiones.append({'numero': numero, 'delta': delta_filas(anteriores, filas)})
+        anteriores = filas
+    return versiones
+
+
+def test_delta_guarda_solo_campos_cambiados():
+    delta = delta_filas(V1, V2)
+    assert delta['modificados'] == [{'id': 1, 'cantidad': 12}]
+    assert [fila['id'] for fila in delta['agregados']] == [3]
+    assert delta['eliminados'] == [2]
+    assert delta_filas(V2, V2) == {'agregados': [], 'modificados': [], 'eliminados': []}
+
+
+def test_reconstruir_cada_version():
+    versiones = _versiones()
+    for numero, esperadas in enumerate((V1, V2, V3), start=1):
+        reconstruidas = sorted(reconstruir_version(versiones, numero), key=lambda f: f['id'])
+        assert reconstruidas == sorted(esperadas, key=lambda f: f['id'])
+
+
+def test_diff_versiones_marca_el_estado():
+    estados = {(fila['estado'], fila['id']) for fila in diff_versiones(V1, V3)}
+    assert estados == {('modificado', 1), ('eliminado', 2), ('agregado', 3), ('agregado', 4)}
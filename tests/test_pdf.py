@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+pytest.importorskip("fpdf")
+pytest.importorskip("streamlit")
+
+from benchmarks.corpus import CASOS, ESTADOS_CUENTA  # noqa: E402
+from utils import pdf  # noqa: E402
+
+
+@pytest.mark.parametrize("nombre", [n for n in CASOS if n not in ESTADOS_CUENTA])
+def test_generar_pdf_presupuesto(nombre):
+    ruta = pdf.generar_pdf(**CASOS[nombre]())
+    try:
+        with open(ruta, "rb") as f:
+            assert f.read(5) == b"%PDF-"
+    finally:
+        os.unlink(ruta)
+    assert pdf.INFORMES_PDF[-1]["paginas"] >= 1
+
+
+@pytest.mark.parametrize("nombre", list(ESTADOS_CUENTA))
+def test_generar_pdf_estado_cuenta(nombre):
+    datos, file_name = pdf.generar_pdf_estado_cuenta(**CASOS[nombre]())
+    assert datos.startswith(b"%PDF-")
+    assert file_name.startswith("Estado_Cuenta_")
+
+
+def test_presupuesto_grande_repite_encabezado_de_tabla(monkeypatch):
+    monkeypatch.setattr(pdf, "COMPRIMIR_PDF", False)
+    ruta = pdf.generar_pdf(**CASOS["presupuesto_20cat_500items"]())
+    try:
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+    finally:
+        os.unlink(ruta)
+    paginas = pdf.INFORMES_PDF[-1]["paginas"]
+    assert paginas > 1
+    # Un encabezado por categoría más uno por cada salto de página dentro de una tabla
+    assert contenido.count(b"(Precio Unitario)") >= 20 + (paginas - 1) - 1
+
+
+def test_color_se_reemite_al_salir_de_local_context(monkeypatch):
+    monkeypatch.setattr(pdf, "COMPRIMIR_PDF", False)
+    doc = pdf.DocumentoPDF()
+    doc.add_page()
+    doc.set_draw_color(200, 0, 0)
+    with doc.local_context(draw_color=0):
+        doc.line(10, 10, 50, 10)
+    # Al salir FPDF restaura el rojo; volver al negro debe escribirse
+    doc.set_draw_color(0)
+    doc.line(10, 20, 50, 20)
+    lineas = bytes(doc.output()).split(b"\n")
+    assert lineas.count(b"0 G") == 2
+
+
+@pytest.mark.parametrize("nombre", list(CASOS))
+def test_mismos_datos_mismos_bytes(nombre):
+    def dibujar():
+        if nombre in ESTADOS_CUENTA:
+            return pdf.generar_pdf_estado_cuenta(**CASOS[nombre]())[0]
+        ruta = pdf.generar_pdf(**CASOS[nombre](), fecha="2024-12-31")
+        try:
+            with open(ruta, "rb") as f:
+                return f.read()
+        finally:
+            os.unlink(ruta)
+
+    primero = dibujar()
+    assert dibujar() == primero
+    assert pdf.INFORMES_PDF[-1]["sha256"] == pdf.INFORMES_PDF[-2]["sha256"]
+
+
+def test_pdf_estado_cuenta_guardado(monkeypatch):
+    estado = {
+        'id': 9, 'fecha_emision': '2024-05-02', 'abono_monto': 1000, 'total_neto': 5000,
+        'cliente': {'nombre': 'Cliente'}, 'lugar_trabajo': {'nombre': 'Lugar'},
+        'detalles_estado_cuenta': [{'descripcion': 'Mantención', 'monto': 6000}],
+    }
+    monkeypatch.setattr(pdf, "get_estado_cuenta_detallado", lambda estado_id: estado)
+
+    datos, file_name, ok = pdf.pdf_estado_cuenta(9)
+    assert ok and datos.startswith(b"%PDF-") and file_name.startswith("Estado_Cuenta_")
+
+    version = pdf._version_estado_cuenta(estado)
+    assert pdf._version_estado_cuenta(dict(reversed(list(estado.items())))) == version
+    estado['detalles_estado_cuenta'][0]['monto'] = 7000
+    assert pdf._version_estado_cuenta(estado) != version
+
+
+def test_cola_render_no_olvida_trabajos_pendientes(monkeypatch):
+    import threading
+
+    monkeypatch.setattr(pdf, "MAX_TRABAJOS_GUARDADOS", 2)
+    cola = pdf.ColaRender(max_concurrentes=1)
+    liberar = threading.Event()
+    pendiente = cola.enviar(liberar.wait)
+    for _ in range(3):
+        cola.enviar(lambda: b"%PDF-")
+
+    assert cola.estado(pendiente)[0] == pdf.PENDIENTE
+    liberar.set()
+    assert cola._pool.submit(lambda: None).result(timeout=5) is None
+    assert cola.estado(pendiente)[0] == pdf.LISTO
@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.db import get_supabase_client 
+from utils.db import get_supabase_client, descartar_items
 
 def check_login() -> bool:
     """Verifica si el usuario está logueado."""
@@ -84,6 +84,7 @@ def sign_out():
     for key in keys_to_remove:
         if key in st.session_state:
             del st.session_state[key]
+    descartar_items()  # cambios de ítems sin guardar del editor
             
     # Limpiar estados de expanders
     for key in list(st.session_state.keys()):
@@ -6,6 +6,7 @@ import streamlit as st
 from datetime import datetime
 from typing import Dict, Any, Optional
 import uuid
+from utils.items import categorias_a_dict
 
 class AutoSaveManager:
     def __init__(self, user_id: str = None, draft_key: str = "draft_presupuesto"):
@@ -137,15 +138,17 @@ class AutoSaveManager:
 
 def capture_current_state() -> Dict[str, Any]:
     """Captura el estado actual del presupuesto"""
+    # Las categorías viven en session_state como objetos del modelo; el borrador es JSON
+    categorias = categorias_a_dict(st.session_state.get('categorias', {}))
     state = {
         "cliente_id": st.session_state.get('cliente_id'),
         "lugar_trabajo_id": st.session_state.get('lugar_trabajo_id'),
         "descripcion": st.session_state.get('descripcion', ''),
         "cliente_nombre": st.session_state.get('cliente_nombre', ''),
         "lugar_nombre": st.session_state.get('lugar_nombre', ''),
-        "items_data": st.session_state.get('items_data', {}),
-        "categorias": st.session_state.get('categorias', {}),
-        "categorías": st.session_state.get('categorias', {}),
+        "items_data": categorias_a_dict(st.session_state.get('items_data', {})),
+        "categorias": categorias,
+        "categorías": categorias,
         "trabajos_simples": st.session_state.get('trabajos_simples', [])
     }
     return state
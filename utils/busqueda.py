@@ -0,0 +1,94 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# ==================== ÍNDICE DE BÚSQUEDA ====================
+# Búsqueda en memoria para clientes y lugares: sin acentos ni mayúsculas,
+# por prefijo de palabra y por trigramas (tolera texto en medio del nombre
+# y pequeños errores). Se construye una vez por lista de entidades.
+
+_MAX_PREFIJO = 12
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin acentos y con espacios simples: 'Peñalolén ' -> 'penalolen'."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _trigramas(texto: str) -> Set[str]:
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceBusqueda:
+    """Índice de (id, nombre) con resultados ordenados por relevancia."""
+
+    __slots__ = ('entidades', '_normalizados', '_prefijos', '_trigramas')
+
+    def __init__(self, entidades: Iterable[Tuple[int, str]]):
+        self.entidades: List[Tuple[int, str]] = list(entidades)
+        self._normalizados: List[str] = []
+        self._prefijos: Dict[str, Set[int]] = {}
+        self._trigramas: Dict[str, Set[int]] = {}
+
+        for pos, (_, nombre) in enumerate(self.entidades):
+            normalizado = normalizar_texto(nombre)
+            self._normalizados.append(normalizado)
+            for palabra in normalizado.split():
+                for largo in range(1, min(len(palabra), _MAX_PREFIJO) + 1):
+                    self._prefijos.setdefault(palabra[:largo], set()).add(pos)
+            for trigrama in _trigramas(normalizado):
+                self._trigramas.setdefault(trigrama, set()).add(pos)
+
+    def _por_prefijos(self, palabras: List[str]) -> Set[int]:
+        """Entidades donde cada palabra buscada es prefijo de alguna palabra del nombre."""
+        candidatos: Optional[Set[int]] = None
+        for palabra in palabras:
+            encontrados = self._prefijos.get(palabra[:_MAX_PREFIJO], set())
+            if len(palabra) > _MAX_PREFIJO:
+                encontrados = {pos for pos in encontrados
+                               if any(p.startswith(palabra) for p in self._normalizados[pos].split())}
+            candidatos = encontrados if candidatos is None else candidatos & encontrados
+            if not candidatos:
+                return set()
+        return candidatos or set()
+
+    def buscar(self, consulta: str, limite: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Devuelve las entidades que coinciden, de más a menos relevante:
+        nombre exacto, nombre que empieza igual, prefijos de palabra, texto
+        contenido y, por último, parecido por trigramas. Sin consulta devuelve todo.
+        """
+        consulta = normalizar_texto(consulta)
+        if not consulta:
+            return self.entidades[:limite] if limite else list(self.entidades)
+
+        puntajes: Dict[int, float] = {}
+        for pos in self._por_prefijos(consulta.split()):
+            nombre = self._normalizados[pos]
+            puntajes[pos] = 0 if nombre == consulta else 1 if nombre.startswith(consulta) else 2
+
+        if len(consulta) >= 3:
+            tri_consulta = _trigramas(consulta)
+            conteo: Dict[int, int] = {}
+            for trigrama in tri_consulta:
+                for pos in self._trigramas.get(trigrama, ()):
+                    conteo[pos] = conteo.get(pos, 0) + 1
+            for pos, comunes in conteo.items():
+                if pos in puntajes:
+                    continue
+                if consulta in self._normalizados[pos]:
+                    puntajes[pos] = 3
+                else:
+                    similitud = comunes / len(tri_consulta)
+                    if similitud >= 0.5:
+                        puntajes[pos] = 4 - similitud
+
+        orden = sorted(puntajes, key=lambda pos: (puntajes[pos], len(self._normalizados[pos]), self._normalizados[pos]))
+        if limite:
+            orden = orden[:limite]
+        return [self.entidades[pos] for pos in orden]
+
+    def __len__(self) -> int:
+        return len(self.entidades)
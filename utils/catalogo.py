@@ -0,0 +1,130 @@
+import statistics
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import streamlit as st
+
+from utils.busqueda import IndiceBusqueda, normalizar_texto
+from utils.db import get_supabase_client, paginas_consulta
+from utils.items import NOMBRE_MANO_OBRA
+
+# ==================== CATÁLOGO DE PRECIOS ====================
+# Sugerencias de ítems a partir del historial del usuario en
+# 'items_en_presupuesto': último precio y mediana por (nombre, unidad).
+# Se carga una vez por usuario (por páginas) y, al guardar, se reemplazan en
+# memoria solo los precios del presupuesto guardado. Cada precio se guarda
+# por id de ítem, así volver a guardar un presupuesto no lo duplica.
+
+_MAX_PRECIOS = 50  # precios recientes guardados por entrada (para la mediana)
+_COLUMNAS = 'id, presupuesto_id, nombre_personalizado, unidad, precio_unitario'
+
+
+class EntradaCatalogo:
+    """Un (nombre, unidad) del historial con sus precios recientes por id de ítem."""
+
+    __slots__ = ('nombre', 'unidad', 'precios')
+
+    def __init__(self, nombre: str, unidad: str):
+        self.nombre = nombre
+        self.unidad = unidad
+        self.precios: Dict[Any, float] = {}  # id de ítem -> precio, en orden cronológico
+
+    @property
+    def ultimo_precio(self) -> float:
+        return next(reversed(self.precios.values())) if self.precios else 0
+
+    @property
+    def mediana(self) -> float:
+        return statistics.median(self.precios.values()) if self.precios else 0
+
+    @property
+    def usos(self) -> int:
+        return len(self.precios)
+
+
+class CatalogoPrecios:
+    """Catálogo por usuario con búsqueda por prefijo (reutiliza IndiceBusqueda)."""
+
+    def __init__(self):
+        self._entradas: Dict[Tuple[str, str], EntradaCatalogo] = {}
+        self._lista: List[EntradaCatalogo] = []
+        self._indice: Optional[IndiceBusqueda] = None
+        # presupuesto_id -> [(entrada, id de ítem)] para reemplazar sus precios al volver a guardarlo
+        self._por_presupuesto: Dict[Any, List[Tuple[EntradaCatalogo, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, filas: Iterable[Dict[str, Any]]) -> None:
+        for fila in filas:
+            nombre = (fila.get('nombre_personalizado') or fila.get('nombre') or '').strip()
+            precio = fila.get('precio_unitario') or 0
+            if not nombre or precio <= 0 or nombre.lower() == NOMBRE_MANO_OBRA.lower():
+                continue
+            unidad = fila.get('unidad') or 'Unidad'
+            clave = (normalizar_texto(nombre), unidad)
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                entrada = self._entradas[clave] = EntradaCatalogo(nombre, unidad)
+                self._lista.append(entrada)
+                self._indice = None  # hay nombres nuevos: reconstruir al buscar
+
+            item_id = fila['id']
+            entrada.precios.pop(item_id, None)  # si ya estaba, pasa a ser el más reciente
+            entrada.precios[item_id] = float(precio)
+            while len(entrada.precios) > _MAX_PRECIOS:
+                del entrada.precios[next(iter(entrada.precios))]
+            self._por_presupuesto.setdefault(fila.get('presupuesto_id'), []).append((entrada, item_id))
+
+    def agregar(self, filas: Iterable[Dict[str, Any]]) -> None:
+        """Incorpora filas (id, presupuesto_id, nombre_personalizado, unidad, precio_unitario) en orden cronológico."""
+        with self._lock:
+            self._agregar(filas)
+
+    def reemplazar_presupuesto(self, presupuesto_id: Any, filas: Iterable[Dict[str, Any]]) -> None:
+        """Quita los precios anteriores de un presupuesto y agrega los actuales."""
+        with self._lock:
+            for entrada, item_id in self._por_presupuesto.pop(presupuesto_id, []):
+                entrada.precios.pop(item_id, None)
+            self._agregar(filas)
+
+    def buscar(self, consulta: str, limite: int = 8) -> List[EntradaCatalogo]:
+        """Entradas que coinciden con la consulta, de más a menos relevante."""
+        if not consulta or not consulta.strip():
+            return []
+        with self._lock:
+            if self._indice is None:
+                self._indice = IndiceBusqueda((i, e.nombre) for i, e in enumerate(self._lista))
+            return [self._lista[i] for i, _ in self._indice.buscar(consulta, limite=limite)]
+
+    def __len__(self) -> int:
+        return len(self._lista)
+
+
+@st.cache_resource(ttl=3600, max_entries=100)
+def get_catalogo_precios(user_id: str) -> CatalogoPrecios:
+    """Catálogo del usuario, construido leyendo su historial completo por páginas."""
+    catalogo = CatalogoPrecios()
+    supabase = get_supabase_client()
+
+    def consulta():
+        return supabase.from_('items_en_presupuesto').select(
+            f'{_COLUMNAS}, presupuesto:presupuesto_id!inner(creado_por)'
+        ).eq('presupuesto.creado_por', user_id).order('id')
+
+    # Sin try: si una página falla, la excepción evita que st.cache_resource
+    # guarde un catálogo incompleto y el próximo rerun vuelve a cargarlo
+    for pagina in paginas_consulta(consulta):
+        catalogo.agregar(pagina)
+    return catalogo
+
+
+def actualizar_catalogo_precios(user_id: str, presupuesto_id: int) -> None:
+    """Reemplaza en el catálogo en memoria los precios de un presupuesto recién guardado."""
+    if not user_id or not presupuesto_id:
+        return
+    try:
+        catalogo = get_catalogo_precios(user_id)
+        response = get_supabase_client().from_('items_en_presupuesto').select(_COLUMNAS) \
+            .eq('presupuesto_id', presupuesto_id).order('id').execute()
+        catalogo.reemplazar_presupuesto(presupuesto_id, response.data or [])
+    except Exception as e:
+        print(f"Error al actualizar catálogo de precios: {e}")
@@ -6,13 +6,32 @@ from functools import partial
 from typing import Any, Callable, Dict, List, Tuple, Optional
 # 🚨 IMPORTANTE: Asegúrate que el nombre del archivo de la DB sea 'db.py'
 from utils.db import (
+    DirectorioEntidades,
     create_categoria, 
-    get_categorias, 
-    get_clientes, 
+    get_directorio_categorias, 
+    get_directorio_clientes, 
     create_cliente, 
-    get_lugares_trabajo, 
-    create_lugar_trabajo
+    get_directorio_lugares, 
+    get_indice_clientes,
+    get_indice_lugares,
+    create_lugar_trabajo,
+    get_plantillas,
+    save_plantilla,
+    delete_plantilla,
+    limpiar_caches
 )
+from utils.busqueda import IndiceBusqueda
+from utils.catalogo import get_catalogo_precios
+from utils.items import (
+    Categoria, Item, TIPO_NORMAL, normalizar_categorias,
+    mover_item, mover_a_categoria, eliminar_item, renumerar_posiciones,
+    instanciar_plantilla
+)
+
+# Sobre este número de entidades los selectores muestran un buscador
+LIMITE_OPCIONES = 50
+
+UNIDADES = ["m²", "m³", "Unidad", "Metro lineal", "Saco", "Metro", "Caja", "Kilo (kg)", "Galón (gal)", "Litro", "Par/Juego", "Plancha", "Hora"]
 
 # ==================== UTILIDADES DE COMPONENTES ====================
 def _call_db_upsert(item: Dict[str, Any]) -> None:
@@ -23,10 +42,10 @@ def _call_db_upsert(item: Dict[str, Any]) -> None:
         # no hay upsert_item o falla: ignorar (estado en memoria seguirá)
         pass
 
-def _call_db_delete(item_id: Any) -> None:
+def _call_db_delete(item: Any) -> None:
     try:
         from utils.db import delete_item
-        delete_item(item_id)
+        delete_item(item)
     except Exception:
         pass
 
@@ -37,31 +56,15 @@ def _call_db_reindex(presupuesto_id: Optional[int], all_items: List[Dict[str, An
     except Exception:
         pass
 
-def safe_numeric_value(value):
-    """Convierte un valor a float de forma segura, o devuelve 0 si falla. Útil para totales."""
-    try:
-        if value is None:
-            return 0.0
-        return float(value)
-    except (ValueError, TypeError):
-        return 0.0
 # ----------------------------
 # UTIL: asegurar ids y posicion en todas las categorias
 # ----------------------------
 def ensure_ids_and_positions(categorias: Dict[str, Any]) -> None:
     """
     Asegura que cada item tenga 'id' y 'posicion'. Modifica in-place.
+    Convierte categorías e ítems al modelo compacto de utils.items.
     """
-    for cat_nombre, data in categorias.items():
-        items = data.setdefault('items', [])
-        # Asignar IDs y posiciones si faltan
-        for i, item in enumerate(items):
-            if 'id' not in item:
-                item['id'] = str(uuid.uuid4())
-            if 'posicion' not in item:
-                item['posicion'] = i
-        # Ordenar por posicion
-        items.sort(key=lambda it: int(it.get('posicion', 0)))
+    normalizar_categorias(categorias)
 
 # ----------------------------
 # FUNCION: agregar item normal (se llama desde UI de agregar)
@@ -71,18 +74,16 @@ def add_item_to_category(categorias: Dict[str, Any], categoria_nombre: str, nuev
     Inserta nuevo_item al final de la categoria y actualiza posiciones.
     nuevo_item debe contener: nombre_personalizado, unidad (o None), cantidad (or None), precio_unitario (or None), total, notas, tipo
     """
-    if categoria_nombre not in categorias:
-        categorias[categoria_nombre] = {'categoria_id': None, 'items': [], 'mano_obra': 0}
-    items = categorias[categoria_nombre]['items']
-    # asignar id y posicion
-    if 'id' not in nuevo_item:
-        nuevo_item['id'] = str(uuid.uuid4())
-    nuevo_item['posicion'] = len(items)
-    items.append(nuevo_item)
+    categoria = Categoria.from_dict(categorias.get(categoria_nombre) or {}, categoria_nombre)
+    categorias[categoria_nombre] = categoria
+    # normalizar, asignar id y posicion
+    item = Item.from_dict(nuevo_item, categoria_nombre)
+    item.posicion = len(categoria.items)
+    categoria.items.append(item)
     # persistir si corresponde
     if persist_db:
         try:
-            _call_db_upsert(nuevo_item)
+            _call_db_upsert(item)
         except Exception:
             pass
 
@@ -102,14 +103,24 @@ def clean_integer_input(value: str) -> int:
     cleaned = ''.join(filter(str.isdigit, str(value)))
     return int(cleaned) if cleaned else 0
 
-def _selector_entidad(datos: List[Tuple[int, str]], label: str, key: str, btn_nuevo: str, modal_title: str, placeholder_nombre: str, funcion_creacion: callable, user_id: str, mostrar_boton: bool = True) -> Optional[int]:
+def _selector_entidad(datos: DirectorioEntidades, label: str, key: str, btn_nuevo: str, modal_title: str, placeholder_nombre: str, funcion_creacion: callable, user_id: str, mostrar_boton: bool = True, indice: Optional[IndiceBusqueda] = None) -> Optional[int]:
     """Componente genérico para seleccionar/crear entidades con popover siempre activo."""
     
     if not user_id:
         st.error("❌ Error interno: ID de usuario no disponible.")
         return None
     
-    opciones_display = ["(Seleccione)"] + [nombre for _, nombre in datos]
+    if indice is not None and len(indice) > LIMITE_OPCIONES:
+        # Listas largas: buscar primero y mostrar solo los mejores resultados
+        consulta = st.text_input(f"Buscar {label}", key=f"{key}_buscar", placeholder=f"🔍 Buscar {label}...", label_visibility="collapsed")
+        nombres = [nombre for _, nombre in indice.buscar(consulta, limite=LIMITE_OPCIONES)]
+        # Mantener la selección actual aunque no esté entre los resultados
+        actual = st.session_state.get(f"{key}_selector")
+        if actual and actual != "(Seleccione)" and actual not in nombres:
+            nombres.insert(0, actual)
+        opciones_display = ["(Seleccione)"] + nombres
+    else:
+        opciones_display = ["(Seleccione)"] + datos.nombres
     
     # 1. Selector principal
     entidad_nombre_seleccionada = st.selectbox(
@@ -122,7 +133,7 @@ def _selector_entidad(datos: List[Tuple[int, str]], label: str, key: str, btn_nu
     entidad_id = None
     if entidad_nombre_seleccionada and entidad_nombre_seleccionada != "(Seleccione)":
         # Buscar el ID basado en el nombre seleccionado
-        entidad_id = next((id for id, nombre in datos if nombre == entidad_nombre_seleccionada), None)
+        entidad_id = datos.id_de(entidad_nombre_seleccionada)
     
     # 2. Popover SIEMPRE ACTIVO - sin botón para abrirlo/cerrarlo
     with st.popover(modal_title, width='stretch'):
@@ -133,7 +144,7 @@ def _selector_entidad(datos: List[Tuple[int, str]], label: str, key: str, btn_nu
             if nombre_nuevo.strip():
                 new_id = funcion_creacion(nombre=nombre_nuevo.strip(), user_id=user_id)
                 if new_id:
-                    st.cache_data.clear()
+                    limpiar_caches()
                     st.toast("Creado Correctamente!", icon="✅")
                     st.rerun()  # Recargar para que el nuevo item aparezca en la lista
                 else:
@@ -151,8 +162,8 @@ def show_cliente_lugar_selector(user_id: str) -> Tuple[Optional[int], str, Optio
         return None, "", None, "", ""
     
     try:
-        clientes = get_clientes(user_id)
-        lugares = get_lugares_trabajo(user_id)
+        clientes = get_directorio_clientes(user_id)
+        lugares = get_directorio_lugares(user_id)
     except Exception as e:
         st.error(f"❌ Error cargando datos de entidades: {e}")
         return None, "", None, "", ""
@@ -169,7 +180,8 @@ def show_cliente_lugar_selector(user_id: str) -> Tuple[Optional[int], str, Optio
             modal_title="Nuevo Cliente",
             placeholder_nombre="Nombre de cliente",
             funcion_creacion=create_cliente,
-            user_id=user_id  # ← Asegúrate de incluir esto
+            user_id=user_id,  # ← Asegúrate de incluir esto
+            indice=get_indice_clientes(user_id)
         )
         
     with col2:
@@ -182,7 +194,8 @@ def show_cliente_lugar_selector(user_id: str) -> Tuple[Optional[int], str, Optio
             modal_title="Nuevo Lugar de Trabajo",
             placeholder_nombre="Nombre del lugar",
             funcion_creacion=create_lugar_trabajo,
-            user_id=user_id  # ← Asegúrate de incluir esto
+            user_id=user_id,  # ← Asegúrate de incluir esto
+            indice=get_indice_lugares(user_id)
         )
         
     with col3:
@@ -194,12 +207,12 @@ def show_cliente_lugar_selector(user_id: str) -> Tuple[Optional[int], str, Optio
                                    height=80)
 
     # Obtener nombres para el resumen o visualización
-    cliente_nombre = next((n for i, n in clientes if i == cliente_id), "(No Seleccionado)")
-    lugar_nombre = next((n for i, n in lugares if i == lugar_trabajo_id), "(No Seleccionado)")
+    cliente_nombre = clientes.nombre(cliente_id, "(No Seleccionado)")
+    lugar_nombre = lugares.nombre(lugar_trabajo_id, "(No Seleccionado)")
     
     return cliente_id, cliente_nombre, lugar_trabajo_id, lugar_nombre, descripcion
 
-def _selector_entidad_edicion(datos: List[Tuple[int, str]], label: str, key: str, 
+def _selector_entidad_edicion(datos: DirectorioEntidades, label: str, key: str, 
                             btn_nuevo: str, modal_title: str, placeholder_nombre: str,
                             funcion_creacion: Callable, user_id: str, 
                             valor_actual: Optional[int], nombre_actual: str) -> Optional[int]:
@@ -210,12 +223,12 @@ def _selector_entidad_edicion(datos: List[Tuple[int, str]], label: str, key: str
         return None
     
     # Crear opciones para el selectbox incluyendo el valor actual
-    opciones_display = ["(Seleccione)"] + [nombre for _, nombre in datos]
+    opciones_display = ["(Seleccione)"] + datos.nombres
     
     # Encontrar el índice del valor actual en las opciones
     indice_actual = 0  # Por defecto "(Seleccione)"
     if valor_actual:
-        nombre_actual = next((nombre for id_val, nombre in datos if id_val == valor_actual), None)
+        nombre_actual = datos.nombre(valor_actual)
         if nombre_actual and nombre_actual in opciones_display:
             indice_actual = opciones_display.index(nombre_actual)
     
@@ -231,7 +244,7 @@ def _selector_entidad_edicion(datos: List[Tuple[int, str]], label: str, key: str
     entidad_id = None
     if entidad_nombre_seleccionada and entidad_nombre_seleccionada != "(Seleccione)":
         # Buscar el ID basado en el nombre seleccionado
-        entidad_id = next((id for id, nombre in datos if nombre == entidad_nombre_seleccionada), None)
+        entidad_id = datos.id_de(entidad_nombre_seleccionada)
     
     # 2. Popover SIEMPRE ACTIVO para crear nueva entidad
     with st.popover(btn_nuevo, use_container_width=True):
@@ -243,7 +256,7 @@ def _selector_entidad_edicion(datos: List[Tuple[int, str]], label: str, key: str
                 try:
                     new_id = funcion_creacion(nombre=nombre_nuevo.strip(), user_id=user_id)
                     if new_id:
-                        st.cache_data.clear()
+                        limpiar_caches()
                         st.toast(f"✅ {label.capitalize()} creado correctamente!", icon="✅")
                         st.rerun()  # Recargar para que el nuevo item aparezca en la lista
                     else:
@@ -268,8 +281,8 @@ def show_cliente_lugar_selector_edicion(
         return None, "", None, "", ""
     
     try:
-        clientes = get_clientes(user_id)
-        lugares = get_lugares_trabajo(user_id)
+        clientes = get_directorio_clientes(user_id)
+        lugares = get_directorio_lugares(user_id)
     except Exception as e:
         st.error(f"❌ Error cargando datos de entidades: {e}")
         return None, "", None, "", ""
@@ -288,7 +301,7 @@ def show_cliente_lugar_selector_edicion(
             funcion_creacion=create_cliente,
             user_id=user_id,
             valor_actual=cliente_inicial_id,
-            nombre_actual=next((n for i, n in clientes if i == cliente_inicial_id), "(No Seleccionado)")
+            nombre_actual=clientes.nombre(cliente_inicial_id, "(No Seleccionado)")
         )
         
     with col2:
@@ -303,7 +316,7 @@ def show_cliente_lugar_selector_edicion(
             funcion_creacion=create_lugar_trabajo,
             user_id=user_id,
             valor_actual=lugar_inicial_id,
-            nombre_actual=next((n for i, n in lugares if i == lugar_inicial_id), "(No Seleccionado)")
+            nombre_actual=lugares.nombre(lugar_inicial_id, "(No Seleccionado)")
         )
         
     with col3:
@@ -316,11 +329,44 @@ def show_cliente_lugar_selector_edicion(
                                    height=80)
 
     # Obtener nombres actualizados para el resumen
-    cliente_nombre = next((n for i, n in clientes if i == cliente_id), "(No Seleccionado)")
-    lugar_nombre = next((n for i, n in lugares if i == lugar_trabajo_id), "(No Seleccionado)")
+    cliente_nombre = clientes.nombre(cliente_id, "(No Seleccionado)")
+    lugar_nombre = lugares.nombre(lugar_trabajo_id, "(No Seleccionado)")
     
     return cliente_id, cliente_nombre, lugar_trabajo_id, lugar_nombre, descripcion
 
+# ==================== PLANTILLAS ====================
+def show_plantillas(user_id: str) -> None:
+    """Cargar una plantilla guardada o guardar los ítems actuales como plantilla."""
+    with st.expander("📐 Plantillas", expanded=False):
+        col_usar, col_guardar = st.columns(2)
+
+        with col_usar:
+            plantillas = {p['nombre']: p for p in get_plantillas(user_id)}
+            if not plantillas:
+                st.caption("No hay plantillas guardadas.")
+            else:
+                nombre_sel = st.selectbox("Plantilla", list(plantillas.keys()), key="plantilla_seleccionada")
+                col_b1, col_b2 = st.columns(2)
+                if col_b1.button("📥 Usar plantilla", width='stretch', key="btn_usar_plantilla"):
+                    # Reemplaza los ítems actuales en una sola asignación
+                    st.session_state['categorias'] = instanciar_plantilla(plantillas[nombre_sel]['estructura'])
+                    st.session_state['items_data'] = st.session_state['categorias']
+                    st.toast(f"Plantilla '{nombre_sel}' cargada", icon="📐")
+                    st.rerun()
+                if col_b2.button("🗑️ Eliminar", width='stretch', key="btn_eliminar_plantilla"):
+                    if delete_plantilla(plantillas[nombre_sel]['id'], user_id):
+                        st.rerun()
+
+        with col_guardar:
+            nombre_nuevo = st.text_input("Nombre de la plantilla", placeholder="Ej: Mantención jardín 500m²", key="plantilla_nombre_nuevo")
+            categorias = st.session_state.get('categorias', {})
+            hay_items = any(data['items'] or data.get('mano_obra') for data in categorias.values())
+            if st.button("💾 Guardar como plantilla", width='stretch', disabled=not hay_items, key="btn_guardar_plantilla"):
+                if not nombre_nuevo.strip():
+                    st.error("⚠️ La plantilla necesita un nombre.")
+                elif save_plantilla(nombre_nuevo.strip(), user_id, categorias):
+                    st.toast("✅ Plantilla guardada", icon="📐")
+
 # ==================== SECCIÓN ITEMS Y CATEGORÍAS ====================
 def selector_categoria(user_id: str, mostrar_label: bool = True, requerido: bool = True, key_suffix: str = "", mostrar_boton_externo: bool = False) -> Tuple[Optional[int], Optional[str], bool]:
     """
@@ -332,7 +378,7 @@ def selector_categoria(user_id: str, mostrar_label: bool = True, requerido: bool
         return None, None, False
 
     try:
-        categorias = get_categorias(user_id)
+        categorias = get_directorio_categorias(user_id)
     except Exception as e:
         st.error(f"❌ Error cargando categorías: {e}")
         if requerido: st.stop()
@@ -354,7 +400,7 @@ def selector_categoria(user_id: str, mostrar_label: bool = True, requerido: bool
         mostrar_boton=False  # No mostrar botón ya que el popover está siempre activo
     )
     
-    categoria_nombre = next((n for i, n in categorias if i == categoria_id), "Sin Categoría (General)")
+    categoria_nombre = categorias.nombre(categoria_id, "Sin Categoría (General)")
     
     return categoria_id, categoria_nombre, False  # Siempre devolvemos False para modal_abierto ya que no usamos esa lógica
 
@@ -376,7 +422,65 @@ def show_items_presupuesto(user_id: str, is_editing: bool = False, persist_db: b
         st.session_state['categorias'] = {}
 
     ensure_ids_and_positions(st.session_state['categorias'])
+    _form_agregar_item(user_id, persist_db)
+    return st.session_state['categorias']
 
+# ==================== FRAGMENTOS ====================
+# Cada bloque de la UI de ítems corre como st.fragment: un cambio en sus widgets
+# re-ejecuta SOLO ese bloque. Dependencias explícitas entre fragmentos:
+#   - agregar ítem / trabajo simple, mover o borrar ítems: cambia la estructura
+#     que leen el editor, los formularios y el resumen -> _rerun_dependientes()
+#   - editar un campo de un ítem: solo el fragmento del editor, que muestra
+#     los totales acumulados de la categoría; el resumen se refresca en el
+#     siguiente rerun completo (guardar, agregar, mover, borrar).
+
+def _rerun_dependientes() -> None:
+    """Rerun de toda la página: el cambio afecta a otros fragmentos."""
+    st.rerun(scope="app")
+
+def _aplicar_sugerencia(sugerencias: Dict[str, Any]) -> None:
+    """Callback: copia nombre, unidad y precio de la sugerencia elegida al formulario."""
+    entrada = sugerencias.get(st.session_state.get('sugerencia_item_principal'))
+    if entrada is None:
+        return
+    st.session_state['nombre_item_principal'] = entrada.nombre
+    if entrada.unidad in UNIDADES:
+        st.session_state['unidad_principal'] = entrada.unidad
+    st.session_state['precio_principal'] = str(int(entrada.ultimo_precio))
+    st.session_state['sugerencia_item_principal'] = None
+
+def _sugerencias_catalogo(user_id: str, consulta: str) -> None:
+    """Sugerencias del historial de precios para el nombre que se está escribiendo."""
+    # _aplicar_sugerencia escribe el precio: su valor inicial va en session_state, no en value=
+    st.session_state.setdefault('precio_principal', "0")
+    if not consulta or len(consulta.strip()) < 2:
+        return
+    try:
+        encontradas = get_catalogo_precios(user_id).buscar(consulta)
+    except Exception as e:
+        # Sin catálogo se puede seguir escribiendo el ítem; el próximo rerun reintenta la carga
+        print(f"Error al cargar catálogo de precios: {e}")
+        return
+    sugerencias = {
+        f"{e.nombre} · {e.unidad} · ${e.ultimo_precio:,.0f} (mediana ${e.mediana:,.0f})".replace(",", "."): e
+        for e in encontradas
+    }
+    if not sugerencias:
+        return
+    st.selectbox(
+        "Sugerencias",
+        list(sugerencias.keys()),
+        index=None,
+        placeholder="💡 Usar un ítem anterior...",
+        key="sugerencia_item_principal",
+        on_change=_aplicar_sugerencia,
+        args=(sugerencias,),
+        label_visibility="collapsed",
+    )
+
+@st.fragment
+def _form_agregar_item(user_id: str, persist_db: bool = False) -> None:
+    """Formulario 'Agregar Ítem' aislado en su propio fragmento."""
     with st.container():
         st.markdown("#### 1️⃣ 📂 Categoría")
         # selector_categoria debe devolver (categoria_id, categoria_nombre, modal_abierto)
@@ -390,23 +494,24 @@ def show_items_presupuesto(user_id: str, is_editing: bool = False, persist_db: b
 
         if not categoria_id and not modal_abierto:
             st.warning("⚠️ Selecciona o crea una categoría para agregar ítems")
-            return st.session_state['categorias']
+            return
 
         st.markdown(f"#### 2️⃣ 📦 Agregar Ítems")
         col_nombre, col_unidad = st.columns(2)
         with col_nombre:
             nombre_item = st.text_input("Nombre del Ítem:", key="nombre_item_principal", placeholder="Ej: Plantas, Tierra, etc.")
+            _sugerencias_catalogo(user_id, nombre_item)
         with col_unidad:
             unidad = st.selectbox(
                 "Unidad:", 
-                ["m²", "m³", "Unidad", "Metro lineal", "Saco", "Metro", "Caja", "Kilo (kg)", "Galón (gal)", "Litro", "Par/Juego", "Plancha", "Hora"], 
+                UNIDADES, 
                 key="unidad_principal"
             )
         col_cantidad, col_precio, col_total = st.columns(3)
         with col_cantidad:
             cantidad = st.number_input("Cantidad:", min_value=1, value=1, step=1, key="cantidad_principal")
         with col_precio:
-            precio_input = st.text_input("Precio Unitario:", value="0", key="precio_principal", placeholder="Solo números")
+            precio_input = st.text_input("Precio Unitario:", key="precio_principal", placeholder="Solo números")
             precio_unitario = clean_integer_input(precio_input)
         with col_total:
             total = cantidad * precio_unitario
@@ -431,11 +536,56 @@ def show_items_presupuesto(user_id: str, is_editing: bool = False, persist_db: b
                     'tipo': 'normal'  # normal o trabajo_simple
                 }
                 add_item_to_category(st.session_state['categorias'], categoria_nombre, nuevo_item, persist_db=persist_db)
-                ensure_ids_and_positions(st.session_state['categorias'])
                 st.success(f"✅ Ítem '{nombre_item.strip()}' agregado a '{categoria_nombre}'")
-                st.rerun()
-
-    return st.session_state['categorias']
+                _rerun_dependientes()
+
+# ==================== REGISTRO DE ESTADO POR ÍTEM ====================
+# Todo el estado de widgets de un ítem vive en una entrada de
+# st.session_state['_registro_items'] indexada por su id. Las keys de los
+# widgets no llevan el índice, así que reordenar o mover no deja keys
+# huérfanas, y al desaparecer un ítem se borra todo su estado de una vez.
+_REGISTRO_ITEMS = '_registro_items'
+_PREFIJOS_WIDGET = ('name_input', 'unidad_select', 'cant_input', 'pre_input', 'total_input',
+                    'total_display', 'up', 'down', 'move', 'del')
+_WIDGETS_POR_CAMPO = {'nombre': ('name_input',), 'unidad': ('unidad_select',), 'cantidad': ('cant_input',),
+                      'precio_unitario': ('pre_input',), 'total': ('total_input', 'total_display')}
+
+def _estado_item(item: Item) -> Dict[str, Any]:
+    """Devuelve (creando o sincronizando) la entrada del registro para el ítem."""
+    registro = st.session_state.setdefault(_REGISTRO_ITEMS, {})
+    nombre = item.get('nombre_personalizado') or item.get('nombre', '')
+    actual = {
+        'nombre': nombre,
+        'unidad': item.get('unidad', 'Unidad'),
+        'cantidad': int(item.get('cantidad') or 0),
+        'precio_unitario': int(item.get('precio_unitario') or 0),
+        'total': int(item.get('total') or 0),
+    }
+    estado = registro.get(item['id'])
+    if estado is None:
+        estado = registro[item['id']] = actual
+    else:
+        # El modelo manda: cambios hechos fuera del editor (grilla, borrador).
+        # Se descarta el valor guardado del widget para que muestre el nuevo.
+        for campo, valor in actual.items():
+            if estado[campo] != valor and (valor or campo != 'nombre'):
+                estado[campo] = valor
+                for prefijo in _WIDGETS_POR_CAMPO[campo]:
+                    st.session_state.pop(f"{prefijo}_{item['id']}", None)
+    return estado
+
+def limpiar_registro_items(categorias: Dict[str, Any]) -> int:
+    """Elimina el estado de widgets de ítems que ya no existen. Devuelve cuántos se borraron."""
+    registro = st.session_state.get(_REGISTRO_ITEMS)
+    if not registro:
+        return 0
+    vivos = {item['id'] for data in categorias.values() for item in data['items']}
+    huerfanos = [item_id for item_id in registro if item_id not in vivos]
+    for item_id in huerfanos:
+        del registro[item_id]
+        for prefijo in _PREFIJOS_WIDGET:
+            st.session_state.pop(f"{prefijo}_{item_id}", None)
+    return len(huerfanos)
 
 def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db: bool = False) -> Dict[str, Any]:
     """
@@ -447,6 +597,7 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
         st.session_state['categorias'] = {}
 
     ensure_ids_and_positions(st.session_state['categorias'])
+    limpiar_registro_items(st.session_state['categorias'])
     categorias_a_mostrar = [cat for cat in st.session_state['categorias'] if st.session_state['categorias'][cat]['items']]
 
     if not categorias_a_mostrar:
@@ -454,8 +605,18 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
             st.info("📭 No hay ítems para editar")
         return st.session_state['categorias']
 
+    # Modo grilla: una st.data_editor por categoría en lugar de ~8 widgets por ítem
+    if st.toggle("🧮 Edición en grilla", key="editor_modo_grilla", help="Recomendado para presupuestos con muchos ítems"):
+        _editor_grilla(persist_db)
+    else:
+        _editor_items(persist_db)
+    return st.session_state['categorias']
+
+@st.fragment
+def _editor_items(persist_db: bool = False) -> None:
+    """Editor de ítems (fragmento): editar un campo re-ejecuta solo este bloque."""
     with st.expander("📝 Editar/Eliminar Ítems", expanded=True):
-        categoria_options = list(st.session_state['categorias'].keys()) + ["GENERAL"]
+        categoria_options = list(st.session_state['categorias'].keys())
 
         for cat_nombre in categoria_options:
             data = st.session_state['categorias'].get(cat_nombre)
@@ -471,73 +632,32 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
             col_h1.write("**Descripción**"); col_h2.write("**Unidad**"); col_h3.write("**Cant.**")
             col_h4.write("**P.Unit**"); col_h5.write("**Total**"); col_h6.write("**Orden**"); col_h7.write("**Mover**"); col_h8.write("**Borrar**")
 
-            items_cat.sort(key=lambda it: int(it.get('posicion', 0)))
-            
+            # posiciones densas: el orden de la lista ya es el orden de pantalla
             for idx, item in enumerate(list(items_cat)):
                 if "id" not in item or item["id"] in [None, "", 0]:
                     item["id"] = str(uuid.uuid4())
 
                 item_id = item["id"]
-                
-                # GENERAR UN SUFIJO ÚNICO PARA TODAS LAS KEYS
-                unique_suffix = f"{cat_nombre}_{item_id}_{idx}"
-
-                # INICIALIZACIÓN CORREGIDA DE TODOS LOS VALORES
-                # --------------------------------------------------
-                
-                # Nombre - INICIALIZACIÓN MEJORADA
-                name_key = f"name_{unique_suffix}"
-                nombre_valor = item.get('nombre_personalizado') or item.get('nombre', '')
-                if name_key not in st.session_state:
-                    st.session_state[name_key] = nombre_valor
-                elif st.session_state[name_key] != nombre_valor and nombre_valor:
-                    st.session_state[name_key] = nombre_valor
+                # Estado de widgets del ítem: una sola entrada en el registro, keys sin índice
+                estado = _estado_item(item)
 
                 # Asegurar que el item tenga el campo 'nombre' (REQUERIDO PARA LA BD)
-                if 'nombre' not in item or not item['nombre']:
-                    item['nombre'] = nombre_valor  # Usar el valor existente como nombre por defecto
-
-                # Unidad - INICIALIZACIÓN MEJORADA
-                unidad_key = f"unidad_{unique_suffix}"
-                unidad_valor = item.get('unidad', 'Unidad')
-                if unidad_key not in st.session_state:
-                    st.session_state[unidad_key] = unidad_valor
-                elif st.session_state[unidad_key] != unidad_valor:
-                    st.session_state[unidad_key] = unidad_valor
-
-                # Cantidad - INICIALIZACIÓN MEJORADA
-                cant_key = f"cant_{unique_suffix}"
-                cant_valor = int(item.get('cantidad') or 0)
-                if cant_key not in st.session_state:
-                    st.session_state[cant_key] = cant_valor
-                elif st.session_state[cant_key] != cant_valor:
-                    st.session_state[cant_key] = cant_valor
-
-                # Precio - INICIALIZACIÓN MEJORADA
-                pre_key = f"pre_{unique_suffix}"
-                pre_valor = int(item.get('precio_unitario') or 0)
-                if pre_key not in st.session_state:
-                    st.session_state[pre_key] = pre_valor
-
-                # Total - INICIALIZACIÓN MEJORADA
-                total_key = f"total_{unique_suffix}"
-                total_valor = int(item.get('total') or 0)
-                if total_key not in st.session_state:
-                    st.session_state[total_key] = total_valor
+                if not item.get('nombre'):
+                    item['nombre'] = estado['nombre']
 
                 # --------------------------------------------------
-                # RENDERIZADO DE COLUMNAS (igual pero con unique_suffix en todas las keys)
+                # RENDERIZADO DE COLUMNAS (keys estables por id de ítem)
                 col1, col2, col3, col4, col5, col6, col7, col8 = st.columns([2.5,1.5,1.2,1.5,1.5,0.8,0.8,0.8])
 
                 # NOMBRE - CORREGIDO
                 new_name = col1.text_input(
                     "Descripción",
-                    value=st.session_state[name_key],
-                    key=f"name_input_{unique_suffix}",  # USAR unique_suffix
+                    value=estado['nombre'],
+                    key=f"name_input_{item_id}",
                     label_visibility="collapsed"
                 )
-                if new_name != st.session_state[name_key]:
-                    st.session_state[name_key] = new_name
+                if new_name != estado['nombre']:
+                    estado['nombre'] = new_name
                     item['nombre_personalizado'] = new_name
                     # Asegurar que también se actualice el campo 'nombre' requerido
                     item['nombre'] = new_name
@@ -552,17 +672,17 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
 
                 if item.get('tipo', 'normal') != 'trabajo_simple':
                     # UNIDAD
-                    unidad_opts = ["m²", "m³", "Unidad", "Metro lineal", "Saco", "Metro", "Caja", "Kilo (kg)", "Galón (gal)", "Litro", "Par/Juego", "Plancha", "Hora"]
-                    current_unidad = st.session_state[unidad_key]
+                    unidad_opts = UNIDADES
+                    current_unidad = estado['unidad']
                     new_unidad = col2.selectbox(
                         "Unidad",
                         unidad_opts,
                         index=unidad_opts.index(current_unidad) if current_unidad in unidad_opts else 2,
-                        key=f"unidad_select_{unique_suffix}",  # USAR unique_suffix
+                        key=f"unidad_select_{item_id}",
                         label_visibility="collapsed"
                     )
                     if new_unidad != current_unidad:
-                        st.session_state[unidad_key] = new_unidad
+                        estado['unidad'] = new_unidad
                         item['unidad'] = new_unidad
                         if persist_db: 
                             _call_db_upsert(item)
@@ -572,28 +692,28 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
                         "Cantidad",
                         min_value=0,
                         step=1,
-                        value=st.session_state[cant_key],
-                        key=f"cant_input_{unique_suffix}",  # USAR unique_suffix
+                        value=estado['cantidad'],
+                        key=f"cant_input_{item_id}",
                         label_visibility="collapsed"
                     )
-                    if new_cant != st.session_state[cant_key]:
-                        st.session_state[cant_key] = new_cant
+                    if new_cant != estado['cantidad']:
+                        estado['cantidad'] = new_cant
                         item['cantidad'] = int(new_cant)
                         if item.get('precio_unitario') is not None:
                             try:
                                 item['total'] = int(item['cantidad']) * int(item.get('precio_unitario') or 0)
-                                st.session_state[total_key] = item['total']
+                                estado['total'] = item['total']
                             except Exception:
                                 item['total'] = item.get('total', 0)
                         if persist_db: 
                             _call_db_upsert(item)
 
                     # PRECIO UNITARIO
-                    precio_display = str(st.session_state[pre_key]) if st.session_state[pre_key] != 0 else ""
+                    precio_display = str(estado['precio_unitario']) if estado['precio_unitario'] != 0 else ""
                     new_pre_str = col4.text_input(
                         "Precio Unitario",
                         value=precio_display,
-                        key=f"pre_input_{unique_suffix}",  # USAR unique_suffix
+                        key=f"pre_input_{item_id}",
                         label_visibility="collapsed"
                     )
                     try:
@@ -601,11 +721,11 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
                     except:
                         new_pre = 0
                     
-                    if new_pre != st.session_state[pre_key]:
-                        st.session_state[pre_key] = new_pre
+                    if new_pre != estado['precio_unitario']:
+                        estado['precio_unitario'] = new_pre
                         item['precio_unitario'] = new_pre
                         item['total'] = int(item.get('cantidad') or 0) * new_pre
-                        st.session_state[total_key] = item['total']
+                        estado['total'] = item['total']
                         if persist_db: 
                             _call_db_upsert(item)
 
@@ -615,17 +735,17 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
                         "Total",
                         value=total_display,
                         disabled=True,
-                        key=f"total_display_{unique_suffix}",  # USAR unique_suffix
+                        key=f"total_display_{item_id}",
                         label_visibility="collapsed"
                     )
 
                 else:
                     # TRABAJO SIMPLE - CORREGIDO
-                    total_display = str(st.session_state[total_key]) if st.session_state[total_key] != 0 else ""
+                    total_display = str(estado['total']) if estado['total'] != 0 else ""
                     new_total_str = col5.text_input(
                         "Total",
                         value=total_display,
-                        key=f"total_input_{unique_suffix}",  # USAR unique_suffix
+                        key=f"total_input_{item_id}",
                         label_visibility="collapsed"
                     )
                     try:
@@ -633,103 +753,209 @@ def show_edited_presupuesto(user_id: str, is_editing: bool = False, persist_db:
                     except:
                         new_total = 0
 
-                    if new_total != st.session_state[total_key]:
-                        st.session_state[total_key] = new_total
+                    if new_total != estado['total']:
+                        estado['total'] = new_total
                         item['total'] = new_total
                         if persist_db: 
                             _call_db_upsert(item)
 
-                # reordenamiento (flechas)
+                # reordenamiento (flechas): solo cambian las posiciones de los dos ítems
                 with col6:
                     # Crear dos columnas dentro de col6 para poner las flechas lado a lado
                     col_up, col_down = st.columns(2)
                     
                     with col_up:
-                        if st.button("↑", key=f"up_{unique_suffix}", width='stretch'):  # USAR unique_suffix
-                            # buscar lista que contiene este item
-                            lista = st.session_state['categorias'][cat_nombre]['items']
-                            pos = idx
-                            if pos > 0:
-                                # swap posiciones
-                                lista[pos]['posicion'], lista[pos-1]['posicion'] = lista[pos-1].get('posicion', pos-1), lista[pos].get('posicion', pos)
-                                lista[pos], lista[pos-1] = lista[pos-1], lista[pos]
-                                ensure_ids_and_positions(st.session_state['categorias'])
-                                # persist reindex if necesario
-                                if persist_db: _call_db_reindex(None, sum((c['items'] for c in st.session_state['categorias'].values()), []))
-                                st.rerun()
+                        if st.button("↑", key=f"up_{item_id}", width='stretch'):
+                            cambiados = mover_item(data, idx, -1)
+                            if cambiados:
+                                if persist_db: _call_db_reindex(None, cambiados)
+                                _rerun_dependientes()
                     
                     with col_down:
-                        if st.button("↓", key=f"down_{unique_suffix}", width='stretch'):  # USAR unique_suffix
-                            lista = st.session_state['categorias'][cat_nombre]['items']
-                            pos = idx
-                            if pos < len(lista)-1:
-                                lista[pos]['posicion'], lista[pos+1]['posicion'] = lista[pos+1].get('posicion', pos+1), lista[pos].get('posicion', pos)
-                                lista[pos], lista[pos+1] = lista[pos+1], lista[pos]
-                                ensure_ids_and_positions(st.session_state['categorias'])
-                                if persist_db: _call_db_reindex(None, sum((c['items'] for c in st.session_state['categorias'].values()), []))
-                                st.rerun()
+                        if st.button("↓", key=f"down_{item_id}", width='stretch'):
+                            cambiados = mover_item(data, idx, 1)
+                            if cambiados:
+                                if persist_db: _call_db_reindex(None, cambiados)
+                                _rerun_dependientes()
 
                 # mover de categoria (selectbox)
                 with col7:
-                    move_key = f"move_{unique_suffix}"  # USAR unique_suffix
+                    move_key = f"move_{item_id}"
                     # opciones: todas las categorias + GENERAL
-                    opts = list(st.session_state['categorias'].keys()) + ["GENERAL"]
+                    opts = list(st.session_state['categorias'].keys())
+                    if "GENERAL" not in opts:
+                        opts.append("GENERAL")
                     current_cat = item.get('categoria', cat_nombre)
                     # don't raise if current_cat not in opts
                     current_index = opts.index(current_cat) if current_cat in opts else 0
                     new_cat = col7.selectbox("Mover a", opts, index=current_index, key=move_key, label_visibility="collapsed")
                     if new_cat != current_cat:
-                        # remover de la categoria actual e insertar al final de la nueva
-                        # eliminar por id
+                        # al final de la nueva categoría; en el origen se corren solo los siguientes
                         try:
-                            # quitar del current list
-                            src_list = st.session_state['categorias'][cat_nombre]['items']
-                            new_list = [it for it in src_list if it.get('id') != item_id]
-                            st.session_state['categorias'][cat_nombre]['items'] = new_list
-                            # actualizar item.categoria
-                            item['categoria'] = new_cat
-                            # si new_cat no existe, crear
-                            if new_cat == "GENERAL":
-                                if "GENERAL" not in st.session_state['categorias']:
-                                    st.session_state['categorias']["GENERAL"] = {'categoria_id': None, 'items': [], 'mano_obra': 0}
-                                dest_list = st.session_state['categorias']["GENERAL"]['items']
-                            else:
-                                if new_cat not in st.session_state['categorias']:
-                                    st.session_state['categorias'][new_cat] = {'categoria_id': None, 'items': [], 'mano_obra': 0}
-                                dest_list = st.session_state['categorias'][new_cat]['items']
-                            # append and reindex positions
-                            dest_list.append(item)
-                            ensure_ids_and_positions(st.session_state['categorias'])
+                            cambiados = mover_a_categoria(st.session_state['categorias'], cat_nombre, idx, new_cat)
                             if persist_db:
                                 _call_db_upsert(item)
-                                _call_db_reindex(None, sum((c['items'] for c in st.session_state['categorias'].values()), []))
-                            st.rerun()
+                                _call_db_reindex(None, cambiados)
+                            _rerun_dependientes()
                         except Exception:
                             st.error("Error al mover el ítem de categoría")
 
                 # eliminar
                 with col8:
-                    if col8.button("❌", key=f"del_{unique_suffix}"):  # USAR unique_suffix
-                        # eliminar por id de la lista actual
+                    if col8.button("❌", key=f"del_{item_id}"):
                         try:
-                            src_list = st.session_state['categorias'][cat_nombre]['items']
-                            st.session_state['categorias'][cat_nombre]['items'] = [it for it in src_list if it.get('id') != item_id]
+                            eliminado, cambiados = eliminar_item(data, idx)
                             if persist_db:
-                                _call_db_delete(item_id)
-                                _call_db_reindex(None, sum((c['items'] for c in st.session_state['categorias'].values()), []))
-                            ensure_ids_and_positions(st.session_state['categorias'])
-                            st.rerun()
+                                _call_db_delete(eliminado)
+                                _call_db_reindex(None, cambiados)
+                            _rerun_dependientes()
                         except Exception:
                             st.error("No se pudo eliminar el ítem")
 
-    return st.session_state['categorias']
+            # Total acumulado de la categoría (O(1)): se actualiza dentro del fragmento
+            st.caption(f"Total {cat_nombre}: ${data.total:,.0f}".replace(",", "."))
+
+# ==================== EDITOR EN GRILLA ====================
+_CAMPOS_GRILLA = ['nombre', 'unidad', 'cantidad', 'precio_unitario', 'total']
+
+def _df_grilla(cat_nombre: str, categoria: Categoria) -> pd.DataFrame:
+    """DataFrame editable de una categoría, indexado por id de ítem."""
+    items = categoria.items
+    return pd.DataFrame({
+        'nombre': [it.nombre for it in items],
+        'unidad': [it.unidad for it in items],
+        'cantidad': [it.cantidad for it in items],
+        'precio_unitario': [it.precio_unitario for it in items],
+        'total': [it.total for it in items],
+        'tipo': [it.tipo for it in items],
+        'orden': list(range(1, len(items) + 1)),
+        'mover': [cat_nombre] * len(items),
+        'borrar': [False] * len(items),
+    }, index=pd.Index([it.id for it in items], name='id'))
+
+def aplicar_cambios_grilla(categorias: Dict[str, Any], cat_nombre: str, original: pd.DataFrame,
+                           editado: pd.DataFrame, persist_db: bool = False) -> bool:
+    """
+    Aplica en un solo pase las diferencias entre la grilla original y la editada.
+    Devuelve True si hubo cambios estructurales (borrar, mover u ordenar).
+    """
+    categoria = categorias[cat_nombre]
+    items_por_id = {it.id: it for it in categoria.items}
+    editado = editado.loc[editado.index.intersection(original.index)].copy()
+
+    # 1. Campos: detectar filas cambiadas comparando columnas completas (vectorizado)
+    antes = original.loc[editado.index, _CAMPOS_GRILLA]
+    despues = editado[_CAMPOS_GRILLA]
+    distintos = (antes != despues) & ~(antes.isna() & despues.isna())
+    cambiadas = distintos.any(axis=1)
+
+    # Valores finales calculados por columna: textos vacíos conservan el valor
+    # anterior y el total de los ítems normales es cantidad x precio
+    for campo in ('nombre', 'unidad'):
+        vacio = editado[campo].isna() | (editado[campo] == '')
+        editado[campo] = editado[campo].mask(vacio, antes[campo])
+    normales = editado['tipo'] == TIPO_NORMAL
+    editado['cantidad'] = editado['cantidad'].fillna(0)
+    editado['precio_unitario'] = editado['precio_unitario'].fillna(0)
+    calculado = editado['cantidad'] * editado['precio_unitario']
+    # Solo los trabajos simples y la mano de obra aceptan un total escrito a mano
+    total_ignorado = normales & distintos['total'] & (editado['total'] != calculado)
+    if total_ignorado.any():
+        st.warning(f"⚠️ {cat_nombre}: el total de {int(total_ignorado.sum())} ítem(s) se calcula como "
+                   "cantidad × precio unitario; edita esas columnas para cambiarlo.")
+    editado['total'] = editado['total'].where(~normales, calculado)
+
+    # Escritura en los ítems: solo las filas cambiadas
+    filas = editado.loc[cambiadas, _CAMPOS_GRILLA]
+    for item_id, nombre, unidad, cantidad, precio, total in zip(filas.index, *(filas[c] for c in _CAMPOS_GRILLA)):
+        item = items_por_id[item_id]
+        item['nombre'] = nombre
+        item['unidad'] = unidad
+        if item.tipo == TIPO_NORMAL:
+            item['cantidad'] = cantidad
+            item['precio_unitario'] = precio
+        else:
+            item['total'] = total
+        if persist_db:
+            _call_db_upsert(item)
+
+    # 2. Estructura: borrar / mover / reordenar como operaciones en lote
+    borrar = editado['borrar'].fillna(False).astype(bool)
+    mover = (editado['mover'].fillna(cat_nombre) != cat_nombre) & ~borrar
+    reordenado = not editado['orden'].equals(original.loc[editado.index, 'orden'])
+    if not (borrar.any() or mover.any() or reordenado):
+        return False
+
+    quedan = editado[~borrar & ~mover].sort_values('orden', kind='stable').index
+    categoria.items = [items_por_id[item_id] for item_id in quedan]
+    cambiados = renumerar_posiciones(categoria.items)
+
+    for item_id, destino in editado.loc[mover, 'mover'].items():
+        item = items_por_id[item_id]
+        item['categoria'] = destino
+        add_item_to_category(categorias, destino, item)
+        cambiados.append(item)
+
+    if persist_db:
+        for item_id in editado.index[borrar]:
+            _call_db_delete(items_por_id[item_id])
+        _call_db_reindex(None, cambiados)
+    return True
+
+@st.fragment
+def _editor_grilla(persist_db: bool = False) -> None:
+    """Editor en grilla (fragmento): una st.data_editor por categoría."""
+    categorias = st.session_state['categorias']
+    opciones_mover = list(categorias.keys()) + (["GENERAL"] if "GENERAL" not in categorias else [])
+    generaciones = st.session_state.setdefault('_grilla_generacion', {})
+
+    column_config = {
+        'nombre': st.column_config.TextColumn("Descripción", required=True, width="large"),
+        'unidad': st.column_config.SelectboxColumn("Unidad", options=UNIDADES),
+        'cantidad': st.column_config.NumberColumn("Cant.", min_value=0, step=1),
+        'precio_unitario': st.column_config.NumberColumn("P.Unit", min_value=0, step=1, format="$%d"),
+        'total': st.column_config.NumberColumn("Total", min_value=0, step=1, format="$%d",
+                                               help="Editable solo en trabajos simples y mano de obra; "
+                                                    "en los demás ítems es cantidad × precio unitario"),
+        'tipo': None,
+        'orden': st.column_config.NumberColumn("Orden", min_value=1, step=1),
+        'mover': st.column_config.SelectboxColumn("Mover a", options=opciones_mover),
+        'borrar': st.column_config.CheckboxColumn("Borrar"),
+    }
+
+    with st.expander("📝 Editar/Eliminar Ítems", expanded=True):
+        for cat_nombre in list(categorias.keys()):
+            categoria = categorias[cat_nombre]
+            if not categoria.items:
+                continue
+
+            st.write(f"### {cat_nombre}")
+            original = _df_grilla(cat_nombre, categoria)
+            editado = st.data_editor(
+                original,
+                column_config=column_config,
+                hide_index=True,
+                width='stretch',
+                key=f"grilla_{cat_nombre}_{generaciones.get(cat_nombre, 0)}",
+            )
+
+            if aplicar_cambios_grilla(categorias, cat_nombre, original, editado, persist_db=persist_db):
+                # La grilla cambia de forma: widget nuevo para no re-aplicar ediciones viejas
+                generaciones[cat_nombre] = generaciones.get(cat_nombre, 0) + 1
+                _rerun_dependientes()
+
+            st.caption(f"Total {cat_nombre}: ${categoria.total:,.0f}".replace(",", "."))
 
 def show_trabajos_simples(items_data: Dict[str, Any], persist_db: bool = False) -> None:
     """
     UI para agregar trabajos simples. Se guardan como items con unidad='Unidad', cantidad=1, precio_unitario=total, y campo es_trabajo_simple=True.
     """
     ensure_ids_and_positions(items_data)
+    _form_trabajos_simples(items_data, persist_db)
 
+@st.fragment
+def _form_trabajos_simples(items_data: Dict[str, Any], persist_db: bool = False) -> None:
+    """Formulario de trabajos simples (fragmento)."""
     with st.expander("💼 Agregar Trabajo / Servicio", expanded=True):
         
         nombre_trabajo = st.text_input("Nombre del trabajo:", key="nombre_trabajo_simple")
@@ -769,19 +995,58 @@ def show_trabajos_simples(items_data: Dict[str, Any], persist_db: bool = False)
                     'es_trabajo_simple': True
                 }
                 add_item_to_category(items_data, target_cat, nuevo_item, persist_db=persist_db)
-                ensure_ids_and_positions(items_data)
                 st.success(f"Trabajo '{nombre_trabajo}' agregado correctamente en '{target_cat}'.")
-                st.rerun()
+                _rerun_dependientes()
+
+def _tabla_resumen(cat_nombre: str, categoria: Categoria) -> pd.DataFrame:
+    """
+    DataFrame de la categoría para el resumen, cacheado en session_state.
+    Solo se reconstruye cuando cambia la versión de la categoría.
+    """
+    cache = st.session_state.setdefault('_resumen_tablas', {})
+    firma = (id(categoria), categoria.version)
+    cacheado = cache.get(cat_nombre)
+    if cacheado and cacheado[0] == firma:
+        return cacheado[1]
+
+    filas = categoria.filas()
+    df_items = pd.DataFrame({
+        "nombre_personalizado": [it.nombre for it in filas],
+        "unidad": [it.unidad for it in filas],
+        "cantidad": [it.cantidad for it in filas],
+        "precio_unitario": [it.precio_unitario for it in filas],
+        "total": [it.total for it in filas],
+    })
+    cache[cat_nombre] = (firma, df_items)
+    return df_items
 
 def show_resumen(items_data: Dict[str, Any]) -> float:
-    """Resumen simplificado del presupuesto."""
+    """Resumen simplificado del presupuesto. Los totales salen de los acumulados de cada categoría."""
     
-    if not items_data or all(not data.get('items') for cat, data in items_data.items()):
+    categorias = []
+    for cat, data in (items_data or {}).items():
+        # Convertir in-place para que los acumulados y la caché sobrevivan al rerun
+        categoria = items_data[cat] = Categoria.from_dict(data, cat)
+        if categoria.items:
+            categorias.append((cat, categoria))
+
+    if not categorias:
         st.info("📭 No hay ítems agregados aún")
         return 0.0
 
-    total_general = 0
+    # O(categorías): cada categoría mantiene su total al agregar/editar/mover/borrar ítems
+    total_general = sum(categoria.total for _, categoria in categorias)
+
+    # Descartar tablas cacheadas de categorías que ya no existen
+    cache = st.session_state.get('_resumen_tablas', {})
+    for cat in [c for c in cache if c not in items_data]:
+        del cache[cat]
+
+    _render_resumen(categorias, total_general)
+    return total_general
 
+def _render_resumen(categorias: List[Tuple[str, Categoria]], total_general: float) -> None:
+    """Render del resumen a partir de totales y tablas ya calculados (sin widgets: no es fragmento)."""
     st.markdown(f"""
     <div style="
     background:#2E7D32;
@@ -795,44 +1060,20 @@ def show_resumen(items_data: Dict[str, Any]) -> float:
     <h1>${total_general:,.0f}</h1>
     </div>
     """, unsafe_allow_html=True)
+
+    column_config = {
+        "nombre_personalizado": st.column_config.TextColumn("Insumo", width="medium"),
+        "unidad": st.column_config.TextColumn("Unidad", width="small"),
+        "cantidad": st.column_config.NumberColumn("Cantidad", width="small"),
+        "precio_unitario": st.column_config.NumberColumn("P. Unitario", format="$%d", width="small"),
+        "total": st.column_config.NumberColumn("Total", format="$%d", width="small")
+    }
     
-    for cat, data in items_data.items():
-        items = data.get('items', [])
-        
-        if items:  # Solo mostrar categorías que tienen items
-            total_categoria = sum(item.get('total', 0) for item in items)
-            total_general += total_categoria
-
-            st.markdown(f"#### 🔹 {cat}")
-            
-            if items:
-                df_items = pd.DataFrame(items)
-                
-                # Configuración de columnas - usar 'nombre_personalizado' o 'nombre' como "Insumo"
-                column_config = {
-                    "nombre_personalizado": st.column_config.TextColumn("Insumo", width="medium"),
-                    "nombre": st.column_config.TextColumn("Insumo", width="medium"),
-                    "unidad": st.column_config.TextColumn("Unidad", width="small"),
-                    "cantidad": st.column_config.NumberColumn("Cantidad", width="small"),
-                    "precio_unitario": st.column_config.NumberColumn("P. Unitario", format="$%d", width="small"),
-                    "total": st.column_config.NumberColumn("Total", format="$%d", width="small")
-                }
-                
-                # Determinar qué columna usar para "Insumo"
-                if "nombre_personalizado" in df_items.columns and not df_items["nombre_personalizado"].isna().all():
-                    columns_to_show = ["nombre_personalizado", "unidad", "cantidad", "precio_unitario", "total"]
-                else:
-                    columns_to_show = ["nombre", "unidad", "cantidad", "precio_unitario", "total"]
-                
-                # Filtrar solo las columnas que existen
-                columns_to_show = [col for col in columns_to_show if col in df_items.columns]
-                
-                st.dataframe(df_items[columns_to_show], column_config=column_config, hide_index=True, width='stretch')
-            
-            st.markdown(f"**Total {cat}:** **${total_categoria:,}**")
-            st.markdown("---")
+    for cat, categoria in categorias:
+        st.markdown(f"#### 🔹 {cat}")
+        st.dataframe(_tabla_resumen(cat, categoria), column_config=column_config, hide_index=True, width='stretch')
+        st.markdown(f"**Total {cat}:** **${categoria.total:,.0f}**")
+        st.markdown("---")
 
     if total_general > 0:
-        st.markdown(f"#### 💰 **TOTAL GENERAL:** **${total_general:,}**")
-    
-    return total_general
\ No newline at end of file
+        st.markdown(f"#### 💰 **TOTAL GENERAL:** **${total_general:,.0f}**")
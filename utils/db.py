@@ -1,7 +1,12 @@
 import streamlit as st
 from supabase import create_client, Client
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
+from utils.busqueda import IndiceBusqueda
+from utils.items import (
+    Item, categorias_a_plantilla, delta_filas, diff_filas, diff_versiones, filas_db,
+    filas_db_por_item, reconstruir_version
+)
 
 
 
@@ -27,6 +32,25 @@ def get_supabase_client() -> Client:
     """Devuelve la instancia del cliente Supabase, cacheada globalmente."""
     return initialize_supabase_client(st.secrets)
 
+# PostgREST devuelve como máximo 1000 filas por consulta: las lecturas del
+# historial completo se hacen por páginas con .range()
+LOTE_POSTGREST = 1000
+
+def paginas_consulta(consulta: Callable[[], Any], lote: int = LOTE_POSTGREST) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Páginas de hasta 'lote' filas de una consulta de supabase.
+    'consulta' arma la consulta filtrada y con orden estable; se llama una vez
+    por página. Los errores se propagan: quien llama decide si reintentar.
+    """
+    inicio = 0
+    while True:
+        filas = consulta().range(inicio, inicio + lote - 1).execute().data or []
+        if filas:
+            yield filas
+        if len(filas) < lote:
+            return
+        inicio += lote
+
 # =================================================================
 # LECTURA DE ENTIDADES (CACHÉ)
 # =================================================================
@@ -70,6 +94,79 @@ def get_categorias(user_id: str) -> List[Tuple[int, str]]:
         st.error(f"Error al obtener categorías: {e}")
         return []
 
+class DirectorioEntidades:
+    """
+    Entidades (id, nombre) de un usuario con índices id→nombre y nombre→id.
+    Se construye una vez por llenado de caché y lo comparten todas las páginas.
+    Iterarlo devuelve las tuplas (id, nombre) en el orden original.
+    """
+
+    __slots__ = ('entidades', 'por_id', 'por_nombre', 'por_nombre_minusculas')
+
+    def __init__(self, entidades: List[Tuple[int, str]]):
+        self.entidades = list(entidades)
+        self.por_id = dict(self.entidades)
+        # Con nombres repetidos gana el primero (igual que la búsqueda lineal anterior)
+        self.por_nombre = {}
+        for id_entidad, nombre in self.entidades:
+            self.por_nombre.setdefault(nombre, id_entidad)
+        self.por_nombre_minusculas = {nombre.lower(): id_entidad for id_entidad, nombre in self.entidades}
+
+    @property
+    def nombres(self) -> List[str]:
+        return [nombre for _, nombre in self.entidades]
+
+    def nombre(self, id_entidad: Optional[int], defecto: Optional[str] = None) -> Optional[str]:
+        return self.por_id.get(id_entidad, defecto)
+
+    def id_de(self, nombre: Optional[str], defecto: Optional[int] = None) -> Optional[int]:
+        return self.por_nombre.get(nombre, defecto)
+
+    def __iter__(self):
+        return iter(self.entidades)
+
+    def __len__(self) -> int:
+        return len(self.entidades)
+
+# Los directorios no se modifican después de construirse: cache_resource
+# devuelve la misma instancia sin copiarla (cache_data la deserializaría
+# completa en cada llamada). limpiar_caches() los invalida junto con los datos.
+@st.cache_resource(ttl=600)
+def get_directorio_clientes(user_id: str) -> DirectorioEntidades:
+    """Directorio de clientes del usuario (búsquedas O(1) por id o nombre)."""
+    return DirectorioEntidades(get_clientes(user_id))
+
+@st.cache_resource(ttl=600)
+def get_directorio_lugares(user_id: str) -> DirectorioEntidades:
+    """Directorio de lugares de trabajo del usuario."""
+    return DirectorioEntidades(get_lugares_trabajo(user_id))
+
+@st.cache_resource(ttl=600)
+def get_directorio_categorias(user_id: str) -> DirectorioEntidades:
+    """Directorio de categorías del usuario."""
+    return DirectorioEntidades(get_categorias(user_id))
+
+def limpiar_caches() -> None:
+    """Vacía las cachés de datos y los directorios de entidades tras crear, editar o borrar."""
+    st.cache_data.clear()
+    get_directorio_clientes.clear()
+    get_directorio_lugares.clear()
+    get_directorio_categorias.clear()
+
+# Los índices se cachean por contenido: cuando get_clientes/get_lugares_trabajo
+# se refrescan (TTL o limpiar_caches()) cambia la tupla y se reconstruye.
+@st.cache_resource(max_entries=64)
+def _indice_entidades(entidades: Tuple[Tuple[int, str], ...]) -> IndiceBusqueda:
+    return IndiceBusqueda(entidades)
+
+def get_indice_clientes(user_id: str) -> IndiceBusqueda:
+    """Índice de búsqueda de clientes del usuario."""
+    return _indice_entidades(tuple(get_clientes(user_id)))
+
+def get_indice_lugares(user_id: str) -> IndiceBusqueda:
+    """Índice de búsqueda de lugares de trabajo del usuario."""
+    return _indice_entidades(tuple(get_lugares_trabajo(user_id)))
+
 # =================================================================
 # GESTIÓN DE ENTIDADES
 # =================================================================
@@ -285,6 +382,84 @@ def get_presupuestos_por_lugar(lugar_id: int) -> list[dict]:
         print(f"Error al obtener presupuestos del lugar {lugar_id}: {e}")
         return []
 
+# =================================================================
+# DOSSIER POR CLIENTE / LUGAR
+# =================================================================
+# Presupuestos y estados de cuenta completos de un cliente o lugar, leídos
+# por lotes con sus ítems embebidos (una consulta por lote). Se entregan de
+# a uno para dibujarlos en el PDF sin tener todo el historial en memoria.
+
+LOTE_DOSSIER = 20
+CAMPOS_DOSSIER = ('cliente_id', 'lugar_trabajo_id')
+
+
+def contar_documentos_dossier(campo: str, valor: int, user_id: str) -> Tuple[int, int]:
+    """(presupuestos, estados de cuenta) de un cliente o lugar."""
+    supabase = get_supabase_client()
+    try:
+        presupuestos = supabase.table('presupuestos').select('id', count='exact') \
+            .eq(campo, valor).eq('creado_por', user_id).limit(1).execute()
+        estados = supabase.table('estados_cuenta').select('id', count='exact') \
+            .eq(campo, valor).eq('user_id', user_id).limit(1).execute()
+        return presupuestos.count or 0, estados.count or 0
+    except Exception as e:
+        print(f"Error al contar documentos del dossier: {e}")
+        return 0, 0
+
+
+def iter_presupuestos_detallados(campo: str, valor: int, user_id: str):
+    """Presupuestos del cliente o lugar con sus ítems, del más antiguo al más reciente."""
+    supabase = get_supabase_client()
+    inicio = 0
+    while True:
+        try:
+            response = supabase.table('presupuestos').select(
+                'id, descripcion, fecha_creacion, total, '
+                'cliente:cliente_id(nombre), '
+                'lugar:lugar_trabajo_id(nombre), '
+                'items_en_presupuesto(nombre_personalizado, unidad, cantidad, precio_unitario, total, notas, '
+                'categoria:categoria_id(nombre))'
+            ).eq(campo, valor).eq('creado_por', user_id) \
+                .order('fecha_creacion').order('id') \
+                .range(inicio, inicio + LOTE_DOSSIER - 1).execute()
+        except Exception as e:
+            print(f"Error al leer presupuestos del dossier: {e}")
+            return
+
+        lote = response.data or []
+        for p in lote:
+            p['items'] = [_item_detallado(item) for item in p.pop('items_en_presupuesto', None) or []]
+            yield p
+        if len(lote) < LOTE_DOSSIER:
+            return
+        inicio += LOTE_DOSSIER
+
+
+def iter_estados_cuenta_detallados(campo: str, valor: int, user_id: str):
+    """Estados de cuenta del cliente o lugar con sus detalles, del más antiguo al más reciente."""
+    supabase = get_supabase_client()
+    inicio = 0
+    while True:
+        try:
+            response = supabase.table('estados_cuenta').select(
+                'id, abono_monto, total_neto, fecha_emision, '
+                'cliente:cliente_id(nombre), '
+                'lugar_trabajo:lugar_trabajo_id(nombre), '
+                'detalles_estado_cuenta(descripcion, monto)'
+            ).eq(campo, valor).eq('user_id', user_id) \
+                .order('fecha_emision').order('id') \
+                .range(inicio, inicio + LOTE_DOSSIER - 1).execute()
+        except Exception as e:
+            print(f"Error al leer estados de cuenta del dossier: {e}")
+            return
+
+        lote = response.data or []
+        yield from lote
+        if len(lote) < LOTE_DOSSIER:
+            return
+        inicio += LOTE_DOSSIER
+
+
 # =================================================================
 # GESTIÓN DE PRESUPUESTOS
 # =================================================================
@@ -353,6 +528,7 @@ def delete_presupuesto(presupuesto_id: int, user_id: str) -> bool:
             st.error(f"Error del servidor: {response.error.message}")
             return False
         
+        invalidar_detalle_presupuesto(presupuesto_id)
         return True
             
     except Exception as e:
@@ -391,66 +567,11 @@ def save_presupuesto_completo(
         
         nuevo_presupuesto_id = response_presupuesto.data[0]['id']
 
-        # --- FASE 2: Preparar e insertar los ítems para el NUEVO presupuesto ---
-        items_a_insertar = []
+        # --- FASE 2: Preparar los ítems para el NUEVO presupuesto ---
         # Obtener mapeo de nombre de categoría a ID
-        categorias_map = {nombre.lower(): id_cat for id_cat, nombre in get_categorias(user_id)}
-        
-        for cat_nombre, data in items_data.items():
-            # Obtener ID de categoría (si es general/sin categoría, será None)
-            cat_id = categorias_map.get(cat_nombre.lower())
-            
-            # --- Procesar Items Normales ---
-            for item in data.get('items', []):
-                # Verificar campos requeridos
-                if 'cantidad' not in item or 'precio_unitario' not in item:
-                    continue
-                
-                try:
-                    # Asegurar que cantidad sea entero
-                    cantidad_int = int(item['cantidad'])
-                    precio_unitario_float = float(item['precio_unitario'])
-                    total_item = cantidad_int * precio_unitario_float
-                    
-                    if total_item <= 0: 
-                        continue
-                    
-                    # Para ítems sin categoría explícita (como 'general'), usamos la ID de la categoría del loop
-                    final_cat_id = cat_id if cat_id is not None else None 
-                    
-                    # Usar nombre_personalizado
-                    nombre_item = item.get('nombre_personalizado', 'Sin nombre')
-                    
-                    item_para_insertar = {
-                        'presupuesto_id': nuevo_presupuesto_id,
-                        'categoria_id': final_cat_id,
-                        'nombre_personalizado': nombre_item,
-                        'unidad': item.get('unidad', 'Unidad'),
-                        'cantidad': cantidad_int,
-                        'precio_unitario': precio_unitario_float,
-                        'notas': item.get('notas', '')
-                    }
-                    
-                    items_a_insertar.append(item_para_insertar)
-                    
-                except Exception:
-                    continue
-            
-            # --- Procesar Mano de Obra ---
-            mano_obra = float(data.get('mano_obra', 0.0))
-            if mano_obra > 0:
-                # La MO general o de categoría usa el ID de categoría o None si es 'general'
-                final_cat_id_mo = cat_id if cat_nombre.lower() != 'general' else None
-                
-                items_a_insertar.append({
-                    'presupuesto_id': nuevo_presupuesto_id,
-                    'categoria_id': final_cat_id_mo, 
-                    'nombre_personalizado': 'Mano de Obra',
-                    'unidad': 'Unidad',
-                    'cantidad': 1,
-                    'precio_unitario': mano_obra,
-                    'notas': 'Mano de Obra'
-                })
+        categorias_map = get_directorio_categorias(user_id).por_nombre_minusculas
+        # Ítems normales, trabajos simples y mano de obra se normalizan en utils.items
+        items_a_insertar = filas_db(items_data, nuevo_presupuesto_id, categorias_map)
 
         # --- FASE 3: Insertar items del NUEVO presupuesto ---
         if items_a_insertar:
@@ -467,17 +588,30 @@ def save_presupuesto_completo(
         st.error(f"Error al guardar presupuesto completo: {e}")
         return None
 #Ver detalles en Hitorial
+@st.cache_data(ttl=600)
+def get_items_presupuesto(presupuesto_id: int) -> List[Dict[str, Any]]:
+    """
+    Ítems de un presupuesto para el detalle del Historial.
+    Cacheado por id; se invalida con invalidar_detalle_presupuesto al editar/eliminar.
+    """
+    supabase = get_supabase_client()
+    response = supabase.from_('items_en_presupuesto').select(
+        'nombre_personalizado, unidad, cantidad, precio_unitario, total, notas'
+    ).eq('presupuesto_id', presupuesto_id).execute()
+    return response.data or []
+
+def invalidar_detalle_presupuesto(presupuesto_id: int) -> None:
+    """Descarta los ítems cacheados de un presupuesto."""
+    get_items_presupuesto.clear(presupuesto_id)
+
 def _show_presupuesto_detail(presupuesto_id: int):
     """Muestra el detalle de los ítems de un presupuesto en un st.data_editor de solo lectura."""
-    supabase = get_supabase_client()
     try:
-        response = supabase.from_('items_en_presupuesto').select(
-            'nombre_personalizado, unidad, cantidad, precio_unitario, total, notas'
-        ).eq('presupuesto_id', presupuesto_id).execute()
+        items = get_items_presupuesto(presupuesto_id)
         
-        if response and response.data:
+        if items:
             st.data_editor(
-                response.data, 
+                items, 
                 column_config={
                     "nombre_personalizado": st.column_config.TextColumn("Ítem", width="large"),
                     "precio_unitario": st.column_config.NumberColumn("P. Unitario", format="$%.2f"),
@@ -537,14 +671,16 @@ def get_presupuesto_para_editar(presupuesto_id: int) -> Dict:
         
         # Obtener items con categorías
         items_response = supabase.from_('items_en_presupuesto').select(
-            'nombre_personalizado, unidad, cantidad, precio_unitario, total, notas, '
+            'id, categoria_id, nombre_personalizado, unidad, cantidad, precio_unitario, total, notas, '
             'categoria:categoria_id(nombre)'
-        ).eq('presupuesto_id', presupuesto_id).execute()
+        ).eq('presupuesto_id', presupuesto_id).order('id').execute()
         
         items_list = []
         if items_response.data:
             for item in items_response.data:
                 items_list.append({
+                    'db_id': item['id'],
+                    'categoria_id': item.get('categoria_id'),
                     'nombre': item['nombre_personalizado'],
                     'unidad': item['unidad'],
                     'cantidad': item['cantidad'],
@@ -605,51 +741,9 @@ def save_edited_presupuesto(
         
         nuevo_presupuesto_id = response_presupuesto.data[0]['id']
 
-        # --- FASE 2: Preparar e insertar los ítems (código existente) ---
-        items_a_insertar = []
-        # Obtener mapeo de nombre de categoría a ID
-        categorias_map = {nombre.lower(): id_cat for id_cat, nombre in get_categorias(user_id)}
-        
-        for cat_nombre, data in items_data.items():
-            # Obtener ID de categoría (si es general/sin categoría, será None)
-            cat_id = categorias_map.get(cat_nombre.lower())
-            
-            # --- Procesar Items Normales ---
-            for item in data.get('items', []):
-                # Asegurar que cantidad sea entero
-                cantidad_int = int(item['cantidad'])
-                precio_unitario_float = float(item['precio_unitario'])
-                total = cantidad_int * precio_unitario_float
-                
-                if total <= 0: 
-                    continue
-                
-                final_cat_id = cat_id if cat_id is not None else None 
-                
-                items_a_insertar.append({
-                    'presupuesto_id': nuevo_presupuesto_id,
-                    'categoria_id': final_cat_id,
-                    'nombre_personalizado': item['nombre'],
-                    'unidad': item['unidad'],
-                    'cantidad': cantidad_int,
-                    'precio_unitario': precio_unitario_float,
-                    'notas': item.get('notas', '')
-                })
-            
-            # --- Procesar Mano de Obra ---
-            mano_obra = float(data.get('mano_obra', 0.0))
-            if mano_obra > 0:
-                final_cat_id_mo = cat_id if cat_nombre.lower() != 'general' else None
-                
-                items_a_insertar.append({
-                    'presupuesto_id': nuevo_presupuesto_id,
-                    'categoria_id': final_cat_id_mo, 
-                    'nombre_personalizado': 'Mano de Obra',
-                    'unidad': 'Unidad',
-                    'cantidad': 1,
-                    'precio_unitario': mano_obra,
-                    'notas': 'Mano de Obra'
-                })
+        # --- FASE 2: Preparar los ítems ---
+        categorias_map = get_directorio_categorias(user_id).por_nombre_minusculas
+        items_a_insertar = filas_db(items_data, nuevo_presupuesto_id, categorias_map)
 
         # --- FASE 3: Insertar items del NUEVO presupuesto ---
         if items_a_insertar:
@@ -664,6 +758,333 @@ def save_edited_presupuesto(
     except Exception as e:
         st.error(f"Error al crear nuevo presupuesto: {e}")
         return None
+def update_presupuesto_editado(
+    presupuesto_id: int,
+    user_id: str,
+    cliente_id: int,
+    lugar_trabajo_id: int,
+    descripcion: str,
+    items_data: Dict[str, Any],
+    total_general: float,
+    items_originales: List[Dict[str, Any]],
+    registrar_version: bool = False
+) -> Optional[int]:
+    """
+    Actualiza un presupuesto EN SU LUGAR enviando solo los ítems que cambiaron.
+    items_originales: 'items' de get_presupuesto_para_editar (con 'db_id').
+    """
+    supabase = get_supabase_client()
+
+    try:
+        # --- FASE 1: Diferencias a nivel de ítem ---
+        # Nada se escribió antes de guardar: items_originales es lo que hay en la BD
+        categorias_map = get_directorio_categorias(user_id).por_nombre_minusculas
+        originales = [{
+            'id': it.get('db_id'),
+            'categoria_id': it.get('categoria_id'),
+            'nombre_personalizado': it.get('nombre'),
+            'unidad': it.get('unidad'),
+            'cantidad': it.get('cantidad'),
+            'precio_unitario': it.get('precio_unitario'),
+            'notas': it.get('notas'),
+        } for it in items_originales or []]
+        pares = filas_db_por_item(items_data, presupuesto_id, categorias_map)
+        enviar, ids_borrar = diff_filas(originales, pares)
+
+        # --- FASE 2: Un solo upsert para altas y modificaciones ---
+        # default_to_null=False: las filas nuevas (sin 'id') toman el id por defecto
+        if enviar:
+            response = supabase.table('items_en_presupuesto')\
+                .upsert([fila for _, fila in enviar], default_to_null=False).execute()
+            if not response.data:
+                raise Exception("Fallo la actualización de los ítems.")
+            for (item, enviada), fila in zip(enviar, response.data):
+                enviada['id'] = fila.get('id')
+                if not item.es_mano_obra:
+                    item.db_id = fila.get('id')
+                    item.categoria_id = enviada.get('categoria_id', item.categoria_id)
+
+        if ids_borrar:
+            supabase.table('items_en_presupuesto').delete().in_('id', ids_borrar).execute()
+
+        # --- FASE 3: Datos del presupuesto ---
+        cambios = {
+            'cliente_id': cliente_id,
+            'lugar_trabajo_id': lugar_trabajo_id,
+            'descripcion': descripcion,
+            'total': float(total_general),
+        }
+        if registrar_version:
+            numero = _registrar_version(
+                supabase, presupuesto_id, user_id,
+                originales, [fila for _, fila in pares], total_general
+            )
+            if numero:
+                cambios['notas'] = f"V{numero}"
+        supabase.table('presupuestos').update(cambios)\
+            .eq('id', presupuesto_id).eq('creado_por', user_id).execute()
+
+        invalidar_detalle_presupuesto(presupuesto_id)
+        # Los cambios anotados ya están incluidos en las diferencias enviadas
+        descartar_items()
+        return presupuesto_id
+
+    except Exception as e:
+        st.error(f"Error al actualizar presupuesto: {e}")
+        return None
+
+# =================================================================
+# PLANTILLAS Y CLONADO
+# =================================================================
+# Tabla 'plantillas_presupuesto': id, nombre, creado_por, estructura (jsonb).
+# La estructura es la de utils.items.categorias_a_plantilla.
+
+@st.cache_data(ttl=600)
+def get_plantillas(user_id: str) -> List[Dict[str, Any]]:
+    """Plantillas del usuario (id, nombre, estructura) ordenadas por nombre."""
+    supabase = get_supabase_client()
+    try:
+        response = supabase.table('plantillas_presupuesto').select('id, nombre, estructura')\
+            .eq('creado_por', user_id).order('nombre').execute()
+        return response.data or []
+    except Exception as e:
+        print(f"Error al obtener plantillas: {e}")
+        return []
+
+def save_plantilla(nombre: str, user_id: str, categorias: Dict[str, Any]) -> Optional[int]:
+    """Guarda la estructura de categorías/ítems actual como plantilla."""
+    supabase = get_supabase_client()
+    try:
+        response = supabase.table('plantillas_presupuesto').insert({
+            'nombre': nombre,
+            'creado_por': user_id,
+            'estructura': categorias_a_plantilla(categorias),
+        }).execute()
+        get_plantillas.clear()
+        return response.data[0]['id'] if response.data else None
+    except Exception as e:
+        st.error(f"Error al guardar plantilla: {e}")
+        return None
+
+def delete_plantilla(plantilla_id: int, user_id: str) -> bool:
+    """Elimina una plantilla del usuario."""
+    supabase = get_supabase_client()
+    try:
+        supabase.table('plantillas_presupuesto').delete()\
+            .eq('id', plantilla_id).eq('creado_por', user_id).execute()
+        get_plantillas.clear()
+        return True
+    except Exception as e:
+        st.error(f"Error al eliminar plantilla: {e}")
+        return False
+
+def clonar_presupuesto(presupuesto_id: int, user_id: str) -> Optional[int]:
+    """
+    Copia un presupuesto con sus ítems en el servidor.
+    Usa la función RPC 'clonar_presupuesto' (una llamada); si no existe, lee el
+    presupuesto con sus ítems en una consulta y los copia con un insert masivo.
+    """
+    supabase = get_supabase_client()
+    try:
+        response = supabase.rpc('clonar_presupuesto', {'p_presupuesto_id': presupuesto_id}).execute()
+        if response.data:
+            return response.data if isinstance(response.data, int) else response.data[0].get('id')
+    except Exception as e:
+        print(f"RPC clonar_presupuesto no disponible, copiando desde el cliente: {e}")
+
+    try:
+        original = supabase.from_('presupuestos').select(
+            'cliente_id, lugar_trabajo_id, descripcion, total, '
+            'items_en_presupuesto(categoria_id, nombre_personalizado, unidad, cantidad, precio_unitario, notas)'
+        ).eq('id', presupuesto_id).eq('creado_por', user_id).single().execute().data
+        if not original:
+            raise Exception("Presupuesto no encontrado.")
+
+        items = original.pop('items_en_presupuesto') or []
+        nuevo = supabase.table('presupuestos').insert({**original, 'creado_por': user_id}).execute()
+        if not nuevo.data:
+            raise Exception("Fallo la creación de la copia.")
+        nuevo_id = nuevo.data[0]['id']
+
+        if items:
+            filas = [{**item, 'presupuesto_id': nuevo_id} for item in items]
+            if not supabase.table('items_en_presupuesto').insert(filas).execute().data:
+                supabase.table('presupuestos').delete().eq('id', nuevo_id).execute()
+                raise Exception("Fallo la copia de los ítems.")
+        return nuevo_id
+    except Exception as e:
+        st.error(f"Error al clonar presupuesto: {e}")
+        return None
+
+# =================================================================
+# VERSIONES DE PRESUPUESTOS
+# =================================================================
+# Tabla 'presupuesto_versiones': presupuesto_id, numero, delta (jsonb),
+# total, creado_por, fecha_creacion. Cada versión guarda solo el delta de
+# ítems respecto de la anterior (ver utils.items); la 1 es la base.
+
+def _registrar_version(supabase, presupuesto_id: int, user_id: str, filas_antes: List[Dict[str, Any]],
+                       filas_despues: List[Dict[str, Any]], total: float) -> Optional[int]:
+    """Guarda el delta como nueva versión. Devuelve su número (o None si falla)."""
+    try:
+        ultima = supabase.table('presupuesto_versiones').select('numero')\
+            .eq('presupuesto_id', presupuesto_id).order('numero', desc=True).limit(1).execute()
+        nuevas = []
+        if ultima.data:
+            numero = ultima.data[0]['numero'] + 1
+        else:
+            # Primera edición: lo guardado hasta ahora pasa a ser la versión base
+            numero = 2
+            nuevas.append({
+                'presupuesto_id': presupuesto_id, 'numero': 1, 'creado_por': user_id,
+                'delta': delta_filas([], filas_antes),
+                'total': None,
+            })
+        nuevas.append({
+            'presupuesto_id': presupuesto_id, 'numero': numero, 'creado_por': user_id,
+            'delta': delta_filas(filas_antes, filas_despues),
+            'total': float(total),
+        })
+        supabase.table('presupuesto_versiones').insert(nuevas).execute()
+        get_versiones_presupuesto.clear()
+        return numero
+    except Exception as e:
+        st.warning(f"No se pudo registrar la versión: {e}")
+        return None
+
+@st.cache_data(ttl=60)
+def get_versiones_presupuesto(presupuesto_id: int) -> List[Dict[str, Any]]:
+    """Versiones del presupuesto (numero, delta, total, fecha) en orden ascendente."""
+    supabase = get_supabase_client()
+    try:
+        response = supabase.table('presupuesto_versiones')\
+            .select('numero, delta, total, fecha_creacion')\
+            .eq('presupuesto_id', presupuesto_id).order('numero').execute()
+        return response.data or []
+    except Exception as e:
+        print(f"Error al obtener versiones del presupuesto {presupuesto_id}: {e}")
+        return []
+
+def _show_versiones_presupuesto(presupuesto_id: int):
+    """Selector de dos versiones y tabla con los ítems agregados/modificados/eliminados."""
+    versiones = get_versiones_presupuesto(presupuesto_id)
+    if len(versiones) < 2:
+        st.caption("Sin versiones anteriores.")
+        return
+
+    numeros = [v['numero'] for v in versiones]
+    col_a, col_b = st.columns(2)
+    desde = col_a.selectbox("Desde", numeros[:-1], index=len(numeros) - 2,
+                            format_func=lambda n: f"V{n}", key=f"ver_desde_{presupuesto_id}")
+    hasta = col_b.selectbox("Hasta", [n for n in numeros if n > desde], index=None,
+                            placeholder=f"V{numeros[-1]}", format_func=lambda n: f"V{n}",
+                            key=f"ver_hasta_{presupuesto_id}") or numeros[-1]
+
+    cambios = diff_versiones(reconstruir_version(versiones, desde), reconstruir_version(versiones, hasta))
+    if not cambios:
+        st.info("No hay diferencias de ítems entre estas versiones.")
+        return
+    st.dataframe(
+        cambios,
+        column_order=('estado', 'nombre_personalizado', 'unidad', 'cantidad', 'precio_unitario', 'notas'),
+        column_config={
+            "estado": st.column_config.TextColumn("Cambio"),
+            "nombre_personalizado": st.column_config.TextColumn("Ítem", width="large"),
+            "precio_unitario": st.column_config.NumberColumn("P. Unitario", format="$%.2f"),
+        },
+        hide_index=True,
+    )
+
+# =================================================================
+# CAMBIOS DE ÍTEMS PENDIENTES
+# =================================================================
+# Al editar un presupuesto en su lugar, los editores llaman a upsert_item /
+# delete_item / reindex_items en cada cambio. Los cambios se anotan en la
+# sesión (uno por ítem, con el valor más reciente) y NO se escriben en la BD:
+# el presupuesto guardado solo cambia cuando el usuario presiona guardar, y
+# update_presupuesto_editado envía todas las diferencias en un upsert y un
+# delete y registra la versión en la misma escritura. Guardar como nuevo,
+# cargar otro presupuesto o cerrar sesión descartan la cola.
+_COLA_KEY = '_cola_items'
+
+def _cola_items() -> Dict[str, Any]:
+    """Cola de cambios pendientes de la sesión actual."""
+    if _COLA_KEY not in st.session_state:
+        st.session_state[_COLA_KEY] = {'upserts': {}, 'deletes': set(), 'presupuesto_id': None}
+    return st.session_state[_COLA_KEY]
+
+def _presupuesto_en_edicion() -> Optional[int]:
+    return st.session_state.get('presupuesto_a_editar_id')
+
+def _cola_para(presupuesto_id: int) -> Dict[str, Any]:
+    """Cola asociada al presupuesto; los cambios de otro presupuesto se descartan."""
+    cola = _cola_items()
+    if cola['presupuesto_id'] not in (None, presupuesto_id):
+        descartar_items()
+    cola['presupuesto_id'] = presupuesto_id
+    return cola
+
+def upsert_item(item: Dict[str, Any]) -> None:
+    """Anota el alta/edición de un ítem del presupuesto en edición."""
+    presupuesto_id = _presupuesto_en_edicion()
+    if not presupuesto_id:
+        return  # presupuesto nuevo: se guarda completo al final
+    item = Item.from_dict(item)
+    # Se guarda la referencia: la cola siempre refleja el valor más reciente
+    _cola_para(presupuesto_id)['upserts'][item.id] = item
+
+def delete_item(item: Any) -> None:
+    """Anota la baja de un ítem (acepta el ítem o su id de la UI)."""
+    presupuesto_id = _presupuesto_en_edicion()
+    if not presupuesto_id:
+        return
+    cola = _cola_para(presupuesto_id)
+    item_id = item.get('id') if isinstance(item, (dict, Item)) else item
+    pendiente = cola['upserts'].pop(item_id, None)
+    db_id = item.get('db_id') if isinstance(item, (dict, Item)) else None
+    db_id = db_id or (pendiente.db_id if pendiente is not None else None)
+    if db_id:
+        cola['deletes'].add(db_id)
+
+def reindex_items(presupuesto_id: Optional[int], items: List[Dict[str, Any]]) -> None:
+    """
+    Anota los ítems ya guardados que cambiaron de categoría.
+    'items_en_presupuesto' no tiene columna de orden: los cambios solo de
+    posición no generan escrituras.
+    """
+    user_id = st.session_state.get('user_id')
+    categorias_map = get_directorio_categorias(user_id).por_nombre_minusculas if user_id else {}
+    for item in items:
+        item = Item.from_dict(item)
+        cat_id = categorias_map.get((item.categoria or '').lower(), item.categoria_id)
+        if item.db_id and cat_id != item.categoria_id:
+            upsert_item(item)
+
+def items_pendientes() -> int:
+    """Cantidad de ítems con cambios sin guardar en el presupuesto en edición."""
+    cola = _cola_items()
+    if cola['presupuesto_id'] != _presupuesto_en_edicion():
+        return 0
+    return len(cola['upserts']) + len(cola['deletes'])
+
+def descartar_items() -> None:
+    """Olvida los cambios pendientes sin escribir nada."""
+    st.session_state.pop(_COLA_KEY, None)
+
+def _item_detallado(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de items_en_presupuesto (con categoría embebida) en el formato del PDF."""
+    return {
+        'nombre': item['nombre_personalizado'],
+        'unidad': item['unidad'],
+        'cantidad': item['cantidad'],
+        'precio_unitario': item['precio_unitario'],
+        'total': item['total'],
+        'notas': item['notas'],
+        # Maneja el caso de que la categoría sea nula o no se encuentre
+        'categoria': item['categoria']['nombre'] if item.get('categoria') and item['categoria'] else 'Sin Categoría'
+    }
+
+
 # Ver los detalles del presupuesto
 @st.cache_data(ttl=60) 
 def get_presupuesto_detallado(presupuesto_id: int) -> dict:
@@ -677,7 +1098,7 @@ def get_presupuesto_detallado(presupuesto_id: int) -> dict:
         # 1. Obtener datos principales del presupuesto (cliente, lugar, descripcion)
         # RLS asegura que solo el 'creado_por' pueda leer esto
         main_response = supabase.from_('presupuestos').select(
-            'id, descripcion, total, '
+            'id, descripcion, total, fecha_creacion, '
             'cliente:cliente_id(nombre), '
             'lugar:lugar_trabajo_id(nombre)'
         ).eq('id', presupuesto_id).single().execute()
@@ -694,21 +1115,7 @@ def get_presupuesto_detallado(presupuesto_id: int) -> dict:
             'categoria:categoria_id(nombre)' # Join para obtener el nombre de la categoría
         ).eq('presupuesto_id', presupuesto_id).execute()
         
-        items_list = []
-        if items_response.data:
-            for item in items_response.data:
-                items_list.append({
-                    'nombre': item['nombre_personalizado'],
-                    'unidad': item['unidad'],
-                    'cantidad': item['cantidad'],
-                    'precio_unitario': item['precio_unitario'],
-                    'total': item['total'],
-                    'notas': item['notas'],
-                    # Maneja el caso de que la categoría sea nula o no se encuentre
-                    'categoria': item['categoria']['nombre'] if item.get('categoria') and item['categoria'] else 'Sin Categoría'
-                })
-                
-        presupuesto_data['items'] = items_list
+        presupuesto_data['items'] = [_item_detallado(item) for item in items_response.data or []]
         
         return presupuesto_data
     
@@ -773,6 +1180,21 @@ def get_estados_cuenta_usuario(user_id: str, filtros: dict = None) -> list:
         st.error(f"Error interno en get_estados_cuenta_usuario: {e}")
         return []
     
+def get_estado_cuenta_detallado(estado_id: int) -> dict:
+    """Estado de cuenta con cliente, lugar y sus detalles en una sola consulta."""
+    supabase = get_supabase_client()
+    try:
+        response = supabase.table('estados_cuenta').select(
+            '*, '
+            'cliente:cliente_id(nombre), '
+            'lugar_trabajo:lugar_trabajo_id(nombre), '
+            'detalles_estado_cuenta(descripcion, monto)'
+        ).eq('id', estado_id).single().execute()
+        return response.data or {}
+    except Exception as e:
+        print(f"Error al obtener estado de cuenta {estado_id}: {e}")
+        return {}
+
 def toggle_estado_pago_ec(estado_id: int, nuevo_estado: bool) -> bool:
     """
     Cambia el estado de pago (True/False) de un estado de cuenta específico.
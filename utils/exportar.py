@@ -0,0 +1,139 @@
+import io
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from utils.db import get_supabase_client, paginas_consulta
+
+# ==================== EXPORTACIÓN EXCEL / CSV ====================
+# Ítems de muchos presupuestos en un solo DataFrame (una consulta a
+# 'items_en_presupuesto' con categoría, presupuesto, cliente y lugar
+# embebidos, filtrada como el Historial). Los totales por categoría y por
+# presupuesto se calculan con groupby, sin recorrer filas en Python. El
+# archivo (CSV o XLSX) se arma completo en memoria antes de descargarlo.
+
+COLUMNAS = {
+    'presupuesto.id': 'Presupuesto',
+    'presupuesto.fecha_creacion': 'Fecha',
+    'presupuesto.cliente.nombre': 'Cliente',
+    'presupuesto.lugar.nombre': 'Lugar',
+    'presupuesto.descripcion': 'Descripción',
+    'categoria.nombre': 'Categoría',
+    'nombre_personalizado': 'Ítem',
+    'unidad': 'Unidad',
+    'cantidad': 'Cantidad',
+    'precio_unitario': 'Precio Unitario',
+    'total': 'Total',
+}
+
+
+def _filas_exportacion(user_id: str, filtros: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Ítems de los presupuestos del usuario que cumplen los filtros del Historial."""
+    supabase = get_supabase_client()
+
+    def consulta():
+        query = supabase.from_('items_en_presupuesto').select(
+            'nombre_personalizado, unidad, cantidad, precio_unitario, total, '
+            'categoria:categoria_id(nombre), '
+            'presupuesto:presupuesto_id!inner(id, fecha_creacion, descripcion, creado_por, '
+            'cliente:cliente_id(nombre), lugar:lugar_trabajo_id(nombre))'
+        ).eq('presupuesto.creado_por', user_id)
+
+        if filtros.get('cliente_id'):
+            query = query.eq('presupuesto.cliente_id', filtros['cliente_id'])
+        if filtros.get('lugar_trabajo_id'):
+            query = query.eq('presupuesto.lugar_trabajo_id', filtros['lugar_trabajo_id'])
+        if filtros.get('fecha_inicio'):
+            query = query.gte('presupuesto.fecha_creacion', filtros['fecha_inicio'].isoformat())
+        return query.order('presupuesto_id').order('id')
+
+    return [fila for pagina in paginas_consulta(consulta) for fila in pagina]
+
+
+def dataframe_exportacion(user_id: str, filtros: Dict[str, Any]) -> pd.DataFrame:
+    """Un DataFrame con una fila por ítem y columnas legibles."""
+    df = pd.json_normalize(_filas_exportacion(user_id, filtros))
+    df = df.reindex(columns=list(COLUMNAS)).rename(columns=COLUMNAS)
+
+    for col in ('Cantidad', 'Precio Unitario', 'Total'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    # Filas antiguas sin total guardado: cantidad * precio
+    sin_total = df['Total'] == 0
+    df.loc[sin_total, 'Total'] = df.loc[sin_total, 'Cantidad'] * df.loc[sin_total, 'Precio Unitario']
+
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce', utc=True).dt.date
+    df['Categoría'] = df['Categoría'].fillna('Sin Categoría')
+    return df
+
+
+def totales_exportacion(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(totales por categoría, totales por presupuesto)."""
+    claves = ['Presupuesto', 'Fecha', 'Cliente', 'Lugar']
+    por_categoria = df.groupby(claves + ['Categoría'], sort=False, dropna=False) \
+        .agg(Ítems=('Ítem', 'size'), Total=('Total', 'sum')).reset_index()
+    por_presupuesto = df.groupby(claves + ['Descripción'], sort=False, dropna=False) \
+        .agg(Ítems=('Ítem', 'size'), Total=('Total', 'sum')).reset_index()
+    return por_categoria, por_presupuesto
+
+
+def motor_excel() -> Optional[str]:
+    """Motor disponible para escribir XLSX (xlsxwriter u openpyxl)."""
+    for motor in ('xlsxwriter', 'openpyxl'):
+        try:
+            __import__(motor)
+            return motor
+        except ImportError:
+            continue
+    return None
+
+
+def exportar_csv(df: pd.DataFrame) -> bytes:
+    """CSV (UTF-8 con BOM para Excel) en memoria."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8-sig')
+    return buffer.getvalue()
+
+
+def exportar_xlsx(df: pd.DataFrame) -> bytes:
+    """Libro en memoria con hojas Ítems, Por categoría y Por presupuesto."""
+    motor = motor_excel()
+    if motor is None:
+        raise ImportError("Instale 'xlsxwriter' u 'openpyxl' para exportar a Excel.")
+
+    por_categoria, por_presupuesto = totales_exportacion(df)
+    # Sin constant_memory: pandas escribe por columnas y ese modo descarta celdas
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine=motor) as writer:
+        df.to_excel(writer, sheet_name='Ítems', index=False)
+        por_categoria.to_excel(writer, sheet_name='Por categoría', index=False)
+        por_presupuesto.to_excel(writer, sheet_name='Por presupuesto', index=False)
+    return buffer.getvalue()
+
+
+def mostrar_exportacion(user_id: str, filtros: Dict[str, Any]) -> None:
+    """Popover para exportar los presupuestos filtrados a Excel o CSV."""
+    with st.popover("⬇️ Exportar", use_container_width=True):
+        formatos = ["Excel (.xlsx)", "CSV"] if motor_excel() else ["CSV"]
+        formato = st.radio("Formato", formatos, horizontal=True, key="exportar_formato")
+
+        if st.button("📊 Generar archivo", key="exportar_generar", use_container_width=True):
+            try:
+                with st.spinner("Preparando exportación..."):
+                    df = dataframe_exportacion(user_id, filtros)
+                if df.empty:
+                    st.info("No hay ítems para exportar con los filtros seleccionados.")
+                    return
+
+                if formato == "CSV":
+                    datos, nombre, mime = exportar_csv(df), "presupuestos.csv", "text/csv"
+                else:
+                    datos = exportar_xlsx(df)
+                    nombre = "presupuestos.xlsx"
+                    mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+                st.caption(f"{df['Presupuesto'].nunique()} presupuestos · {len(df)} ítems")
+                st.download_button(f"⬇️ Descargar {nombre}", datos, file_name=nombre, mime=mime,
+                                   use_container_width=True, key="exportar_descarga")
+            except Exception as e:
+                st.error(f"Error al exportar: {str(e)}")
@@ -0,0 +1,688 @@
+import uuid
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# ==================== MODELO DE ÍTEMS Y CATEGORÍAS ====================
+# Los ítems viajaban como dicts sueltos con claves inconsistentes
+# ('nombre' vs 'nombre_personalizado', 'es_trabajo_simple' vs 'tipo').
+# Estas clases son el ÚNICO punto de normalización: se comportan como un
+# dict (item['total'], item.get('unidad')) para no romper la UI existente,
+# pero guardan los datos en __slots__ con tipos ya saneados.
+
+TIPO_NORMAL = 'normal'
+TIPO_TRABAJO_SIMPLE = 'trabajo_simple'
+TIPO_MANO_OBRA = 'mano_obra'
+
+NOMBRE_MANO_OBRA = 'Mano de Obra'
+
+
+def _numero(valor: Any) -> float:
+    """Convierte a número; devuelve int si el valor es entero (evita '3.0' en la UI)."""
+    try:
+        num = float(valor) if valor not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        return 0
+    return int(num) if num.is_integer() else num
+
+
+# Campos fijos del ítem y alias de claves heredadas
+_CLAVES_ITEM = (
+    'id', 'nombre', 'nombre_personalizado', 'unidad', 'cantidad', 'precio_unitario',
+    'total', 'categoria', 'categoria_id', 'notas', 'tipo', 'posicion', 'db_id',
+)
+_ALIAS_ITEM = {'nombre_personalizado': 'nombre'}
+_DERIVADAS_ITEM = ('es_trabajo_simple', 'es_mano_obra')
+
+
+class Item(MutableMapping):
+    """Ítem de presupuesto compacto con interfaz de dict."""
+
+    __slots__ = (
+        'id', 'nombre', 'unidad', '_cantidad', '_precio_unitario', '_total',
+        'categoria', 'categoria_id', 'notas', 'tipo', 'posicion', 'db_id', '_extra', '_owner',
+    )
+
+    def __init__(self, nombre: str = '', unidad: str = 'Unidad', cantidad: Any = 0,
+                 precio_unitario: Any = 0, total: Any = None, categoria: Optional[str] = None,
+                 categoria_id: Optional[int] = None, notas: str = '', tipo: str = TIPO_NORMAL,
+                 posicion: Optional[int] = None, id: Optional[str] = None, db_id: Optional[int] = None):
+        self.id = id or str(uuid.uuid4())
+        self.nombre = (nombre or '').strip()
+        self.unidad = unidad or 'Unidad'
+        self.categoria = categoria
+        self.categoria_id = categoria_id
+        self.notas = notas or ''
+        self.tipo = tipo or TIPO_NORMAL
+        self.posicion = posicion
+        self.db_id = db_id
+        self._extra = None
+        self._owner = None
+        self._cantidad = _numero(cantidad)
+        self._precio_unitario = _numero(precio_unitario)
+        if total is None or (self.tipo == TIPO_NORMAL and not total):
+            self._total = self._cantidad * self._precio_unitario
+        else:
+            self._total = _numero(total)
+        if self.tipo != TIPO_NORMAL:
+            # Trabajos simples y mano de obra: siempre 1 x monto
+            self._cantidad = 1
+            self._precio_unitario = self._total
+
+    # ---------- Campos con reglas de cálculo ----------
+    @property
+    def cantidad(self):
+        return self._cantidad
+
+    @cantidad.setter
+    def cantidad(self, valor: Any) -> None:
+        self._cantidad = _numero(valor)
+        if self.tipo == TIPO_NORMAL:
+            self._set_total(self._cantidad * self._precio_unitario)
+
+    @property
+    def precio_unitario(self):
+        return self._precio_unitario
+
+    @precio_unitario.setter
+    def precio_unitario(self, valor: Any) -> None:
+        self._precio_unitario = _numero(valor)
+        if self.tipo == TIPO_NORMAL:
+            self._set_total(self._cantidad * self._precio_unitario)
+
+    @property
+    def total(self):
+        return self._total
+
+    @total.setter
+    def total(self, valor: Any) -> None:
+        self._set_total(_numero(valor))
+        if self.tipo != TIPO_NORMAL:
+            self._cantidad = 1
+            self._precio_unitario = self._total
+
+    def _set_total(self, valor) -> None:
+        delta = valor - self._total
+        self._total = valor
+        if self._owner is not None:
+            self._owner._ajustar(delta)
+
+    @property
+    def es_trabajo_simple(self) -> bool:
+        return self.tipo == TIPO_TRABAJO_SIMPLE
+
+    @property
+    def es_mano_obra(self) -> bool:
+        return self.tipo == TIPO_MANO_OBRA
+
+    # ---------- Interfaz de dict ----------
+    def __getitem__(self, clave: str) -> Any:
+        clave = _ALIAS_ITEM.get(clave, clave)
+        if clave in _CLAVES_ITEM or clave in _DERIVADAS_ITEM:
+            return getattr(self, clave)
+        if self._extra and clave in self._extra:
+            return self._extra[clave]
+        raise KeyError(clave)
+
+    def __setitem__(self, clave: str, valor: Any) -> None:
+        clave = _ALIAS_ITEM.get(clave, clave)
+        if clave == 'es_trabajo_simple':
+            if valor:
+                self.tipo = TIPO_TRABAJO_SIMPLE
+        elif clave == 'es_mano_obra':
+            if valor:
+                self.tipo = TIPO_MANO_OBRA
+        elif clave in _CLAVES_ITEM:
+            setattr(self, clave, valor)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[clave] = valor
+        if self._owner is not None:
+            self._owner._ajustar(0)
+
+    def __delitem__(self, clave: str) -> None:
+        if self._extra and clave in self._extra:
+            del self._extra[clave]
+            return
+        raise KeyError(clave)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _CLAVES_ITEM
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(_CLAVES_ITEM) + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self) -> str:
+        return f"Item({self.nombre!r}, tipo={self.tipo!r}, total={self._total!r})"
+
+    def __reduce__(self):
+        # Sin la referencia a la categoría dueña (evita ciclos al serializar)
+        return (Item.from_dict, (self.to_dict(),))
+
+    # ---------- Conversión ----------
+    @classmethod
+    def from_dict(cls, datos: Any, categoria: Optional[str] = None) -> 'Item':
+        """Normaliza cualquier dict de ítem (UI, borrador o BD) a un Item."""
+        if isinstance(datos, cls):
+            if categoria and not datos.categoria:
+                datos.categoria = categoria
+            return datos
+
+        tipo = datos.get('tipo')
+        if datos.get('es_trabajo_simple'):
+            tipo = TIPO_TRABAJO_SIMPLE
+        elif datos.get('es_mano_obra'):
+            tipo = TIPO_MANO_OBRA
+
+        item = cls(
+            nombre=datos.get('nombre_personalizado') or datos.get('nombre') or '',
+            unidad=datos.get('unidad'),
+            cantidad=datos.get('cantidad'),
+            precio_unitario=datos.get('precio_unitario'),
+            total=datos.get('total'),
+            categoria=datos.get('categoria') or categoria,
+            categoria_id=datos.get('categoria_id'),
+            notas=datos.get('notas'),
+            tipo=tipo,
+            posicion=datos.get('posicion'),
+            id=datos.get('id') or None,
+            db_id=datos.get('db_id'),
+        )
+        extra = {k: v for k, v in datos.items() if k not in _CLAVES_ITEM and k not in _DERIVADAS_ITEM}
+        if extra:
+            item._extra = extra
+        return item
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Formato plano para borradores JSON y componentes que esperan dicts."""
+        datos = {clave: self[clave] for clave in _CLAVES_ITEM}
+        if self.es_trabajo_simple:
+            datos['es_trabajo_simple'] = True
+        if self._extra:
+            datos.update(self._extra)
+        return datos
+
+    def to_db_row(self, presupuesto_id: int, categoria_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Fila para 'items_en_presupuesto'. Devuelve None si el ítem no suma (total <= 0)."""
+        cantidad = int(self._cantidad or 0)
+        precio = float(self._precio_unitario or 0)
+        if cantidad * precio <= 0:
+            return None
+        return {
+            'presupuesto_id': presupuesto_id,
+            'categoria_id': categoria_id,
+            'nombre_personalizado': self.nombre or 'Sin nombre',
+            'unidad': self.unidad,
+            'cantidad': cantidad,
+            'precio_unitario': precio,
+            'notas': self.notas or (NOMBRE_MANO_OBRA if self.es_mano_obra else ''),
+        }
+
+
+class ListaItems(list):
+    """
+    Lista de Items que mantiene el total de su Categoria al agregar/quitar.
+    Cada operación ajusta el total con el delta del ítem (O(1)), sin recorrer la lista.
+    """
+
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner: 'Categoria', items: Any = ()):
+        super().__init__()
+        self._owner = owner
+        for item in items:
+            self.append(item)
+
+    def _entra(self, item: Any) -> Item:
+        item = Item.from_dict(item, self._owner.nombre)
+        if item._owner is not None and item._owner is not self._owner:
+            item._owner._ajustar(-item.total)
+        item._owner = self._owner
+        self._owner._ajustar(item.total)
+        return item
+
+    def _sale(self, item: Item) -> Item:
+        if item._owner is self._owner:
+            item._owner = None
+            self._owner._ajustar(-item.total)
+        return item
+
+    def append(self, item: Any) -> None:
+        super().append(self._entra(item))
+
+    def insert(self, indice: int, item: Any) -> None:
+        super().insert(indice, self._entra(item))
+
+    def extend(self, items: Any) -> None:
+        for item in items:
+            self.append(item)
+
+    def pop(self, indice: int = -1) -> Item:
+        return self._sale(super().pop(indice))
+
+    def remove(self, item: Any) -> None:
+        for i, actual in enumerate(self):
+            if actual is item:
+                self.pop(i)
+                return
+        raise ValueError(item)
+
+    def clear(self) -> None:
+        for item in self:
+            self._sale(item)
+        super().clear()
+
+    def __setitem__(self, indice: Any, item: Any) -> None:
+        if isinstance(indice, slice):
+            for viejo in self[indice]:
+                self._sale(viejo)
+            super().__setitem__(indice, [self._entra(it) for it in item])
+        else:
+            self._sale(self[indice])
+            super().__setitem__(indice, self._entra(item))
+
+    def __delitem__(self, indice: Any) -> None:
+        viejos = self[indice] if isinstance(indice, slice) else [self[indice]]
+        for viejo in viejos:
+            self._sale(viejo)
+        super().__delitem__(indice)
+
+    def __iadd__(self, items: Any) -> 'ListaItems':
+        self.extend(items)
+        return self
+
+    def __reduce__(self):
+        # Fuera de su Categoria se serializa como lista simple
+        return (list, (list(self),))
+
+
+_CLAVES_CATEGORIA = ('categoria_id', 'items', 'mano_obra')
+
+
+class Categoria(MutableMapping):
+    """Categoría del presupuesto: lista de Items + mano de obra, con interfaz de dict."""
+
+    __slots__ = ('nombre', 'categoria_id', '_items', '_mano_obra', '_extra', '_total_items', 'version')
+
+    def __init__(self, nombre: str = '', categoria_id: Optional[int] = None,
+                 items: Optional[List[Any]] = None, mano_obra: Any = 0):
+        self.nombre = nombre
+        self.categoria_id = categoria_id
+        self._extra = None
+        self._mano_obra = _numero(mano_obra)
+        # Totales acumulados: se ajustan por delta en cada alta/baja/edición de ítem
+        self._total_items = 0
+        self.version = 0
+        self._items = ListaItems(self)
+        self.items = items or []
+
+    def _ajustar(self, delta: float) -> None:
+        """Aplica un delta al total acumulado y marca la categoría como modificada."""
+        self._total_items += delta
+        self.version += 1
+
+    @property
+    def items(self) -> 'ListaItems':
+        return self._items
+
+    @items.setter
+    def items(self, valor: List[Any]) -> None:
+        if valor is self._items:
+            return
+        nuevos = list(valor)
+        self._items.clear()
+        self._items.extend(nuevos)
+
+    @property
+    def mano_obra(self):
+        return self._mano_obra
+
+    @mano_obra.setter
+    def mano_obra(self, valor: Any) -> None:
+        self._mano_obra = _numero(valor)
+        self.version += 1
+
+    @property
+    def total_items(self) -> float:
+        return self._total_items
+
+    @property
+    def total(self) -> float:
+        """Total de la categoría (ítems + mano de obra) en O(1)."""
+        return self._total_items + self._mano_obra
+
+    def recalcular(self) -> float:
+        """Recalcula el acumulado desde cero (para datos restaurados o corregir deriva)."""
+        self._total_items = sum(it.total for it in self._items)
+        self.version += 1
+        return self.total
+
+    def filas(self) -> List[Item]:
+        """Ítems a mostrar/guardar: los ítems + la mano de obra como fila (sin mutar la lista)."""
+        if self._mano_obra > 0:
+            return list(self._items) + [Item(
+                nombre=NOMBRE_MANO_OBRA, total=self._mano_obra, categoria=self.nombre,
+                tipo=TIPO_MANO_OBRA, notas=NOMBRE_MANO_OBRA,
+            )]
+        return self._items
+
+    # ---------- Interfaz de dict ----------
+    def __getitem__(self, clave: str) -> Any:
+        if clave in _CLAVES_CATEGORIA:
+            return getattr(self, clave)
+        if self._extra and clave in self._extra:
+            return self._extra[clave]
+        raise KeyError(clave)
+
+    def __setitem__(self, clave: str, valor: Any) -> None:
+        if clave in _CLAVES_CATEGORIA:
+            setattr(self, clave, valor)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[clave] = valor
+
+    def __delitem__(self, clave: str) -> None:
+        if self._extra and clave in self._extra:
+            del self._extra[clave]
+            return
+        raise KeyError(clave)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _CLAVES_CATEGORIA
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(_CLAVES_CATEGORIA) + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self) -> str:
+        return f"Categoria({self.nombre!r}, items={len(self._items)}, mano_obra={self._mano_obra!r})"
+
+    def __reduce__(self):
+        return (Categoria.from_dict, (self.to_dict(), self.nombre))
+
+    @classmethod
+    def from_dict(cls, datos: Any, nombre: str = '') -> 'Categoria':
+        if isinstance(datos, cls):
+            datos.nombre = datos.nombre or nombre
+            return datos
+        categoria = cls(
+            nombre=nombre,
+            categoria_id=datos.get('categoria_id'),
+            items=datos.get('items') or [],
+            mano_obra=datos.get('mano_obra', 0),
+        )
+        extra = {k: v for k, v in datos.items() if k not in _CLAVES_CATEGORIA}
+        if extra:
+            categoria._extra = extra
+        return categoria
+
+    def to_dict(self) -> Dict[str, Any]:
+        datos = {
+            'categoria_id': self.categoria_id,
+            'items': [it.to_dict() for it in self._items],
+            'mano_obra': self._mano_obra,
+        }
+        if self._extra:
+            datos.update(self._extra)
+        return datos
+
+
+# ==================== FUNCIONES SOBRE EL DICT DE CATEGORÍAS ====================
+def normalizar_categorias(categorias: Dict[str, Any]) -> Dict[str, Categoria]:
+    """
+    Convierte in-place cada categoría e ítem al modelo, asigna ids y deja las
+    posiciones densas (0..n-1) en el orden de la lista. Es idempotente: si las
+    posiciones ya son densas no se ordena nada (O(n) por categoría).
+    """
+    for cat_nombre in list(categorias.keys()):
+        categoria = Categoria.from_dict(categorias[cat_nombre], cat_nombre)
+        categorias[cat_nombre] = categoria
+        # ListaItems ya convierte cada elemento a Item al agregarlo
+        items = categoria.items
+        if all(item.posicion == i for i, item in enumerate(items)):
+            continue
+        for i, item in enumerate(items):
+            if item.posicion is None:
+                item.posicion = i
+        items.sort(key=lambda it: int(it.posicion or 0))
+        renumerar_posiciones(items)
+    return categorias
+
+
+def total_categorias(categorias: Dict[str, Any]) -> float:
+    """Total general: ítems + mano de obra de todas las categorías, en O(categorías)."""
+    if not categorias:
+        return 0
+    return sum(Categoria.from_dict(data, nombre).total for nombre, data in categorias.items())
+
+
+def categorias_a_dict(categorias: Dict[str, Any]) -> Dict[str, Any]:
+    """Serializa el dict de categorías a dicts planos (borradores JSON)."""
+    return {
+        nombre: (data.to_dict() if isinstance(data, Categoria) else Categoria.from_dict(data, nombre).to_dict())
+        for nombre, data in (categorias or {}).items()
+    }
+
+
+# Campos de un ítem que se guardan en una plantilla (sin ids ni posiciones)
+_CAMPOS_PLANTILLA = ('nombre', 'unidad', 'cantidad', 'precio_unitario', 'total', 'notas', 'tipo')
+
+
+def categorias_a_plantilla(categorias: Dict[str, Any]) -> Dict[str, Any]:
+    """Estructura reutilizable (categorías, ítems y mano de obra) sin ids de UI ni de BD."""
+    plantilla = {}
+    for nombre, data in (categorias or {}).items():
+        categoria = Categoria.from_dict(data, nombre)
+        plantilla[nombre] = {
+            'categoria_id': categoria.categoria_id,
+            'mano_obra': categoria.mano_obra,
+            'items': [{campo: item[campo] for campo in _CAMPOS_PLANTILLA} for item in categoria.items],
+        }
+    return plantilla
+
+
+def instanciar_plantilla(plantilla: Dict[str, Any]) -> Dict[str, Categoria]:
+    """Categorías nuevas (ids frescos, posiciones densas) listas para st.session_state."""
+    return normalizar_categorias({
+        nombre: Categoria.from_dict({
+            'categoria_id': data.get('categoria_id'),
+            'mano_obra': data.get('mano_obra', 0),
+            'items': [dict(item, categoria=nombre) for item in data.get('items', [])],
+        }, nombre)
+        for nombre, data in (plantilla or {}).items()
+    })
+
+
+def filas_db_por_item(categorias: Dict[str, Any], presupuesto_id: int,
+                      categorias_map: Dict[str, int]) -> List[Tuple[Item, Dict[str, Any]]]:
+    """Pares (ítem, fila de 'items_en_presupuesto'); la fila lleva 'id' si el ítem ya está en BD."""
+    pares = []
+    for cat_nombre, data in categorias.items():
+        categoria = Categoria.from_dict(data, cat_nombre)
+        cat_id = categorias_map.get(cat_nombre.lower())
+        for item in categoria.filas():
+            # La mano de obra 'general' no se asocia a ninguna categoría
+            item_cat_id = None if item.es_mano_obra and cat_nombre.lower() == 'general' else cat_id
+            fila = item.to_db_row(presupuesto_id, item_cat_id)
+            if fila:
+                if item.db_id:
+                    fila['id'] = item.db_id
+                pares.append((item, fila))
+    return pares
+
+
+def filas_db(categorias: Dict[str, Any], presupuesto_id: int, categorias_map: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Filas para insertar en 'items_en_presupuesto'.
+    categorias_map: nombre de categoría en minúsculas -> id de categoría.
+    """
+    filas = []
+    for _, fila in filas_db_por_item(categorias, presupuesto_id, categorias_map):
+        fila.pop('id', None)
+        filas.append(fila)
+    return filas
+
+
+# Campos de 'items_en_presupuesto' que se comparan al guardar una edición
+_CAMPOS_FILA = ('categoria_id', 'nombre_personalizado', 'unidad', 'cantidad', 'precio_unitario', 'notas')
+
+
+def _es_mano_obra(fila: Dict[str, Any]) -> bool:
+    return NOMBRE_MANO_OBRA.lower() in (fila.get('nombre_personalizado') or '').lower()
+
+
+def _fila_igual(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    for campo in _CAMPOS_FILA:
+        va, vb = a.get(campo), b.get(campo)
+        if campo in ('cantidad', 'precio_unitario'):
+            if _numero(va) != _numero(vb):
+                return False
+        elif (va or None) != (vb or None):
+            return False
+    return True
+
+
+def diff_filas(originales: List[Dict[str, Any]],
+               pares: List[Tuple[Item, Dict[str, Any]]]) -> Tuple[List[Tuple[Item, Dict[str, Any]]], List[int]]:
+    """
+    Compara las filas guardadas (con 'id') con las del presupuesto editado.
+    Devuelve (pares a enviar: nuevos o modificados, ids de filas a borrar).
+    La mano de obra no tiene id en la UI: se empareja por categoría.
+    """
+    por_id = {fila['id']: fila for fila in originales if fila.get('id')}
+    mano_obra = {}
+    for fila in originales:
+        if fila.get('id') and _es_mano_obra(fila):
+            mano_obra.setdefault(fila.get('categoria_id'), []).append(fila['id'])
+
+    enviar, vistos = [], set()
+    for item, fila in pares:
+        if 'id' not in fila and item.es_mano_obra:
+            libres = [i for i in mano_obra.get(fila['categoria_id'], []) if i not in vistos]
+            if libres:
+                fila['id'] = libres[0]
+        original = por_id.get(fila.get('id'))
+        if original is not None:
+            vistos.add(original['id'])
+            if _fila_igual(original, fila):
+                continue
+        enviar.append((item, fila))
+
+    borrar = [fila_id for fila_id in por_id if fila_id not in vistos]
+    return enviar, borrar
+
+
+# ==================== REORDENAMIENTO ====================
+# Las posiciones son un índice denso por categoría (item.posicion == índice
+# en la lista). Cada operación toca solo los ítems que cambian y los devuelve
+# para que el llamador persista únicamente esas posiciones.
+def renumerar_posiciones(items: List[Item], desde: int = 0) -> List[Item]:
+    """Reasigna posiciones densas desde 'desde' y devuelve los ítems que cambiaron."""
+    cambiados = []
+    for i in range(desde, len(items)):
+        if items[i].posicion != i:
+            items[i].posicion = i
+            cambiados.append(items[i])
+    return cambiados
+
+
+def mover_item(categoria: Categoria, indice: int, delta: int) -> List[Item]:
+    """Intercambia el ítem con su vecino (delta=-1 sube, +1 baja). O(1)."""
+    items = categoria.items
+    destino = indice + delta
+    if not (0 <= indice < len(items) and 0 <= destino < len(items)):
+        return []
+    # Intercambio directo: ambos siguen en la misma categoría, el total no cambia
+    a, b = items[indice], items[destino]
+    list.__setitem__(items, indice, b)
+    list.__setitem__(items, destino, a)
+    a.posicion, b.posicion = destino, indice
+    categoria._ajustar(0)
+    return [a, b]
+
+
+def mover_a_categoria(categorias: Dict[str, Any], origen: str, indice: int, destino: str) -> List[Item]:
+    """Mueve el ítem al final de otra categoría. O(k) con k = ítems tras él en el origen."""
+    items_origen = categorias[origen].items
+    item = items_origen.pop(indice)
+    cambiados = renumerar_posiciones(items_origen, indice)
+
+    if destino not in categorias:
+        categorias[destino] = Categoria(nombre=destino)
+    categoria_destino = categorias[destino]
+    item['categoria'] = destino
+    item.posicion = len(categoria_destino.items)
+    categoria_destino.items.append(item)
+    return [item] + cambiados
+
+
+def eliminar_item(categoria: Categoria, indice: int) -> Tuple[Item, List[Item]]:
+    """Quita el ítem de la categoría; devuelve (eliminado, ítems con posición cambiada)."""
+    item = categoria.items.pop(indice)
+    return item, renumerar_posiciones(categoria.items, indice)
+
+
+# ==================== VERSIONES (DELTAS DE FILAS) ====================
+# Una versión guarda solo lo que cambió respecto de la anterior:
+#   {'agregados': [fila], 'modificados': [{'id', campos cambiados}], 'eliminados': [id]}
+# La versión 1 es la base (todas sus filas como 'agregados'). Reconstruir la
+# versión N es aplicar los deltas 1..N en orden.
+def _fila_compacta(fila: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': fila.get('id'), **{campo: fila.get(campo) for campo in _CAMPOS_FILA}}
+
+
+def delta_filas(antes: List[Dict[str, Any]], despues: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Delta a nivel de ítem entre dos listas de filas con 'id'."""
+    previas = {fila['id']: fila for fila in antes if fila.get('id')}
+    delta = {'agregados': [], 'modificados': [], 'eliminados': []}
+    vistos = set()
+    for fila in despues:
+        previa = previas.get(fila.get('id'))
+        if previa is None:
+            delta['agregados'].append(_fila_compacta(fila))
+            continue
+        vistos.add(previa['id'])
+        if not _fila_igual(previa, fila):
+            cambios = {campo: fila.get(campo) for campo in _CAMPOS_FILA
+                       if not _fila_igual({campo: previa.get(campo)}, {campo: fila.get(campo)})}
+            delta['modificados'].append({'id': previa['id'], **cambios})
+    delta['eliminados'] = [fila_id for fila_id in previas if fila_id not in vistos]
+    return delta
+
+
+def aplicar_delta(filas: Dict[Any, Dict[str, Any]], delta: Dict[str, List[Any]]) -> Dict[Any, Dict[str, Any]]:
+    """Aplica un delta in-place sobre {id: fila} y lo devuelve."""
+    for fila_id in delta.get('eliminados', []):
+        filas.pop(fila_id, None)
+    for cambio in delta.get('modificados', []):
+        if cambio['id'] in filas:
+            filas[cambio['id']].update(cambio)
+    for fila in delta.get('agregados', []):
+        filas[fila['id']] = dict(fila)
+    return filas
+
+
+def reconstruir_version(versiones: List[Dict[str, Any]], numero: int) -> List[Dict[str, Any]]:
+    """Filas de la versión 'numero' a partir de la lista de versiones ordenada."""
+    filas: Dict[Any, Dict[str, Any]] = {}
+    for version in versiones:
+        if version['numero'] > numero:
+            break
+        aplicar_delta(filas, version.get('delta') or {})
+    return list(filas.values())
+
+
+def diff_versiones(filas_a: List[Dict[str, Any]], filas_b: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filas para mostrar la diferencia entre dos versiones, con su 'estado'."""
+    delta = delta_filas(filas_a, filas_b)
+    por_id_a = {fila['id']: fila for fila in filas_a}
+    por_id_b = {fila['id']: fila for fila in filas_b}
+    resultado = [{'estado': 'agregado', **fila} for fila in delta['agregados']]
+    for cambio in delta['modificados']:
+        resultado.append({'estado': 'modificado', **por_id_b[cambio['id']]})
+    resultado += [{'estado': 'eliminado', **por_id_a[fila_id]} for fila_id in delta['eliminados']]
+    return resultado
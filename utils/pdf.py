@@ -1,11 +1,26 @@
 import tempfile
 import os
 import base64
+import threading
+import uuid
 import streamlit as st
-from datetime import datetime
-from typing import Optional, Tuple, Dict, Any
+import hashlib
+import json
+from datetime import date, datetime, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Tuple, Dict, Any, Callable, Deque, List, NamedTuple
 from fpdf import FPDF
-from utils.db import get_presupuesto_detallado
+from utils.db import (
+    get_presupuesto_detallado,
+    get_estado_cuenta_detallado,
+    CAMPOS_DOSSIER,
+    contar_documentos_dossier,
+    iter_presupuestos_detallados,
+    iter_estados_cuenta_detallados
+)
+from utils.items import Categoria, categorias_a_dict
 import locale
 
 try:
@@ -25,7 +40,6 @@ def formato_moneda(valor: float) -> str:
     # Usa coma como separador de decimales y punto para miles
     return f"${valor:,.0f}".replace(",", ".")
 
-# ==========  SECCION PDF ==========
 # ==========  SECCION PDF ==========
 # Datos constantes
 EMPRESA = "Jardines Alvarez"
@@ -33,293 +47,506 @@ CONTACTO_NOMBRE = "Jhonny Nicolas Alvarez"
 CONTACTO_TELEFONO = "+569 6904 2513"
 CONTACTO_EMAIL = "jhonnynicolasalvarez@gmail.com"
 
-def generar_pdf(cliente_nombre: str, categorias: Dict[str, Any], lugar_cliente: str, descripcion: Optional[str] = None) -> str:
-    """
-    Genera un archivo PDF con los datos del presupuesto
-    """
-
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("helvetica", size=11)
-        
-        # Configurar márgenes
-        pdf.set_margins(left=10, top=10, right=10)
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        # Encabezado
-        COLOR_FONDO = (157, 178, 111)
-        pdf.set_fill_color(*COLOR_FONDO)
-
-        ALTO_FRANJA = 26
-        MARGEN_X = 10
-
-        # 1. Crear la franja de fondo verde
-        y_inicio_fondo = pdf.get_y()
-        pdf.set_xy(0, y_inicio_fondo)
-        pdf.set_fill_color(175, 192, 138)
-        pdf.cell(pdf.w, ALTO_FRANJA, "", border=0, ln=1, fill=True)
-
-        # 2. Texto sobre la franja
-        pdf.set_text_color(36, 36, 36)
-
-        # a)"Presupuesto"
-        pdf.set_y(y_inicio_fondo + 5)
-        pdf.set_x(MARGEN_X)
-        pdf.set_font("helvetica", style='B', size=24)
-        pdf.cell(100, 10, "Presupuesto", border=0, ln=0, align='L', fill=False)
-
-        # b)Nombre de la Empresa
-        pdf.set_x(MARGEN_X)
-        pdf.set_font("helvetica", style='', size=18)
-        pdf.cell(102, 26, EMPRESA.title(), border=0, ln=0, align='L', fill=False)
-
-        # c)Línea negra debajo del nombre de la empresa
-        y_linea = pdf.get_y() + 17
-        pdf.set_draw_color(56, 56, 56)
-        pdf.set_line_width(0.8)
-        pdf.line(MARGEN_X, y_linea, MARGEN_X + 85, y_linea)
-
-        # d)Línea verde debajo franja verde
-        y_linea = pdf.get_y() + 23 
-        pdf.set_draw_color(175, 192, 138)
-        pdf.set_line_width(0.8)
-        pdf.line(0, y_linea, pdf.w, y_linea)
-
-        # e)Lugar del cliente
-        pdf.set_font("helvetica", style='B', size=22)
-        pdf.set_y(y_inicio_fondo + (ALTO_FRANJA / 2) - 6)
-
-        ANCHO_UTIL_PAGINA = 190 
-        MARGEN_DERECHO = 10 
-        ANCHO_MULTICELL = 90
-        POSICION_X_INICIO = ANCHO_UTIL_PAGINA - ANCHO_MULTICELL + MARGEN_DERECHO
-
-        pdf.set_x(POSICION_X_INICIO) 
-        pdf.multi_cell(
-            w=ANCHO_MULTICELL, 
-            h=7,
-            txt=lugar_cliente.title(), 
-            border=0, 
-            align='C', 
-            fill=False
-        )
-
-        pdf.ln(15) 
-
-        # Fecha y datos de contacto
-        fecha_actual = datetime.now().strftime("%d %B, %Y")
-        pdf.ln(2)
-        pdf.set_font("helvetica", size=12)
-
-        # --- Columna izquierda: datos de contacto ---
-        x_inicio = pdf.get_x()
-        y_inicio = pdf.get_y()
-
-        pdf.cell(95, 5, CONTACTO_NOMBRE, border=0, ln=True)
-        pdf.cell(95, 5, CONTACTO_TELEFONO, border=0, ln=True)
-        pdf.cell(95, 5, CONTACTO_EMAIL, border=0, ln=True)
-
-        y_fin_contacto = pdf.get_y()
-
-        # Línea vertical
-        pdf.set_draw_color(56, 56, 56)
-        pdf.set_line_width(0.6)
-        x_linea = x_inicio + 80
-        pdf.line(x_linea, y_inicio, x_linea, y_fin_contacto)
+EMISOR_PREDETERMINADO = {
+    "empresa": EMPRESA,
+    "nombre": CONTACTO_NOMBRE,
+    "telefono": CONTACTO_TELEFONO,
+    "email": CONTACTO_EMAIL,
+}
+
+# ========== FUENTES Y TAMAÑO DE SALIDA ==========
+# Por defecto se usan fuentes base (helvetica, latin-1, no se incrustan).
+# Si existen los TTF en assets/fonts se usan en su lugar: fpdf2 incrusta solo
+# los glifos usados (subconjunto), con soporte completo de tildes y ñ.
+_DIR_FUENTES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "fonts")
+FUENTES_TTF = {
+    "": os.path.join(_DIR_FUENTES, "DejaVuSans.ttf"),
+    "B": os.path.join(_DIR_FUENTES, "DejaVuSans-Bold.ttf"),
+    "I": os.path.join(_DIR_FUENTES, "DejaVuSans-Oblique.ttf"),
+}
+USAR_TTF = all(os.path.exists(ruta) for ruta in FUENTES_TTF.values())
+COMPRIMIR_PDF = True
+
+# Salida reproducible: la fecha del encabezado sale de la fecha guardada del
+# documento y los metadatos son fijos, así el mismo presupuesto da los mismos
+# bytes (sirve para cachear y comparar por hash).
+DETERMINISTA = True
+FECHA_CREACION_FIJA = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+# Últimos informes de tamaño (uno por documento generado)
+INFORMES_PDF: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+# Estilo común
+FUENTE = "dejavu" if USAR_TTF else "helvetica"
+COLOR_TEXTO = (36, 36, 36)
+COLOR_BORDE = (56, 56, 56)
+COLOR_FRANJA = (175, 192, 138)
+COLOR_DESTACADO = (194, 207, 165)
+MARGEN_X = 10
+ANCHO_UTIL = 190
+ALTO_LINEA = 6
+
+# ========== MOTOR DE MAQUETACIÓN ==========
+# Un documento se describe con un EspecDocumento (encabezado, columnas de la
+# tabla, cuadro de total) y se dibuja con las mismas piezas: encabezado con
+# franja, Tabla con anchos precalculados que repite su encabezado al saltar
+# de página, y cuadro de total.
+
+class Columna(NamedTuple):
+    titulo: str
+    ancho: float
+    align: str = 'L'           # alineación de los datos
+    align_titulo: str = 'L'    # alineación del encabezado
+
+
+class EspecDocumento(NamedTuple):
+    titulo: str
+    tamano_titulo: int
+    tamano_empresa: int
+    tamano_lugar: int
+    columnas: Tuple[Columna, ...]
+    limite_y: float            # sobre esta altura se salta de página antes de una fila
+    separacion_tabla: float    # espacio entre la franja de descripción y la tabla
+    etiqueta_total: str
+    ancho_total: float
+    tamano_etiqueta_total: int
+    tamano_valor_total: int
+    dy_valor_total: float
+
+
+ESPEC_PRESUPUESTO = EspecDocumento(
+    titulo="Presupuesto",
+    tamano_titulo=24,
+    tamano_empresa=18,
+    tamano_lugar=22,
+    columnas=(
+        Columna("Insumo", 75),
+        Columna("Unidad", 25, 'C', 'C'),
+        Columna("Cantidad", 20, 'C', 'C'),
+        Columna("Precio Unitario", 35, 'R', 'C'),
+        Columna("Total", 35, 'R', 'C'),
+    ),
+    limite_y=270,
+    separacion_tabla=3,
+    etiqueta_total="Total",
+    ancho_total=40,
+    tamano_etiqueta_total=11,
+    tamano_valor_total=14,
+    dy_valor_total=6,
+)
+
+ESPEC_ESTADO_CUENTA = EspecDocumento(
+    titulo="Estado de Cuenta N°",
+    tamano_titulo=22,
+    tamano_empresa=16,
+    tamano_lugar=20,
+    columnas=(
+        Columna("Descripción del Servicio / Período", 140),
+        Columna("Total", 50, 'R', 'R'),
+    ),
+    limite_y=260,
+    separacion_tabla=5,
+    etiqueta_total="Total Pendiente",
+    ancho_total=55,
+    tamano_etiqueta_total=10,
+    tamano_valor_total=13,
+    dy_valor_total=7,
+)
+
+
+class DocumentoPDF(FPDF):
+    """FPDF con callbacks de encabezado/pie de página y la tabla en curso."""
+
+    def __init__(self, encabezado: Optional[Callable[['DocumentoPDF'], None]] = None,
+                 pie: Optional[Callable[['DocumentoPDF'], None]] = None,
+                 fecha: Optional[datetime] = None):
+        super().__init__()
+        if DETERMINISTA:
+            self.set_creation_date(fecha or FECHA_CREACION_FIJA)
+            self.set_author(EMPRESA)
+            self.set_creator(EMPRESA)
+        self._encabezado = encabezado
+        self._pie = pie
+        self.tabla_activa: Optional['Tabla'] = None
+        self.set_compression(COMPRIMIR_PDF)
+        if USAR_TTF:
+            for estilo, ruta in FUENTES_TTF.items():
+                self.add_font(FUENTE, style=estilo, fname=ruta)
+        self.set_margins(left=MARGEN_X, top=10, right=MARGEN_X)
+        self.set_auto_page_break(auto=True, margin=15)
+
+    # set_draw_color/set_fill_color/set_line_width de FPDF ya omiten la
+    # operación si el valor coincide con self.draw_color/fill_color/line_width,
+    # que FPDF mantiene al día en saltos de página y local_context.
+
+    def a_bytes(self, nombre: str = "") -> bytes:
+        """Serializa el documento y registra su informe de tamaño."""
+        datos = bytes(self.output())
+        INFORMES_PDF.append({
+            "documento": nombre,
+            "paginas": self.page_no(),
+            "bytes": len(datos),
+            "comprimido": COMPRIMIR_PDF,
+            "fuente": FUENTE,
+            "sha256": hashlib.sha256(datos).hexdigest(),
+        })
+        return datos
+
+    def header(self):
+        if self._encabezado:
+            self._encabezado(self)
+        # Si la página nueva corta una tabla, se repiten sus títulos
+        if self.tabla_activa is not None:
+            self.tabla_activa.dibujar_encabezado(self)
+
+    def footer(self):
+        if self._pie:
+            self._pie(self)
+
+
+# Divisiones de texto ya calculadas: los mismos nombres ("Mano de Obra",
+# insumos frecuentes) se repiten entre filas y entre documentos.
+_LINEAS_CACHE: Dict[Tuple[str, float, str, str, float], List[str]] = {}
+_LINEAS_CACHE_MAX = 4096
+
+
+def _dividir_lineas(pdf: FPDF, ancho: float, texto: str) -> List[str]:
+    """Líneas en que se divide 'texto' con la fuente actual, calculadas una vez."""
+    clave = (texto, ancho, pdf.font_family, pdf.font_style, pdf.font_size_pt)
+    lineas = _LINEAS_CACHE.get(clave)
+    if lineas is None:
+        lineas = pdf.multi_cell(ancho, ALTO_LINEA, texto, split_only=True) or [""]
+        if len(_LINEAS_CACHE) >= _LINEAS_CACHE_MAX:
+            _LINEAS_CACHE.clear()
+        _LINEAS_CACHE[clave] = lineas
+    return lineas
+
+
+class Tabla:
+    """Tabla con anchos precalculados y encabezado repetido en cada salto de página."""
+
+    def __init__(self, columnas: Tuple[Columna, ...], limite_y: float, alto: float = ALTO_LINEA):
+        self.columnas = columnas
+        self.limite_y = limite_y
+        self.alto = alto
+        self.anchos = [c.ancho for c in columnas]
+        self.ancho_total = sum(self.anchos)
+        # Ancho de la celda combinada (todas las columnas menos la última)
+        self.ancho_combinado = self.ancho_total - self.anchos[-1]
+
+    def dibujar_encabezado(self, pdf: FPDF) -> None:
+        pdf.set_font(FUENTE, style='B', size=11)
+        pdf.set_draw_color(*COLOR_BORDE)
+        pdf.set_line_width(0.3)
+        ultima = len(self.columnas) - 1
+        for i, col in enumerate(self.columnas):
+            pdf.cell(col.ancho, self.alto, col.titulo, border='B', ln=(i == ultima), align=col.align_titulo)
+
+    @contextmanager
+    def en(self, pdf: DocumentoPDF):
+        """Dibuja el encabezado y mantiene la tabla activa mientras se agregan filas."""
+        self.dibujar_encabezado(pdf)
+        pdf.tabla_activa = self
+        try:
+            yield self
+        finally:
+            pdf.tabla_activa = None
 
-        # --- Columna derecha: Cliente y fecha ---
-        pdf.set_xy(x_linea + 5, y_inicio)
+    def _asegurar_espacio(self, pdf: FPDF, alto: float) -> None:
+        if pdf.get_y() > self.limite_y or pdf.get_y() + alto > pdf.page_break_trigger:
+            pdf.add_page()
 
-        pdf.set_font("helvetica", style='B', size=10)
-        pdf.cell(40, 5, "Cliente:", border=0)
+    def fila(self, pdf: FPDF, valores: List[str]) -> None:
+        """Fila con la primera columna multilínea; se mide una vez y se dibuja en una pasada."""
+        pdf.set_font(FUENTE, size=11)
+        primera = self.columnas[0]
+
+        lineas = _dividir_lineas(pdf, primera.ancho, valores[0])
+        alto_fila = max(self.alto, len(lineas) * self.alto)
+        self._asegurar_espacio(pdf, alto_fila)
+
+        x, y = pdf.get_x(), pdf.get_y()
+        # Primera columna: líneas ya divididas + un solo borde para toda la celda
+        for i, linea in enumerate(lineas):
+            pdf.set_xy(x, y + i * self.alto)
+            pdf.cell(primera.ancho, self.alto, linea, border=0, align=primera.align)
+        pdf.rect(x, y, primera.ancho, alto_fila)
+
+        pdf.set_xy(x + primera.ancho, y)
+        for col, valor in zip(self.columnas[1:], valores[1:]):
+            pdf.cell(col.ancho, alto_fila, valor, border=1, align=col.align)
+        pdf.ln(alto_fila)
+
+    def fila_combinada(self, pdf: FPDF, texto: str, valor: str, estilo: str = '', align: str = 'L') -> None:
+        """Fila de dos celdas: texto sobre las columnas combinadas y valor en la última."""
+        self._asegurar_espacio(pdf, self.alto)
+        pdf.set_font(FUENTE, style=estilo, size=11)
+        pdf.cell(self.ancho_combinado, self.alto, texto, border=1, align=align)
+        pdf.cell(self.anchos[-1], self.alto, valor, border=1, ln=True, align=self.columnas[-1].align)
+
+
+def _datos_emisor(datos_emisor: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """Completa los datos del emisor con los valores por defecto del documento."""
+    if datos_emisor is None:
+        return EMISOR_PREDETERMINADO
+    return {
+        "empresa": datos_emisor.get("empresa", "Mi Empresa"),
+        "nombre": datos_emisor.get("nombre", "Contacto"),
+        "telefono": datos_emisor.get("telefono", ""),
+        "email": datos_emisor.get("email", ""),
+    }
+
+
+X_COLUMNA_CLIENTE = MARGEN_X + 80 + 5
+
+
+def fecha_documento(valor: Any) -> Optional[datetime]:
+    """Fecha guardada (fecha_creacion / fecha_emision) como datetime UTC a medianoche."""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        dia = valor.date()
+    elif isinstance(valor, date):
+        dia = valor
+    else:
+        texto = str(valor)[:10]
+        try:
+            dia = date.fromisoformat(texto)
+        except ValueError:
+            try:
+                dia = datetime.strptime(texto, "%d/%m/%Y").date()
+            except ValueError:
+                return None
+    return datetime(dia.year, dia.month, dia.day, tzinfo=timezone.utc)
+
+
+def _dibujar_encabezado(pdf: FPDF, espec: EspecDocumento, emisor: Dict[str, str],
+                        lugar: str, cliente: str, texto_franja: str,
+                        fecha: Optional[datetime] = None) -> None:
+    """Franja con título, empresa y lugar; contacto, cliente y fecha; franja de descripción."""
+    # 1. Franja de fondo verde
+    y_inicio_fondo = pdf.get_y()
+    ALTO_FRANJA = 26
+    pdf.set_xy(0, y_inicio_fondo)
+    pdf.set_fill_color(*COLOR_FRANJA)
+    pdf.cell(pdf.w, ALTO_FRANJA, "", border=0, ln=1, fill=True)
+
+    # 2. Texto sobre la franja
+    pdf.set_text_color(*COLOR_TEXTO)
+
+    # a) Título del documento
+    pdf.set_y(y_inicio_fondo + 5)
+    pdf.set_x(MARGEN_X)
+    pdf.set_font(FUENTE, style='B', size=espec.tamano_titulo)
+    pdf.cell(100, 10, espec.titulo, border=0, ln=0, align='L', fill=False)
+
+    # b) Nombre de la empresa
+    pdf.set_x(MARGEN_X)
+    pdf.set_font(FUENTE, style='', size=espec.tamano_empresa)
+    pdf.cell(102, 26, emisor["empresa"].title(), border=0, ln=0, align='L', fill=False)
+
+    # c) Línea negra debajo del nombre de la empresa
+    y_linea = pdf.get_y() + 17
+    pdf.set_draw_color(*COLOR_BORDE)
+    pdf.set_line_width(0.8)
+    pdf.line(MARGEN_X, y_linea, MARGEN_X + 85, y_linea)
+
+    # d) Línea verde debajo de la franja
+    y_linea = pdf.get_y() + 23
+    pdf.set_draw_color(*COLOR_FRANJA)
+    pdf.set_line_width(0.8)
+    pdf.line(0, y_linea, pdf.w, y_linea)
+
+    # e) Lugar del cliente en el extremo derecho
+    pdf.set_font(FUENTE, style='B', size=espec.tamano_lugar)
+    pdf.set_y(y_inicio_fondo + (ALTO_FRANJA / 2) - 6)
+    ANCHO_MULTICELL = 90
+    pdf.set_x(ANCHO_UTIL - ANCHO_MULTICELL + MARGEN_X)
+    pdf.multi_cell(w=ANCHO_MULTICELL, h=7, txt=lugar.title(), border=0, align='C', fill=False)
+
+    pdf.ln(15)
+    pdf.ln(2)
+
+    # --- Columna izquierda: datos de contacto ---
+    pdf.set_font(FUENTE, size=12)
+    pdf.set_x(MARGEN_X)
+    y_inicio = pdf.get_y()
+    pdf.cell(95, 5, emisor["nombre"], border=0, ln=True)
+    pdf.cell(95, 5, emisor["telefono"], border=0, ln=True)
+    pdf.cell(95, 5, emisor["email"], border=0, ln=True)
+
+    # Línea vertical divisoria
+    pdf.set_draw_color(*COLOR_BORDE)
+    pdf.set_line_width(0.6)
+    x_linea = X_COLUMNA_CLIENTE - 5
+    pdf.line(x_linea, y_inicio, x_linea, pdf.get_y())
+
+    # --- Columna derecha: cliente y fecha ---
+    pdf.set_xy(X_COLUMNA_CLIENTE, y_inicio)
+    pdf.set_font(FUENTE, style='B', size=10)
+    pdf.cell(40, 5, "Cliente:", border=0)
+    fecha_actual = (fecha or datetime.now()).strftime("%d %B, %Y")
+    pdf.set_font(FUENTE, size=12)
+    pdf.cell(0, 5, fecha_actual, border=0, ln=True, align='R')
+    pdf.set_x(X_COLUMNA_CLIENTE)
+    pdf.cell(0, 6, cliente.title(), border=0, ln=True)
+
+    # Franja 2: descripción del trabajo
+    y_inicio_fondo = pdf.get_y()
+    ALTO = 7
+    pdf.set_xy(MARGEN_X, y_inicio_fondo + 10)
+    pdf.set_fill_color(*COLOR_FRANJA)
+    pdf.cell(pdf.w - 2 * MARGEN_X, ALTO, "", border=0, ln=1, fill=True)
+
+    pdf.set_text_color(*COLOR_TEXTO)
+    pdf.set_font(FUENTE, style='B', size=12)
+    pdf.set_y(y_inicio_fondo + (ALTO / 2) + 7)
+    pdf.set_x(MARGEN_X + 5)
+    pdf.cell(0, 6, texto_franja, border=0, ln=1, align='C')
+
+    pdf.ln(espec.separacion_tabla)
+
+
+def _dibujar_total(pdf: FPDF, espec: EspecDocumento, total: float) -> None:
+    """Cuadro destacado con el total, alineado al margen derecho."""
+    if pdf.get_y() > espec.limite_y:
+        pdf.add_page()
 
-        pdf.set_font("helvetica", size=12)
-        pdf.cell(0, 5, fecha_actual, border=0, ln=True, align='R')
+    pdf.set_fill_color(*COLOR_DESTACADO)
+    ALTO_TOTAL = 15
+    x_inicial = pdf.w - espec.ancho_total - MARGEN_X
+    y_inicial = pdf.get_y()
+    pdf.rect(x_inicial, y_inicial, espec.ancho_total, ALTO_TOTAL, style='F')
 
-        pdf.set_x(x_linea + 5)
-        pdf.set_font("helvetica", size=12)
-        pdf.cell(0, 6, cliente_nombre.title(), border=0, ln=True)
+    pdf.set_xy(x_inicial + 4, y_inicial + 2)
+    pdf.set_font(FUENTE, style='B', size=espec.tamano_etiqueta_total)
+    pdf.cell(0, 5, espec.etiqueta_total, border=0)
 
-        # Franja 2
-        y_inicio_fondo = pdf.get_y()
-        MARGEN_X_FRANJA = 10
-        ALTO = 7
+    pdf.set_font(FUENTE, style='B', size=espec.tamano_valor_total)
+    pdf.set_xy(x_inicial, y_inicial + espec.dy_valor_total)
+    pdf.cell(espec.ancho_total, 8, formato_moneda(total), border=0, align='C')
 
-        pdf.set_xy(MARGEN_X_FRANJA, y_inicio_fondo + 10)
-        pdf.set_fill_color(175, 192, 138)
-        pdf.cell(pdf.w - 2 * MARGEN_X_FRANJA, ALTO, "", border=0, ln=1, fill=True)
 
-        pdf.set_text_color(36, 36, 36)
-        pdf.set_font("helvetica", style='B', size=12)
+def _iniciar_documento(pdf: DocumentoPDF, espec: EspecDocumento, emisor: Dict[str, str], lugar: str,
+                       cliente: str, texto_franja: str, nueva_pagina: bool = True,
+                       seccion: Optional[str] = None, fecha: Optional[datetime] = None) -> None:
+    """Abre la primera página de un documento (propio o dentro de un dossier) con su encabezado."""
+    if nueva_pagina:
+        pdf.add_page()
+    if seccion:
+        pdf.start_section(seccion)
+    pdf.set_font(FUENTE, size=11)
+    _dibujar_encabezado(pdf, espec, emisor, lugar, cliente, texto_franja, fecha)
+
+
+# ========== DOCUMENTOS ==========
+def _dibujar_presupuesto(pdf: DocumentoPDF, cliente_nombre: str, categorias: Dict[str, Any], lugar_cliente: str,
+                         descripcion: Optional[str] = None, nueva_pagina: bool = True,
+                         seccion: Optional[str] = None, fecha: Optional[datetime] = None) -> None:
+    """Dibuja un presupuesto completo a partir de la página actual del documento."""
+    espec = ESPEC_PRESUPUESTO
+    texto_franja = descripcion.strip().capitalize() if descripcion else "Trabajo a Realizar"
+    _iniciar_documento(pdf, espec, EMISOR_PREDETERMINADO, lugar_cliente, cliente_nombre, texto_franja,
+                       nueva_pagina, seccion, fecha)
+    tabla = Tabla(espec.columnas, espec.limite_y)
+
+    total_general = 0
+    for categoria, data in categorias.items():
+        # Mano de obra como un ítem más (sin modificar la lista original)
+        items = Categoria.from_dict(data, categoria).filas()
+        if not items:
+            continue
+
+        if pdf.get_y() > espec.limite_y:
+            pdf.add_page()
 
-        pdf.set_y(y_inicio_fondo + (ALTO / 2) + 7) 
-        pdf.set_x(MARGEN_X_FRANJA + 5)
-        
-        texto_franja = descripcion.strip().capitalize() if descripcion else "Trabajo a Realizar"
-        pdf.cell(0, 6, texto_franja, border=0, ln=1, align='C')
-
-        pdf.ln(3)
-
-        # Presupuesto por categoría
-        total_general = 0
-
-        for categoria, data in categorias.items():
-            items = data.get('items', [])
-            mano_obra = data.get('mano_obra', 0)
-
-            # 👍 Insertar mano de obra como un ítem
-            if mano_obra > 0:
-                items.append({
-                    'nombre_personalizado': 'Mano de Obra',
-                    'unidad': 'Unidad',
-                    'cantidad': 1,
-                    'precio_unitario': mano_obra,
-                    'total': mano_obra,
-                    'es_mano_obra': True
-                })
-
-            if not items:
-                continue
-
-            # Nueva página si es necesario
-            if pdf.get_y() > 270:
-                pdf.add_page()
-                pdf.set_y(10)
-
-            # Título categoría
-            pdf.set_font("helvetica", style='B', size=12)
-            pdf.cell(200, 6, categoria.title(), ln=True)
-
-            # Línea debajo del título con ancho 0.5
-            pdf.set_line_width(0.8)
-            pdf.set_draw_color(194, 207, 165)
-            margen_izquierdo = 10
-            ancho_total = 190
-            y_linea = pdf.get_y() + 0.2
-            pdf.line(margen_izquierdo, y_linea, margen_izquierdo + ancho_total, y_linea)
-            pdf.ln(2)
-
-            # Encabezados de tabla con ancho 0.3
-            pdf.set_font("helvetica", style='B', size=11)
-            pdf.set_draw_color(56, 56, 56)
-            pdf.set_line_width(0.3)  # Establecemos 0.3 para la tabla
-            pdf.cell(75, 6, "Insumo", border='B')
-            pdf.cell(25, 6, "Unidad", border='B', align='C')
-            pdf.cell(20, 6, "Cantidad", border='B', align='C')
-            pdf.cell(35, 6, "Precio Unitario", border='B', align='C')
-            pdf.cell(35, 6, "Total", border='B', ln=True, align='C')
-
-            total_categoria = 0
+        # Título de la categoría con su línea
+        pdf.set_font(FUENTE, style='B', size=12)
+        pdf.cell(200, 6, categoria.title(), ln=True)
+        pdf.set_line_width(0.8)
+        pdf.set_draw_color(*COLOR_DESTACADO)
+        y_linea = pdf.get_y() + 0.2
+        pdf.line(MARGEN_X, y_linea, MARGEN_X + ANCHO_UTIL, y_linea)
+        pdf.ln(2)
 
+        total_categoria = 0
+        with tabla.en(pdf):
             for item in items:
+                total_item = item.get("total", 0)
+                total_categoria += total_item
 
-                if pdf.get_y() > 270:
-                    pdf.add_page()
-                    pdf.set_font("helvetica", style='B', size=11)
-                    pdf.cell(75, 6, "Insumo", border='B')
-                    pdf.cell(25, 6, "Unidad", border='B', align='C')
-                    pdf.cell(20, 6, "Cantidad", border='B', align='C')
-                    pdf.cell(35, 6, "Precio Unitario", border='B', align='C')
-                    pdf.cell(35, 6, "Total", border='B', ln=True, align='C')
-
-                pdf.set_font("helvetica", size=11)
-
-                # 🟢 Caso 1: Trabajo simple
-                if item.get("es_trabajo_simple"):
-                    pdf.cell(155, 6, item.get("nombre_personalizado", "").title(), border=1)
-                    pdf.cell(35, 6, formato_moneda(item.get("total", 0)), border=1, ln=True, align="R")
-                    total_categoria += item.get("total", 0)
-                    continue
-
-                # 🟡 Caso 2: Mano de obra especial
-                if item.get("es_mano_obra"):
-                    pdf.cell(155, 6, item.get("nombre_personalizado", "").title(), border=1)
-                    pdf.cell(35, 6, formato_moneda(item.get("total", 0)), border=1, ln=True, align="R")
-                    total_categoria += item.get("total", 0)
+                # Trabajo simple y mano de obra: descripción + total
+                if item.get("es_trabajo_simple") or item.get("es_mano_obra"):
+                    tabla.fila_combinada(pdf, item.get("nombre_personalizado", "").title(), formato_moneda(total_item))
                     continue
 
-                # 🟠 Caso 3: Insumos regulares (ESTE ERA EL PROBLEMA)
-                # --- NUEVA LÓGICA PARA INSUMOS REGULARES ---
-                texto_insumo = item.get('nombre_personalizado', '').title()
-                if not texto_insumo:
-                    texto_insumo = item.get('nombre', '').title()  # Fallback por si no hay nombre_personalizado
-
-                # Posición inicial
-                x_inicial = pdf.get_x()
-                y_inicial = pdf.get_y()
-
-                ANCHO_INSUMO = 75
-                ALTO_LINEA = 6
-
-                # Calcular cuántas líneas necesitamos
-                lineas = pdf.multi_cell(ANCHO_INSUMO, ALTO_LINEA, texto_insumo, split_only=True)
-                num_lineas = len(lineas)
-                alto_necesario = max(ALTO_LINEA, num_lineas * ALTO_LINEA)
-
-                # Dibujar celda de insumo con el alto calculado
-                pdf.set_xy(x_inicial, y_inicial)
-                pdf.multi_cell(
-                    ANCHO_INSUMO,
-                    ALTO_LINEA,
+                texto_insumo = item.get('nombre_personalizado', '').title() or item.get('nombre', '').title()
+                tabla.fila(pdf, [
                     texto_insumo,
-                    border=1,
-                    align='L'
-                )
-
-                # Obtener la posición Y después del multi_cell
-                y_despues = pdf.get_y()
-                alto_real = y_despues - y_inicial
-
-                # Mover a la posición correcta para las otras celdas
-                pdf.set_xy(x_inicial + ANCHO_INSUMO, y_inicial)
-                
-                # Dibujar las otras celdas con el alto calculado
-                pdf.cell(25, alto_real, item.get('unidad', '').title(), border=1, align='C')
-                pdf.cell(20, alto_real, str(int(item.get('cantidad', 0))), border=1, align='C')
-                pdf.cell(35, alto_real, formato_moneda(item.get('precio_unitario', 0)), border=1, align='R')
-                pdf.cell(35, alto_real, formato_moneda(item.get('total', 0)), border=1, ln=True, align='R')
-
-                total_categoria += item.get("total", 0)
-
-            pdf.set_font("helvetica", style='B', size=11)
-            pdf.cell(155, 6, "Total", border=1, align='R')
-            pdf.cell(35, 6, formato_moneda(total_categoria), border=1, ln=True, align='R')
-            pdf.ln(5)
-            total_general += total_categoria
-
-        # Total general
-        if pdf.get_y() > 270:
-            pdf.add_page()
+                    item.get('unidad', '').title(),
+                    str(int(item.get('cantidad', 0))),
+                    formato_moneda(item.get('precio_unitario', 0)),
+                    formato_moneda(total_item),
+                ])
 
-        pdf.set_fill_color(194, 207, 165)
-        ANCHO_TOTAL = 40
-        ALTO_TOTAL = 15
-        margen_derecho = 10
-        x_inicial = pdf.w - ANCHO_TOTAL - margen_derecho
-        y_inicial = pdf.get_y()
+            tabla.fila_combinada(pdf, "Total", formato_moneda(total_categoria), estilo='B', align='R')
+        pdf.ln(5)
+        total_general += total_categoria
 
-        pdf.rect(x_inicial, y_inicial, ANCHO_TOTAL, ALTO_TOTAL, style='F')
+    _dibujar_total(pdf, espec, total_general)
 
-        pdf.set_xy(x_inicial + 4, y_inicial + 2)
-        pdf.set_font("helvetica", style='B', size=11)
-        pdf.cell(0, 5, "Total", border=0)
 
-        pdf.set_font("helvetica", style='B', size=14)
-        pdf.set_xy(x_inicial, y_inicial + 6)
-        pdf.cell(ANCHO_TOTAL, 8, formato_moneda(total_general), border=0, align='C')
+def generar_pdf(cliente_nombre: str, categorias: Dict[str, Any], lugar_cliente: str, descripcion: Optional[str] = None,
+                fecha: Any = None) -> str:
+    """
+    Genera un archivo PDF con los datos del presupuesto.
+    'fecha' (fecha_creacion guardada) fija la fecha impresa; sin ella se usa hoy.
+    """
+    try:
+        fecha = fecha_documento(fecha)
+        pdf = DocumentoPDF(fecha=fecha)
+        _dibujar_presupuesto(pdf, cliente_nombre, categorias, lugar_cliente, descripcion, fecha=fecha)
 
         # Guardar archivo
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
         temp_path = temp_file.name
+        temp_file.write(pdf.a_bytes(f"Presupuesto_{lugar_cliente}"))
         temp_file.close()
-        pdf.output(temp_path)
-        
+
         return temp_path
-        
+
     except Exception as e:
         raise Exception(f"Error al generar PDF: {str(e)}")
     
+
+def categorias_desde_items(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agrupa los ítems de get_presupuesto_detallado en el dict de categorías que usa generar_pdf."""
+    categorias = {}
+
+    for item in items:
+        cat_nombre = item.get('categoria') or 'Sin categoría'
+
+        if cat_nombre not in categorias:
+            categorias[cat_nombre] = {
+                'items': [],
+                'mano_obra': 0
+            }
+
+        if item.get('nombre') == 'Mano de Obra':
+            categorias[cat_nombre]['mano_obra'] = item.get('precio_unitario', 0)
+
+        else:
+            categorias[cat_nombre]['items'].append({
+                'nombre': item.get('nombre', 'Sin nombre'),
+                'unidad': item.get('unidad', 'Unidad'),
+                'cantidad': item.get('cantidad', 1),
+                'precio_unitario': item.get('precio_unitario', 0),
+                'total': item.get('total', 0),
+                'descripcion': item.get('notas', '')
+            })
+
+    return categorias
+
 def mostrar_boton_descarga_pdf(presupuesto_id: int, label: str = "📄 Descargar PDF", key: str = None) -> bool:
     """
     Genera un PDF y muestra automáticamente el botón de descarga.
@@ -332,35 +559,14 @@ def mostrar_boton_descarga_pdf(presupuesto_id: int, label: str = "📄 Descargar
             st.error("No se encontró el presupuesto")
             return False
 
-        categorias = {}
-
-        for item in presupuesto.get('items', []):
-            cat_nombre = item.get('categoria') or 'Sin categoría'
-
-            if cat_nombre not in categorias:
-                categorias[cat_nombre] = {
-                    'items': [],
-                    'mano_obra': 0
-                }
-
-            if item.get('nombre') == 'Mano de Obra':
-                categorias[cat_nombre]['mano_obra'] = item.get('precio_unitario', 0)
-
-            else:
-                categorias[cat_nombre]['items'].append({
-                    'nombre': item.get('nombre', 'Sin nombre'),
-                    'unidad': item.get('unidad', 'Unidad'),
-                    'cantidad': item.get('cantidad', 1),
-                    'precio_unitario': item.get('precio_unitario', 0),
-                    'total': item.get('total', 0),
-                    'descripcion': item.get('notas', '')
-                })
+        categorias = categorias_desde_items(presupuesto.get('items', []))
 
         pdf_path = generar_pdf(
             presupuesto['cliente']['nombre'],
             categorias,
             presupuesto['lugar']['nombre'],
             descripcion=presupuesto.get('descripcion', ''),
+            fecha=presupuesto.get('fecha_creacion'),
         )
 
         with open(pdf_path, "rb") as f:
@@ -388,7 +594,37 @@ def mostrar_boton_descarga_pdf(presupuesto_id: int, label: str = "📄 Descargar
     except Exception as e:
         st.error(f"Error al generar PDF: {str(e)}")
         return False
-    
+
+
+def _dibujar_estado_cuenta(pdf: DocumentoPDF, cliente_nombre: str, lugar_nombre: str, items: list,
+                           abono: float, total: float, datos_emisor: Optional[Dict[str, str]],
+                           nueva_pagina: bool = True, seccion: Optional[str] = None,
+                           fecha: Optional[datetime] = None) -> None:
+    """Dibuja un estado de cuenta completo a partir de la página actual del documento."""
+    espec = ESPEC_ESTADO_CUENTA
+    _iniciar_documento(
+        pdf, espec, _datos_emisor(datos_emisor), lugar_nombre, cliente_nombre,
+        "Resumen de Servicios y Cobros Pendientes", nueva_pagina, seccion, fecha
+    )
+    tabla = Tabla(espec.columnas, espec.limite_y)
+
+    # Conceptos agregados (meses y servicios extras) y abonos si existen
+    with tabla.en(pdf):
+        for item in items:
+            tabla.fila(pdf, [
+                item.get('descripcion', '').strip(),
+                formato_moneda(item.get('monto', 0)),
+            ])
+
+        if abono > 0:
+            pdf.set_text_color(150, 0, 0)  # Texto rojo sutil para descuento
+            tabla.fila_combinada(pdf, " Abonos / Pagos Recibidos (Descuento)", f"-{formato_moneda(abono)} ", estilo='I')
+            pdf.set_text_color(*COLOR_TEXTO)
+
+    pdf.ln(5)
+    _dibujar_total(pdf, espec, total)
+
+
 def generar_pdf_estado_cuenta(
     id_documento: int, 
     cliente_nombre: str, 
@@ -396,222 +632,260 @@ def generar_pdf_estado_cuenta(
     items: list, 
     abono: float, 
     total: float,
-    datos_emisor: Dict[str, str]  # <-- NUEVO PARÁMETRO AL FINAL
+    datos_emisor: Optional[Dict[str, str]] = None,
+    fecha: Any = None
 ) -> Tuple[bytes, str]:
     """
-    Genera el PDF del Estado de Cuenta mapeando dinámicamente los datos del emisor
-    a las constantes originales para no romper el diseño interno.
+    Genera el PDF del Estado de Cuenta con los datos del emisor recibidos
+    (sin datos_emisor se usan los de la empresa). 'fecha' es la fecha_emision.
     """
-    # Mapeo dinámico: reusamos los nombres exactos que ya usas en tu código
-    EMPRESA = datos_emisor.get("empresa", "Mi Empresa")
-    CONTACTO_NOMBRE = datos_emisor.get("nombre", "Contacto")
-    CONTACTO_TELEFONO = datos_emisor.get("telefono", "")
-    CONTACTO_EMAIL = datos_emisor.get("email", "")
-    
-    import tempfile
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("helvetica", size=11)
-        
-        # Configurar márgenes idénticos
-        pdf.set_margins(left=10, top=10, right=10)
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        # Encabezado - Franja de fondo verde corporativo
-        y_inicio_fondo = pdf.get_y()
-        pdf.set_xy(0, y_inicio_fondo)
-        pdf.set_fill_color(175, 192, 138)
-        ALTO_FRANJA = 26
-        MARGEN_X = 10
-        pdf.cell(pdf.w, ALTO_FRANJA, "", border=0, ln=1, fill=True)
-
-        # Texto sobre la franja
-        pdf.set_text_color(36, 36, 36)
-
-        # a) "Estado de Cuenta" en lugar de Presupuesto
-        pdf.set_y(y_inicio_fondo + 5)
-        pdf.set_x(MARGEN_X)
-        pdf.set_font("helvetica", style='B', size=22)
-        pdf.cell(100, 10, "Estado de Cuenta N°", border=0, ln=0, align='L', fill=False)
-
-        # b) Nombre de la Empresa
-        pdf.set_x(MARGEN_X)
-        pdf.set_font("helvetica", style='', size=16)
-        pdf.cell(102, 26, EMPRESA.title(), border=0, ln=0, align='L', fill=False)
-
-        # c) Línea negra debajo del nombre de la empresa
-        y_linea = pdf.get_y() + 17
-        pdf.set_draw_color(56, 56, 56)
-        pdf.set_line_width(0.8)
-        pdf.line(MARGEN_X, y_linea, MARGEN_X + 85, y_linea)
-
-        # d) Línea verde debajo de la franja
-        y_linea = pdf.get_y() + 23 
-        pdf.set_draw_color(175, 192, 138)
-        pdf.set_line_width(0.8)
-        pdf.line(0, y_linea, pdf.w, y_linea)
-
-        # e) Lugar del cliente en el extremo derecho
-        pdf.set_font("helvetica", style='B', size=20)
-        pdf.set_y(y_inicio_fondo + (ALTO_FRANJA / 2) - 6)
-
-        ANCHO_UTIL_PAGINA = 190 
-        MARGEN_DERECHO = 10 
-        ANCHO_MULTICELL = 90
-        POSICION_X_INICIO = ANCHO_UTIL_PAGINA - ANCHO_MULTICELL + MARGEN_DERECHO
-
-        pdf.set_x(POSICION_X_INICIO) 
-        pdf.multi_cell(
-            w=ANCHO_MULTICELL, 
-            h=7,
-            txt=lugar_nombre.title(), 
-            border=0, 
-            align='C', 
-            fill=False
-        )
-
-        pdf.ln(15) 
-
-        # Fecha y datos de contacto
-        fecha_actual = datetime.now().strftime("%d %B, %Y")
-        pdf.ln(2)
-        pdf.set_font("helvetica", size=12)
-
-        # --- Columna izquierda: datos de contacto ---
-        x_inicio = pdf.get_x()
-        y_inicio = pdf.get_y()
-
-        pdf.cell(95, 5, CONTACTO_NOMBRE, border=0, ln=True)
-        pdf.cell(95, 5, CONTACTO_TELEFONO, border=0, ln=True)
-        pdf.cell(95, 5, CONTACTO_EMAIL, border=0, ln=True)
-
-        y_fin_contacto = pdf.get_y()
+        fecha = fecha_documento(fecha)
+        pdf = DocumentoPDF(fecha=fecha)
+        _dibujar_estado_cuenta(pdf, cliente_nombre, lugar_nombre, items, abono, total, datos_emisor, fecha=fecha)
 
-        # Línea vertical divisoria
-        pdf.set_draw_color(56, 56, 56)
-        pdf.set_line_width(0.6)
-        x_linea = x_inicio + 80
-        pdf.line(x_linea, y_inicio, x_linea, y_fin_contacto)
-
-        # --- Columna derecha: Cliente y fecha ---
-        pdf.set_xy(x_linea + 5, y_inicio)
-
-        pdf.set_font("helvetica", style='B', size=10)
-        pdf.cell(40, 5, "Cliente:", border=0)
-
-        pdf.set_font("helvetica", size=12)
-        pdf.cell(0, 5, fecha_actual, border=0, ln=True, align='R')
+        lugar_slug = lugar_nombre.replace(" ", "_").strip()
+        file_name = f"Estado_Cuenta_{lugar_slug}.pdf"
+        pdf_bytes = pdf.a_bytes(file_name)
+        
+        return pdf_bytes, file_name
 
-        pdf.set_x(x_linea + 5)
-        pdf.set_font("helvetica", size=12)
-        pdf.cell(0, 6, cliente_nombre.title(), border=0, ln=True)
+    except Exception as e:
+        raise Exception(f"Error en la maquetación del PDF: {str(e)}")
+
+
+
+
+# ========== COLA DE RENDERIZADO ==========
+# Los PDFs de presupuestos recién guardados se dibujan en segundo plano: la
+# página recibe un id de trabajo al instante y consulta su estado. El pool
+# es compartido por todas las sesiones y su tamaño limita cuántos PDFs se
+# dibujan a la vez, así una ráfaga de guardados no acapara la CPU.
+
+MAX_RENDER_CONCURRENTES = 2
+MAX_TRABAJOS_GUARDADOS = 200  # resultados terminados retenidos hasta que se descartan
+
+PENDIENTE, LISTO, ERROR, DESCONOCIDO = "pendiente", "listo", "error", "desconocido"
+
+
+class ColaRender:
+    """Pool de hilos acotado con trabajos identificados por id."""
+
+    def __init__(self, max_concurrentes: int = MAX_RENDER_CONCURRENTES):
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix="render_pdf")
+        self._trabajos: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enviar(self, funcion: Callable[..., Any], *args, **kwargs) -> str:
+        trabajo_id = uuid.uuid4().hex
+        futuro = self._pool.submit(funcion, *args, **kwargs)
+        with self._lock:
+            self._trabajos[trabajo_id] = futuro
+            # Solo se olvidan resultados terminados, del más antiguo al más nuevo:
+            # un trabajo pendiente puede ser de otra sesión que aún lo espera
+            sobrantes = len(self._trabajos) - MAX_TRABAJOS_GUARDADOS
+            if sobrantes > 0:
+                terminados = [tid for tid, f in self._trabajos.items() if f.done()]
+                for tid in terminados[:sobrantes]:
+                    del self._trabajos[tid]
+        return trabajo_id
+
+    def estado(self, trabajo_id: str) -> Tuple[str, Any]:
+        """(estado, resultado): el resultado es el valor devuelto o el mensaje de error."""
+        with self._lock:
+            futuro = self._trabajos.get(trabajo_id)
+        if futuro is None:
+            return DESCONOCIDO, None
+        if not futuro.done():
+            return PENDIENTE, None
+        if futuro.cancelled():
+            return ERROR, "Trabajo cancelado"
+        error = futuro.exception()
+        if error is not None:
+            return ERROR, str(error)
+        return LISTO, futuro.result()
+
+    def descartar(self, trabajo_id: str) -> None:
+        with self._lock:
+            futuro = self._trabajos.pop(trabajo_id, None)
+        if futuro is not None:
+            futuro.cancel()
+
+
+@st.cache_resource
+def get_cola_render() -> ColaRender:
+    """Cola única para todo el servidor."""
+    return ColaRender()
+
+
+def _render_presupuesto(cliente_nombre: str, categorias: Dict[str, Any], lugar_cliente: str,
+                        descripcion: Optional[str], file_name: str, fecha: Optional[datetime]) -> bytes:
+    pdf = DocumentoPDF(fecha=fecha)
+    _dibujar_presupuesto(pdf, cliente_nombre, categorias, lugar_cliente, descripcion, fecha=fecha)
+    return pdf.a_bytes(file_name)
+
+
+def encolar_pdf_presupuesto(cliente_nombre: str, categorias: Dict[str, Any], lugar_cliente: str,
+                            descripcion: Optional[str], file_name: str, fecha: Any = None) -> str:
+    """Encola el PDF de un presupuesto y devuelve el id del trabajo (el resultado son bytes)."""
+    # Copia plana: la sesión puede seguir editando sus categorías mientras se dibuja
+    return get_cola_render().enviar(
+        _render_presupuesto, cliente_nombre, categorias_a_dict(categorias), lugar_cliente, descripcion, file_name,
+        fecha_documento(fecha or date.today())
+    )
+
+# ========== ESTADOS DE CUENTA GUARDADOS ==========
+@st.cache_data(ttl=3600, max_entries=100, show_spinner=False)
+def _pdf_estado_cuenta(estado_id: int, version: str, _estado: Dict[str, Any]) -> Tuple[bytes, str]:
+    """Bytes del PDF por (id, huella de los datos): solo se vuelve a dibujar si el estado cambió."""
+    return generar_pdf_estado_cuenta(
+        id_documento=estado_id,
+        cliente_nombre=(_estado.get('cliente') or {}).get('nombre', 'N/A'),
+        lugar_nombre=(_estado.get('lugar_trabajo') or {}).get('nombre', 'N/A'),
+        items=_estado.get('detalles_estado_cuenta') or [],
+        abono=_estado.get('abono_monto') or 0,
+        total=_estado.get('total_neto') or 0,
+        fecha=_estado.get('fecha_emision'),
+    )
+
+
+def _version_estado_cuenta(estado: Dict[str, Any]) -> str:
+    """sha256 de los datos que dibuja el PDF (JSON con claves ordenadas)."""
+    datos = {campo: estado.get(campo) for campo in (
+        'fecha_emision', 'abono_monto', 'total_neto', 'cliente', 'lugar_trabajo', 'detalles_estado_cuenta'
+    )}
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def pdf_estado_cuenta(estado_id: int) -> Tuple[Optional[bytes], str, bool]:
+    """
+    Regenera el PDF de un estado de cuenta guardado (no muestra ningún botón).
+    Retorna (pdf_bytes, file_name, ok).
+    """
+    try:
+        estado = get_estado_cuenta_detallado(estado_id)
+        if not estado:
+            return None, "", False
 
-        # Franja 2 Informativa central
-        y_inicio_fondo = pdf.get_y()
-        MARGEN_X_FRANJA = 10
-        ALTO = 7
+        pdf_bytes, file_name = _pdf_estado_cuenta(estado_id, _version_estado_cuenta(estado), estado)
+        return pdf_bytes, file_name, True
 
-        pdf.set_xy(MARGEN_X_FRANJA, y_inicio_fondo + 10)
-        pdf.set_fill_color(175, 192, 138)
-        pdf.cell(pdf.w - 2 * MARGEN_X_FRANJA, ALTO, "", border=0, ln=1, fill=True)
+    except Exception as e:
+        print(f"Error al regenerar PDF del estado de cuenta {estado_id}: {e}")
+        return None, "", False
 
-        pdf.set_text_color(36, 36, 36)
-        pdf.set_font("helvetica", style='B', size=12)
+# ========== DOSSIER POR CLIENTE / LUGAR ==========
+# Todos los presupuestos y estados de cuenta de un cliente o lugar en un solo
+# PDF con índice. Cada documento se dibuja directamente en el mismo FPDF a
+# medida que llega de la base de datos: no se generan PDFs intermedios ni se
+# mezclan bytes, y los datos de cada documento se descartan al dibujarlo.
 
-        pdf.set_y(y_inicio_fondo + (ALTO / 2) + 7) 
-        pdf.set_x(MARGEN_X_FRANJA + 5)
-        pdf.cell(0, 6, "Resumen de Servicios y Cobros Pendientes", border=0, ln=1, align='C')
+ENTRADAS_INDICE_POR_PAGINA = 30
 
-        pdf.ln(5)
 
-        # --- TABLA DE DETALLES (Mismos anchos e indices que el presupuesto) ---
-        pdf.set_font("helvetica", style='B', size=11)
-        pdf.set_draw_color(56, 56, 56)
-        pdf.set_line_width(0.3)
-        
-        pdf.cell(140, 6, "Descripción del Servicio / Período", border='B')
-        pdf.cell(50, 6, "Total", border='B', ln=True, align='R')
+def _titulo_seccion(texto: str, largo: int = 80) -> str:
+    return texto if len(texto) <= largo else texto[:largo - 3] + "..."
 
-        # Listar todos los conceptos agregados (Meses y Servicios extras)
-        pdf.set_font("helvetica", size=11)
-        total_cargos = 0
-        
-        for item in items:
-            if pdf.get_y() > 260:
-                pdf.add_page()
-                pdf.set_font("helvetica", style='B', size=11)
-                pdf.cell(140, 6, "Descripción del Servicio / Período", border='B')
-                pdf.cell(50, 6, "Total", border='B', ln=True, align='R')
-
-            pdf.set_font("helvetica", size=11)
-            texto_detalle = item.get('descripcion', '').strip()
-            
-            # Lógica multilínea para que se adapte si colocas una descripción larga
-            x_inicial = pdf.get_x()
-            y_inicial = pdf.get_y()
-            ANCHO_DESC = 140
-            ALTO_LINEA = 6
-            
-            lineas = pdf.multi_cell(ANCHO_DESC, ALTO_LINEA, texto_detalle, split_only=True)
-            alto_real = max(ALTO_LINEA, len(lineas) * ALTO_LINEA)
-            
-            pdf.set_xy(x_inicial, y_inicial)
-            pdf.multi_cell(ANCHO_DESC, ALTO_LINEA, texto_detalle, border=1, align='L')
-            
-            pdf.set_xy(x_inicial + ANCHO_DESC, y_inicial)
-            pdf.cell(50, alto_real, formato_moneda(item.get('monto', 0)), border=1, ln=True, align='R')
-            
-            total_cargos += item.get('monto', 0)
-
-        # Fila adicional para reflejar Abonos si es que existen
-        if abono > 0:
-            if pdf.get_y() > 260:
-                pdf.add_page()
-            pdf.set_font("helvetica", style='I', size=11)
-            pdf.set_text_color(150, 0, 0) # Texto rojo sutil para descuento
-            pdf.cell(140, 6, " Abonos / Pagos Recibidos (Descuento)", border=1, align='L')
-            pdf.cell(50, 6, f"-{formato_moneda(abono)} ", border=1, ln=True, align='R')
-            pdf.set_text_color(36, 36, 36)
 
-        pdf.ln(5)
+def _dibujar_indice(pdf: DocumentoPDF, secciones: list, paginas: int) -> None:
+    """Índice con enlaces; ocupa exactamente las páginas reservadas."""
+    pagina_final = pdf.page + paginas - 1
+    pdf.set_text_color(*COLOR_TEXTO)
+    pdf.set_font(FUENTE, style='B', size=16)
+    pdf.cell(0, 10, "Índice", ln=True)
+    pdf.ln(2)
+    pdf.set_font(FUENTE, size=11)
 
-        # --- CUADRO DE TOTAL FINAL GENERAL ---
-        if pdf.get_y() > 260:
+    for i, seccion in enumerate(secciones[:paginas * ENTRADAS_INDICE_POR_PAGINA]):
+        if i and i % ENTRADAS_INDICE_POR_PAGINA == 0:
             pdf.add_page()
+        enlace = pdf.add_link()
+        pdf.set_link(enlace, page=seccion.page_number)
+        pdf.cell(ANCHO_UTIL - 20, 7, seccion.name, link=enlace)
+        pdf.cell(20, 7, str(seccion.page_number), ln=True, align='R', link=enlace)
 
-        pdf.set_fill_color(194, 207, 165)
-        ANCHO_TOTAL = 55
-        ALTO_TOTAL = 15
-        x_inicial_total = pdf.w - ANCHO_TOTAL - 10
-        y_inicial_total = pdf.get_y()
+    while pdf.page < pagina_final:
+        pdf.add_page()
 
-        pdf.rect(x_inicial_total, y_inicial_total, ANCHO_TOTAL, ALTO_TOTAL, style='F')
 
-        pdf.set_xy(x_inicial_total + 4, y_inicial_total + 2)
-        pdf.set_font("helvetica", style='B', size=10)
-        pdf.cell(0, 5, "Total Pendiente", border=0)
+def generar_dossier_pdf(campo: str, entidad_id: int, nombre: str, user_id: str) -> Tuple[bytes, str]:
+    """
+    PDF con todos los presupuestos y estados de cuenta de un cliente
+    (campo='cliente_id') o lugar (campo='lugar_trabajo_id').
+    """
+    if campo not in CAMPOS_DOSSIER:
+        raise ValueError(f"Campo de dossier no válido: {campo}")
+
+    n_presupuestos, n_estados = contar_documentos_dossier(campo, entidad_id, user_id)
+    if not n_presupuestos and not n_estados:
+        raise Exception("No hay presupuestos ni estados de cuenta para generar el dossier.")
+
+    pdf = DocumentoPDF()
+    pdf.add_page()
+
+    # Portada + índice (se completa al final, cuando se conocen las páginas)
+    pdf.set_text_color(*COLOR_TEXTO)
+    pdf.set_font(FUENTE, style='B', size=22)
+    pdf.cell(0, 12, _titulo_seccion(f"Dossier {nombre.title()}", 40), ln=True)
+    pdf.set_font(FUENTE, size=12)
+    pdf.cell(0, 6, f"{n_presupuestos} presupuestos - {n_estados} estados de cuenta", ln=True)
+    pdf.ln(4)
+    paginas_indice = max(1, -(-(n_presupuestos + n_estados) // ENTRADAS_INDICE_POR_PAGINA))
+    pdf.insert_toc_placeholder(
+        lambda documento, secciones: _dibujar_indice(documento, secciones, paginas_indice),
+        pages=paginas_indice
+    )
+
+    # La página en blanco que deja el índice la usa el primer documento
+    nueva_pagina = False
+
+    for p in iter_presupuestos_detallados(campo, entidad_id, user_id):
+        fecha = (p.get('fecha_creacion') or '')[:10]
+        _dibujar_presupuesto(
+            pdf,
+            (p.get('cliente') or {}).get('nombre', 'N/A'),
+            categorias_desde_items(p['items']),
+            (p.get('lugar') or {}).get('nombre', 'N/A'),
+            descripcion=p.get('descripcion', ''),
+            nueva_pagina=nueva_pagina,
+            seccion=_titulo_seccion(f"Presupuesto N°{p['id']} - {fecha} - {p.get('descripcion') or 'Sin descripción'}"),
+            fecha=fecha_documento(fecha),
+        )
+        nueva_pagina = True
+
+    for ec in iter_estados_cuenta_detallados(campo, entidad_id, user_id):
+        fecha = (ec.get('fecha_emision') or '')[:10]
+        _dibujar_estado_cuenta(
+            pdf,
+            (ec.get('cliente') or {}).get('nombre', 'N/A'),
+            (ec.get('lugar_trabajo') or {}).get('nombre', 'N/A'),
+            ec.get('detalles_estado_cuenta') or [],
+            ec.get('abono_monto') or 0,
+            ec.get('total_neto') or 0,
+            None,
+            nueva_pagina=nueva_pagina,
+            seccion=_titulo_seccion(f"Estado de Cuenta N°{ec['id']} - {fecha}"),
+            fecha=fecha_documento(fecha),
+        )
+        nueva_pagina = True
 
-        pdf.set_font("helvetica", style='B', size=13)
-        pdf.set_xy(x_inicial_total, y_inicial_total + 7)
-        pdf.cell(ANCHO_TOTAL, 8, formato_moneda(total), border=0, align='C')
+    file_name = f"Dossier_{nombre.strip().replace(' ', '_')}.pdf"
+    return pdf.a_bytes(file_name), file_name
 
-        # Guardar en archivo temporal para retornar bytes
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            pdf.output(tmp.name)
-            with open(tmp.name, "rb") as f:
-                pdf_bytes = f.read()
-                
-        try:
-            import os
-            os.unlink(tmp.name)
-        except:
-            pass
-            
-        lugar_slug = lugar_nombre.replace(" ", "_").strip()
-        file_name = f"Estado_Cuenta_{lugar_slug}.pdf"
-        
-        return pdf_bytes, file_name
 
-    except Exception as e:
-        raise Exception(f"Error en la maquetación del PDF: {str(e)}")
\ No newline at end of file
+def mostrar_boton_dossier(campo: str, entidad_id: int, nombre: str, user_id: str, key: str) -> None:
+    """Botón que genera el dossier bajo demanda y muestra la descarga."""
+    if st.button("📚 Dossier PDF", key=key, width='stretch'):
+        try:
+            with st.spinner("Generando dossier..."):
+                pdf_bytes, file_name = generar_dossier_pdf(campo, entidad_id, nombre, user_id)
+            st.download_button(
+                label="⬇️ Descargar dossier",
+                data=pdf_bytes,
+                file_name=file_name,
+                mime="application/pdf",
+                width='stretch',
+                key=f"{key}_descarga"
+            )
+        except Exception as e:
+            st.error(f"Error al generar dossier: {str(e)}")